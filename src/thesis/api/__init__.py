@@ -1,3 +1,3 @@
-from . import osc, event_store
+from . import osc, event_log, event_store, gpkg, dependency_index, process
 
-__all__ = ("osc", "event_store")
+__all__ = ("osc", "event_log", "event_store", "gpkg", "dependency_index", "process")
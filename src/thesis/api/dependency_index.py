@@ -0,0 +1,307 @@
+"""Reverse index from OSM nodes and members to the ways and relations using them.
+
+A node that moves changes the geometry of every way that references it, and
+a changed way changes every relation it is a member of. The OSMChange file
+only lists the node. The dependency index records which ways reference
+which nodes and which relations have which members, so that the ways and
+relations affected by a change file can be found without comparing every
+line and polygon.
+
+The index is an SQLite database. It is built from an OSM file with
+`build`, which reads the ways and relations as OPL from `osmium cat`, and
+kept up to date with `DependencyIndex.apply_changes`.
+"""
+import logging
+import shutil
+import sqlite3
+import subprocess
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+from thesis import tuning
+from thesis.api import osc
+from thesis.osm import ChangedElements, ChangeType, ElementID, ElementType
+
+_logger = logging.getLogger(__name__)
+
+# Stay below SQLITE_MAX_VARIABLE_NUMBER of older SQLite versions
+_MAX_PARAMS = 500
+_BATCH_SIZE = 65536
+
+_MEMBER_TYPES = {"n": ElementType.NODE, "w": ElementType.WAY, "r": ElementType.RELATION}
+
+Member = tuple[ElementType, ElementID]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS way_nodes (
+    way_id INTEGER NOT NULL,
+    node_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS relation_members (
+    relation_id INTEGER NOT NULL,
+    member_type INTEGER NOT NULL,
+    member_id INTEGER NOT NULL
+);
+"""
+
+_INDEXES = """
+CREATE INDEX IF NOT EXISTS way_nodes_node ON way_nodes (node_id);
+CREATE INDEX IF NOT EXISTS way_nodes_way ON way_nodes (way_id);
+CREATE INDEX IF NOT EXISTS relation_members_member
+    ON relation_members (member_type, member_id);
+CREATE INDEX IF NOT EXISTS relation_members_relation
+    ON relation_members (relation_id);
+"""
+
+
+def _chunks(ids: Iterable[ElementID]) -> Iterator[list[ElementID]]:
+    ids = sorted(set(ids))
+    for start in range(0, len(ids), _MAX_PARAMS):
+        yield ids[start : start + _MAX_PARAMS]
+
+
+def parse_opl_line(line: str) -> tuple[str, ElementID, list[ElementID] | list[Member]]:
+    """Parse the id and the node references or members of an OPL line.
+
+    Returns ("w", way id, node ids) for ways and ("r", relation id, members)
+    for relations. Nodes are returned with an empty list.
+    """
+    fields = line.rstrip("\n").split(" ")
+    kind = fields[0][0]
+    element_id = int(fields[0][1:])
+    refs: list = []
+    for field in fields[1:]:
+        if kind == "w" and field.startswith("N"):
+            refs = [int(ref[1:]) for ref in field[1:].split(",") if ref]
+        elif kind == "r" and field.startswith("M"):
+            for member in field[1:].split(","):
+                if not member:
+                    continue
+                # Roles are escaped in OPL, so the first '@' ends the reference
+                ref = member.split("@", 1)[0]
+                refs.append((_MEMBER_TYPES[ref[0]], int(ref[1:])))
+    return kind, element_id, refs
+
+
+def read_opl(osm_file_path: Path) -> Iterator[tuple[str, ElementID, list]]:
+    """Stream the ways and relations of an OSM file through `osmium cat`.
+
+    Requires `osmium` to be in $PATH.
+    """
+    osmium_cmd = shutil.which("osmium")
+    if osmium_cmd is None:
+        raise RuntimeError("osmium not found in path")
+    command = [
+        osmium_cmd,
+        "cat",
+        "--no-progress",
+        "-f",
+        "opl",
+        "-t",
+        "way",
+        "-t",
+        "relation",
+        str(osm_file_path),
+    ]
+    _logger.debug(f"Reading ways and relations with: `{' '.join(command)}`")
+    with subprocess.Popen(
+        command, stdout=subprocess.PIPE, text=True, env=tuning.environment()
+    ) as proc:
+        assert proc.stdout is not None
+        for line in proc.stdout:
+            yield parse_opl_line(line)
+    if proc.returncode != 0:
+        raise RuntimeError(f"osmium cat failed with return code {proc.returncode}.")
+
+
+class DependencyIndex:
+    """Ways by node and relations by member, stored in an SQLite database."""
+
+    def __init__(self, path: Path):
+        self._path = path
+        # The index may be updated in a background thread, but it is only
+        # used by one thread at a time
+        self._con = sqlite3.connect(path, check_same_thread=False)
+        tuning.apply_pragmas(self._con)
+        self._con.executescript(_SCHEMA)
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    def close(self):
+        self._con.close()
+
+    def __enter__(self) -> "DependencyIndex":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def load(self, elements: Iterable[tuple[str, ElementID, list]]):
+        """Bulk load ways and relations as returned by `read_opl`.
+
+        The lookup indexes are created after loading, which is much faster
+        than maintaining them row by row.
+        """
+        way_rows: list[tuple[int, int]] = []
+        member_rows: list[tuple[int, int, int]] = []
+        with self._con:
+            for kind, element_id, refs in elements:
+                if kind == "w":
+                    way_rows.extend((element_id, node_id) for node_id in refs)
+                elif kind == "r":
+                    member_rows.extend(
+                        (element_id, etype.value, member_id)
+                        for etype, member_id in refs
+                    )
+                if len(way_rows) + len(member_rows) >= _BATCH_SIZE:
+                    self._insert(way_rows, member_rows)
+                    way_rows, member_rows = [], []
+            self._insert(way_rows, member_rows)
+            self._con.executescript(_INDEXES)
+
+    def _insert(self, way_rows, member_rows):
+        self._con.executemany("INSERT INTO way_nodes VALUES (?, ?)", way_rows)
+        self._con.executemany(
+            "INSERT INTO relation_members VALUES (?, ?, ?)", member_rows
+        )
+
+    def ways_of_nodes(self, node_ids: Iterable[ElementID]) -> set[ElementID]:
+        ways: set[ElementID] = set()
+        for chunk in _chunks(node_ids):
+            placeholders = ", ".join("?" * len(chunk))
+            ways.update(
+                row[0]
+                for row in self._con.execute(
+                    "SELECT way_id FROM way_nodes "
+                    f"WHERE node_id IN ({placeholders})",
+                    chunk,
+                )
+            )
+        return ways
+
+    def relations_of(
+        self, etype: ElementType, member_ids: Iterable[ElementID]
+    ) -> set[ElementID]:
+        relations: set[ElementID] = set()
+        for chunk in _chunks(member_ids):
+            placeholders = ", ".join("?" * len(chunk))
+            relations.update(
+                row[0]
+                for row in self._con.execute(
+                    "SELECT relation_id FROM relation_members "
+                    f"WHERE member_type = ? AND member_id IN ({placeholders})",
+                    [etype.value, *chunk],
+                )
+            )
+        return relations
+
+    def members_of(
+        self, relation_ids: Iterable[ElementID], etype: ElementType
+    ) -> set[ElementID]:
+        members: set[ElementID] = set()
+        for chunk in _chunks(relation_ids):
+            placeholders = ", ".join("?" * len(chunk))
+            members.update(
+                row[0]
+                for row in self._con.execute(
+                    "SELECT member_id FROM relation_members "
+                    f"WHERE member_type = ? AND relation_id IN ({placeholders})",
+                    [etype.value, *chunk],
+                )
+            )
+        return members
+
+    def affected(
+        self,
+        nodes: Iterable[ElementID],
+        ways: Iterable[ElementID],
+        relations: Iterable[ElementID],
+    ) -> ChangedElements:
+        """Close a set of changed elements over the elements that use them.
+
+        Ways are affected by their nodes. Relations are affected by their
+        member nodes and ways, and by member relations, transitively.
+        """
+        nodes = set(nodes)
+        ways = set(ways) | self.ways_of_nodes(nodes)
+        relations = (
+            set(relations)
+            | self.relations_of(ElementType.NODE, nodes)
+            | self.relations_of(ElementType.WAY, ways)
+        )
+        new = relations
+        while new:
+            new = self.relations_of(ElementType.RELATION, new) - relations
+            relations |= new
+        return ChangedElements(nodes=nodes, ways=ways, relations=relations)
+
+    def changed_elements(self, osc_file_path: Path) -> ChangedElements:
+        """The elements affected by the changes in an OSMChange file.
+
+        Call this before `apply_changes` with the same file. Elements that
+        start to use a changed element in the file are listed in the file
+        themselves.
+
+        The member ways of changed relations, before and after the change,
+        count as changed too. Whether a closed way is a polygon of its own
+        can depend on the multipolygon relations it is a member of.
+        """
+        nodes: set[ElementID] = set()
+        ways: set[ElementID] = set()
+        relations: set[ElementID] = set()
+        for change in osc.changes(osc_file_path):
+            element = change.element
+            match element.etype:
+                case ElementType.NODE:
+                    nodes.add(element.id)
+                case ElementType.WAY:
+                    ways.add(element.id)
+                case ElementType.RELATION:
+                    relations.add(element.id)
+                    ways.update(
+                        member.id
+                        for member in change.members
+                        if member.etype == ElementType.WAY
+                    )
+        ways |= self.members_of(relations, ElementType.WAY)
+        return self.affected(nodes, ways, relations)
+
+    def apply_changes(self, osc_file_path: Path):
+        """Update the index with the ways and relations of an OSMChange file."""
+        with self._con:
+            for change in osc.changes(osc_file_path):
+                element = change.element
+                deleted = change.change_type == ChangeType.DELETE
+                if element.etype == ElementType.WAY:
+                    self._con.execute(
+                        "DELETE FROM way_nodes WHERE way_id = ?", (element.id,)
+                    )
+                    if not deleted:
+                        self._con.executemany(
+                            "INSERT INTO way_nodes VALUES (?, ?)",
+                            [(element.id, node_id) for node_id in change.node_refs],
+                        )
+                elif element.etype == ElementType.RELATION:
+                    self._con.execute(
+                        "DELETE FROM relation_members WHERE relation_id = ?",
+                        (element.id,),
+                    )
+                    if not deleted:
+                        self._con.executemany(
+                            "INSERT INTO relation_members VALUES (?, ?, ?)",
+                            [
+                                (element.id, member.etype.value, member.id)
+                                for member in change.members
+                            ],
+                        )
+
+
+def build(path: Path, osm_file_path: Path) -> DependencyIndex:
+    """Create a new dependency index at 'path' from an OSM file."""
+    path.unlink(missing_ok=True)
+    index = DependencyIndex(path)
+    index.load(read_opl(osm_file_path))
+    _logger.info(f"Built dependency index {path} from {osm_file_path}")
+    return index
@@ -0,0 +1,407 @@
+"""Framed, indexed log format for gisevents messages.
+
+The event store is a single append-only file laid out as::
+
+    header  := MAGIC FORMAT_VERSION
+    frame   := varint(len(payload)) event_type payload
+    footer  := varint(segment_count) segment*
+    segment := varint(offset) varint(size) varint(frame_count)
+               zigzag(min_ts) zigzag(max_ts)
+               varint(id_count) zigzag(first_id) varint(id_delta)*
+    trailer := uint64le(footer_offset) MAGIC
+
+Frames are grouped into segments of a fixed number of frames. For every
+segment the footer holds a sparse index: the byte range of the segment, the
+range of event timestamps (seconds since epoch) and the sorted set of feature
+ids that occur in it. A reader can use the footer to jump directly to the
+segments that contain the history of a feature, or that overlap a time
+window, without decoding the rest of the file.
+"""
+import enum
+import logging
+import struct
+from bisect import bisect_left
+from collections.abc import Iterable, Iterator
+from datetime import datetime, timezone
+from typing import BinaryIO, NamedTuple, Optional
+
+from google.protobuf import message
+
+from thesis import gisevents
+
+_logger = logging.getLogger(__name__)
+
+MAGIC = b"GEVL"
+FORMAT_VERSION = 1
+HEADER = MAGIC + bytes([FORMAT_VERSION])
+_TRAILER = struct.Struct("<Q4s")
+
+DEFAULT_SEGMENT_SIZE = 4096
+DEFAULT_FLUSH_BYTES = 4 * 1024 * 1024
+DEFAULT_FLUSH_COUNT = 65536
+
+
+class EventType(enum.IntEnum):
+    CREATION = 1
+    MODIFICATION = 2
+    DELETION = 3
+
+
+_MESSAGE_TYPES: dict[EventType, type[message.Message]] = {
+    EventType.CREATION: gisevents.CreationEvent,
+    EventType.MODIFICATION: gisevents.ModificationEvent,
+    EventType.DELETION: gisevents.DeletionEvent,
+}
+
+
+class Segment(NamedTuple):
+    """Index entry for a run of consecutive frames in the log."""
+
+    offset: int
+    size: int
+    frame_count: int
+    min_timestamp: int
+    max_timestamp: int
+    ids: tuple[int, ...]
+
+
+class Frame(NamedTuple):
+    offset: int
+    event_type: EventType
+    event: message.Message
+
+
+def event_type_of(event: message.Message) -> EventType:
+    """Return the frame type tag of a gisevents message."""
+    for event_type, msg_type in _MESSAGE_TYPES.items():
+        if isinstance(event, msg_type):
+            return event_type
+    raise TypeError(f"Unsupported event message: {type(event).__name__}")
+
+
+def encode_varint(value: int) -> bytes:
+    """Encode a non-negative integer as a base 128 varint."""
+    if value < 0:
+        raise ValueError("Varints must be non-negative.")
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def decode_varint(buf: bytes | memoryview, pos: int = 0) -> tuple[int, int]:
+    """Decode a varint from 'buf' at 'pos'.
+
+    Returns the decoded value and the position after it.
+    """
+    result = 0
+    shift = 0
+    while True:
+        if pos >= len(buf):
+            raise EOFError("Truncated varint")
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def zigzag(value: int) -> int:
+    return (value << 1) ^ (value >> 63)
+
+
+def unzigzag(value: int) -> int:
+    return (value >> 1) ^ -(value & 1)
+
+
+def encode_frame(event: message.Message) -> bytes:
+    payload = event.SerializeToString()
+    return encode_varint(len(payload)) + bytes([event_type_of(event)]) + payload
+
+
+class _SegmentBuilder:
+    """Accumulates index information for the segment being written."""
+
+    def __init__(self, offset: int):
+        self.offset = offset
+        self.size = 0
+        self.frame_count = 0
+        self.min_timestamp = 0
+        self.max_timestamp = 0
+        self.ids: set[int] = set()
+
+    def add(self, fid: int, timestamp: int, size: int):
+        if self.frame_count == 0:
+            self.min_timestamp = self.max_timestamp = timestamp
+        else:
+            self.min_timestamp = min(self.min_timestamp, timestamp)
+            self.max_timestamp = max(self.max_timestamp, timestamp)
+        self.ids.add(fid)
+        self.frame_count += 1
+        self.size += size
+
+    def build(self) -> Segment:
+        return Segment(
+            self.offset,
+            self.size,
+            self.frame_count,
+            self.min_timestamp,
+            self.max_timestamp,
+            tuple(sorted(self.ids)),
+        )
+
+
+def encode_footer(segments: Iterable[Segment]) -> bytes:
+    segments = list(segments)
+    out = bytearray(encode_varint(len(segments)))
+    for seg in segments:
+        out += encode_varint(seg.offset)
+        out += encode_varint(seg.size)
+        out += encode_varint(seg.frame_count)
+        out += encode_varint(zigzag(seg.min_timestamp))
+        out += encode_varint(zigzag(seg.max_timestamp))
+        out += encode_varint(len(seg.ids))
+        prev = 0
+        for i, fid in enumerate(seg.ids):
+            out += encode_varint(zigzag(fid) if i == 0 else fid - prev)
+            prev = fid
+    return bytes(out)
+
+
+def decode_footer(buf: bytes | memoryview) -> list[Segment]:
+    count, pos = decode_varint(buf)
+    segments: list[Segment] = []
+    for _ in range(count):
+        offset, pos = decode_varint(buf, pos)
+        size, pos = decode_varint(buf, pos)
+        frame_count, pos = decode_varint(buf, pos)
+        min_ts, pos = decode_varint(buf, pos)
+        max_ts, pos = decode_varint(buf, pos)
+        id_count, pos = decode_varint(buf, pos)
+        ids: list[int] = []
+        for i in range(id_count):
+            val, pos = decode_varint(buf, pos)
+            ids.append(unzigzag(val) if i == 0 else ids[-1] + val)
+        segments.append(
+            Segment(
+                offset,
+                size,
+                frame_count,
+                unzigzag(min_ts),
+                unzigzag(max_ts),
+                tuple(ids),
+            )
+        )
+    return segments
+
+
+class EventLogWriter:
+    """Append gisevents messages to a binary file in the framed log format.
+
+    Frames are collected in an in-memory buffer that is written to the file
+    once it holds 'flush_bytes' bytes or 'flush_count' frames, whichever comes
+    first. The footer is written by `close`. A log that was never closed can still be
+    read; the index is then rebuilt by scanning the frames.
+    """
+
+    def __init__(
+        self,
+        file: BinaryIO,
+        segment_size: int = DEFAULT_SEGMENT_SIZE,
+        flush_bytes: int = DEFAULT_FLUSH_BYTES,
+        flush_count: int = DEFAULT_FLUSH_COUNT,
+    ):
+        if segment_size < 1:
+            raise ValueError("Segment size must be positive.")
+        self._file = file
+        self._segment_size = segment_size
+        self._flush_bytes = flush_bytes
+        self._flush_count = flush_count
+        self._buffer = bytearray(HEADER)
+        self._buffered_count = 0
+        self._segments: list[Segment] = []
+        self._offset = len(HEADER)
+        self._current = _SegmentBuilder(self._offset)
+        self._closed = False
+
+    @property
+    def offset(self) -> int:
+        """Byte offset at which the next frame will be written."""
+        return self._offset
+
+    @property
+    def segments(self) -> list[Segment]:
+        return list(self._segments)
+
+    def write(self, event: message.Message) -> int:
+        """Append an event to the log and return the offset of its frame."""
+        if self._closed:
+            raise ValueError("Write to closed event log")
+        frame = encode_frame(event)
+        offset = self._offset
+        self._buffer += frame
+        self._buffered_count += 1
+        self._offset += len(frame)
+        self._current.add(event.id, event.timestamp.seconds, len(frame))
+        if self._current.frame_count >= self._segment_size:
+            self._seal_segment()
+        if (
+            len(self._buffer) >= self._flush_bytes
+            or self._buffered_count >= self._flush_count
+        ):
+            self.flush()
+        return offset
+
+    def write_all(self, events: Iterable[message.Message]) -> int:
+        """Append events from an iterable, consuming it lazily.
+
+        Returns the number of events written.
+        """
+        count = 0
+        for event in events:
+            self.write(event)
+            count += 1
+        return count
+
+    def flush(self):
+        """Write buffered frames to the underlying file."""
+        if self._buffer:
+            self._file.write(self._buffer)
+            self._buffer = bytearray()
+        self._buffered_count = 0
+        self._file.flush()
+
+    def _seal_segment(self):
+        if self._current.frame_count > 0:
+            self._segments.append(self._current.build())
+        self._current = _SegmentBuilder(self._offset)
+
+    def close(self):
+        """Write the footer. Does not close the underlying file."""
+        if self._closed:
+            return
+        self._seal_segment()
+        footer_offset = self._offset
+        self._buffer += encode_footer(self._segments)
+        self._buffer += _TRAILER.pack(footer_offset, MAGIC)
+        self.flush()
+        self._closed = True
+
+
+def to_seconds(dt: datetime) -> int:
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+class EventLogReader:
+    """Random access reader for logs written by `EventLogWriter`."""
+
+    def __init__(self, file: BinaryIO):
+        self._file = file
+        file.seek(0)
+        if file.read(len(HEADER)) != HEADER:
+            raise ValueError("Not an event log, or unsupported format version.")
+        self._segments = self._read_footer()
+        if self._segments is None:
+            _logger.warning("Event log has no footer. Rebuilding index by scanning.")
+            self._segments = self._scan_segments()
+
+    @property
+    def segments(self) -> list[Segment]:
+        return list(self._segments)
+
+    def _read_footer(self) -> Optional[list[Segment]]:
+        end = self._file.seek(0, 2)
+        if end < len(HEADER) + _TRAILER.size:
+            return None
+        self._file.seek(end - _TRAILER.size)
+        footer_offset, magic = _TRAILER.unpack(self._file.read(_TRAILER.size))
+        if magic != MAGIC or not len(HEADER) <= footer_offset <= end - _TRAILER.size:
+            return None
+        self._file.seek(footer_offset)
+        footer = self._file.read(end - _TRAILER.size - footer_offset)
+        return decode_footer(footer)
+
+    def _scan_segments(self) -> list[Segment]:
+        end = self._file.seek(0, 2)
+        self._file.seek(len(HEADER))
+        data = memoryview(self._file.read(end - len(HEADER)))
+        segments: list[Segment] = []
+        builder = _SegmentBuilder(len(HEADER))
+        for frame_offset, size, event in _decode_frames(data, len(HEADER)):
+            builder.add(event.id, event.timestamp.seconds, size)
+            if builder.frame_count >= DEFAULT_SEGMENT_SIZE:
+                segments.append(builder.build())
+                builder = _SegmentBuilder(frame_offset + size)
+        if builder.frame_count > 0:
+            segments.append(builder.build())
+        return segments
+
+    def frames(self, segments: Optional[Iterable[Segment]] = None) -> Iterator[Frame]:
+        """Iterate over the frames of the given segments, or of the whole log."""
+        if segments is None:
+            segments = self._segments
+        for seg in segments:
+            self._file.seek(seg.offset)
+            data = memoryview(self._file.read(seg.size))
+            for offset, _, event in _decode_frames(data, seg.offset):
+                yield Frame(offset, event_type_of(event), event)
+
+    def events(self) -> Iterator[message.Message]:
+        for frame in self.frames():
+            yield frame.event
+
+    def feature_history(self, fid: int) -> Iterator[message.Message]:
+        """Iterate over all events of a single feature in log order."""
+        segments = (seg for seg in self._segments if _contains(seg.ids, fid))
+        for frame in self.frames(segments):
+            if frame.event.id == fid:
+                yield frame.event
+
+    def between(self, start: datetime, end: datetime) -> Iterator[message.Message]:
+        """Iterate over all events with a timestamp in [start, end)."""
+        lo, hi = to_seconds(start), to_seconds(end)
+        segments = (
+            seg
+            for seg in self._segments
+            if seg.max_timestamp >= lo and seg.min_timestamp < hi
+        )
+        for frame in self.frames(segments):
+            if lo <= frame.event.timestamp.seconds < hi:
+                yield frame.event
+
+
+def _contains(ids: tuple[int, ...], fid: int) -> bool:
+    i = bisect_left(ids, fid)
+    return i < len(ids) and ids[i] == fid
+
+
+def _decode_frames(
+    data: memoryview, base_offset: int
+) -> Iterator[tuple[int, int, message.Message]]:
+    """Decode consecutive frames in 'data'.
+
+    Yields the absolute offset, the size and the decoded message of each frame.
+    Stops silently at a truncated trailing frame.
+    """
+    pos = 0
+    while pos < len(data):
+        start = pos
+        try:
+            length, pos = decode_varint(data, pos)
+        except EOFError:
+            _logger.warning(f"Truncated frame at offset {base_offset + start}")
+            return
+        if pos + 1 + length > len(data):
+            _logger.warning(f"Truncated frame at offset {base_offset + start}")
+            return
+        event_type = EventType(data[pos])
+        pos += 1
+        event = _MESSAGE_TYPES[event_type]()
+        event.ParseFromString(bytes(data[pos : pos + length]))
+        pos += length
+        yield base_offset + start, pos - start, event
@@ -6,9 +6,20 @@ from pathlib import Path
 from typing import Optional
 from google.protobuf import message
 
+from thesis.api.event_log import (
+    DEFAULT_FLUSH_BYTES,
+    DEFAULT_FLUSH_COUNT,
+    DEFAULT_SEGMENT_SIZE,
+    EventLogWriter,
+)
+
 
 DEFAULT_CONFIG = {
     "event_store_path": Path("events.pbf"),
+    "segment_size": DEFAULT_SEGMENT_SIZE,
+    # Buffered frames are written to disk when either limit is reached.
+    "flush_bytes": DEFAULT_FLUSH_BYTES,
+    "flush_count": DEFAULT_FLUSH_COUNT,
 }
 
 _logger = logging.getLogger(__name__)
@@ -17,7 +28,8 @@ _config = DEFAULT_CONFIG.copy()
 _configured = False
 _initialized = False
 
-_writer: BufferedWriter
+_file: BufferedWriter
+_writer: EventLogWriter
 
 
 def configure(config: Optional[dict] = None):
@@ -33,11 +45,24 @@ def configure(config: Optional[dict] = None):
 
 
 def write_events(*events: message.Message):
+    write_stream(events)
+
+
+def write_stream(events: Iterable[message.Message]) -> int:
+    """Write events from an iterable without materializing it.
+
+    Returns the number of events written.
+    """
+    if not _initialized:
+        raise RuntimeError("Event store not initialized")
+    return _writer.write_all(events)
+
+
+def flush():
+    """Write all buffered events to disk."""
     if not _initialized:
         raise RuntimeError("Event store not initialized")
-    global _writer
-    for event in events:
-        _writer.write(event.SerializeToString())
+    _writer.flush()
 
 
 def init(
@@ -53,15 +78,23 @@ def init(
     else:
         configure(config)
 
-    global _writer
-    _writer = open(_config["event_store_path"], "wb").__enter__()
-    if events:
-        write_events(*events)
+    global _file, _writer
+    _file = open(_config["event_store_path"], "wb").__enter__()
+    _writer = EventLogWriter(
+        _file,
+        segment_size=_config["segment_size"],
+        flush_bytes=_config["flush_bytes"],
+        flush_count=_config["flush_count"],
+    )
     _initialized = True
+    if events is not None:
+        count = write_stream(events)
+        _logger.info(f"Wrote {count} initial events to the event store")
 
 
 def teardown():
     global _initialized
     if _initialized:
-        global _writer
-        _writer.__exit__(None, None, None)
+        _writer.close()
+        _file.__exit__(None, None, None)
+        _initialized = False
@@ -0,0 +1,313 @@
+"""Direct SQLite access to GeoPackage files.
+
+OGR reads complete features. Some steps only need a column or two of every
+row, and those are read here with the `sqlite3` module instead.
+
+Fingerprints
+------------
+`add_fingerprints` stores a 64-bit hash of the geometry blob, `all_tags` and
+`osm_version` of every feature in the column `FINGERPRINT_COLUMN`. Two
+features with equal fingerprints are taken to be equal, so change detection
+can compare fingerprints in FID order and only read the features whose
+fingerprints differ.
+
+OSM ids
+-------
+`add_osm_id_index` indexes the `osm_id` column, or another id column such
+as `osm_way_id`, so that the features of known OSM elements can be found
+with `fids_by_osm_id` without a table scan.
+
+Records
+-------
+`records` reads the columns needed to create events in batches of
+`FeatureRecord` tuples, without an OGR feature per row. The geometry stays
+a GeoPackage blob. `geometry_wkb` strips its header, and the WKB of a
+whole batch can then be parsed at once, e.g. with `shapely.from_wkb`.
+"""
+import logging
+import sqlite3
+from collections.abc import Iterable, Iterator, Sequence
+from contextlib import closing
+from hashlib import blake2b
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from thesis import tuning
+
+_logger = logging.getLogger(__name__)
+
+FINGERPRINT_COLUMN = "fingerprint"
+_FINGERPRINT_FUNCTION = "thesis_fingerprint"
+# Columns hashed in addition to the geometry
+_FINGERPRINT_FIELDS = ("all_tags", "osm_version")
+
+OSM_ID_COLUMN = "osm_id"
+# Stay below SQLITE_MAX_VARIABLE_NUMBER of older SQLite versions
+_MAX_PARAMS = 500
+
+DEFAULT_BATCH_SIZE = 4096  # records per batch
+
+Fingerprint = int
+
+# Envelope sizes in bytes by the envelope contents indicator of the header
+# flags, see the GeoPackage specification, "GeoPackageBinary format"
+_ENVELOPE_SIZES = {0: 0, 1: 32, 2: 48, 3: 48, 4: 64}
+
+
+def fingerprint(*values: bytes | str | int | float | None) -> Fingerprint:
+    """Hash column values into a signed 64-bit integer.
+
+    The result is signed so that SQLite stores it as an INTEGER.
+    """
+    h = blake2b(digest_size=8)
+    for value in values:
+        if value is None:
+            h.update(b"\x00")
+        elif isinstance(value, bytes):
+            h.update(b"\x01")
+            h.update(len(value).to_bytes(8, "little"))
+            h.update(value)
+        else:
+            encoded = str(value).encode()
+            h.update(b"\x02")
+            h.update(len(encoded).to_bytes(8, "little"))
+            h.update(encoded)
+    return int.from_bytes(h.digest(), "little", signed=True)
+
+
+def _connect(path: Path, readonly: bool = False) -> sqlite3.Connection:
+    if readonly:
+        con = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    else:
+        con = sqlite3.connect(path)
+    tuning.apply_pragmas(con, readonly)
+    return con
+
+
+def _quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def _columns(con: sqlite3.Connection, table: str) -> list[str]:
+    return [row[1] for row in con.execute(f"PRAGMA table_info({_quote(table)})")]
+
+
+def _primary_key(con: sqlite3.Connection, table: str) -> str:
+    for _, name, _, _, _, pk in con.execute(f"PRAGMA table_info({_quote(table)})"):
+        if pk:
+            return name
+    raise ValueError(f"Table {table} has no primary key")
+
+
+def _geometry_column(con: sqlite3.Connection, table: str) -> str:
+    row = con.execute(
+        "SELECT column_name FROM gpkg_geometry_columns WHERE table_name = ?",
+        (table,),
+    ).fetchone()
+    if row is None:
+        raise ValueError(f"Table {table} has no geometry column")
+    return row[0]
+
+
+def add_fingerprints(path: Path, tables: Iterable[str]):
+    """Add or refresh the fingerprint column of the tables in a GeoPackage.
+
+    Must not run while the file is open for writing elsewhere, e.g. by OGR.
+    """
+    with closing(_connect(path)) as con, con:
+        con.create_function(
+            _FINGERPRINT_FUNCTION, -1, fingerprint, deterministic=True
+        )
+        for table in tables:
+            columns = _columns(con, table)
+            if FINGERPRINT_COLUMN not in columns:
+                con.execute(
+                    f"ALTER TABLE {_quote(table)} "
+                    f"ADD COLUMN {FINGERPRINT_COLUMN} INTEGER"
+                )
+            hashed = [_geometry_column(con, table)] + [
+                field for field in _FINGERPRINT_FIELDS if field in columns
+            ]
+            args = ", ".join(map(_quote, hashed))
+            con.execute(
+                f"UPDATE {_quote(table)} "
+                f"SET {FINGERPRINT_COLUMN} = {_FINGERPRINT_FUNCTION}({args})"
+            )
+            _logger.debug(f"Fingerprinted table {table} of {path}")
+
+
+def has_fingerprints(path: Path, table: str) -> bool:
+    with closing(_connect(path, readonly=True)) as con:
+        return FINGERPRINT_COLUMN in _columns(con, table)
+
+
+def fingerprints(
+    path: Path, table: str, start: Optional[int] = None, stop: Optional[int] = None
+) -> Iterator[tuple[int, Fingerprint]]:
+    """Read (fid, fingerprint) rows of a table in FID order.
+
+    'start' is inclusive and 'stop' exclusive. None leaves the range open.
+    """
+    with closing(_connect(path, readonly=True)) as con:
+        fid = _quote(_primary_key(con, table))
+        conditions = []
+        params = []
+        if start is not None:
+            conditions.append(f"{fid} >= ?")
+            params.append(start)
+        if stop is not None:
+            conditions.append(f"{fid} < ?")
+            params.append(stop)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        yield from con.execute(
+            f"SELECT {fid}, {FINGERPRINT_COLUMN} FROM {_quote(table)}{where} "
+            f"ORDER BY {fid}",
+            params,
+        )
+
+
+def add_osm_id_index(path: Path, table: str, column: str = OSM_ID_COLUMN):
+    """Index an OSM id column of a table in a GeoPackage."""
+    with closing(_connect(path)) as con, con:
+        index = _quote(f"idx_{table}_{column}")
+        con.execute(
+            f"CREATE INDEX IF NOT EXISTS {index} "
+            f"ON {_quote(table)} ({_quote(column)})"
+        )
+
+
+def fids_by_osm_id(
+    path: Path, table: str, osm_ids: Iterable[int], column: str = OSM_ID_COLUMN
+) -> list[int]:
+    """Return the FIDs of the features with the given OSM ids, in FID order.
+
+    Ids without a feature are ignored. The osm_id column may be text, as
+    written by the OGR OSM driver, or integer.
+    """
+    ids = sorted(set(map(str, osm_ids)))
+    fids: list[int] = []
+    with closing(_connect(path, readonly=True)) as con:
+        fid = _quote(_primary_key(con, table))
+        for start in range(0, len(ids), _MAX_PARAMS):
+            chunk = ids[start : start + _MAX_PARAMS]
+            placeholders = ", ".join("?" * len(chunk))
+            fids.extend(
+                row[0]
+                for row in con.execute(
+                    f"SELECT {fid} FROM {_quote(table)} "
+                    f"WHERE {_quote(column)} IN ({placeholders})",
+                    chunk,
+                )
+            )
+    return sorted(fids)
+
+
+class FeatureRecord(NamedTuple):
+    """The columns of a feature that events are created from.
+
+    Missing columns are None. 'timestamp' is ISO 8601 text and 'tags' JSON,
+    as stored. 'geometry' is a GeoPackage geometry blob, see `geometry_wkb`.
+    'element_ids' are the values of the id columns requested from `records`.
+    """
+
+    fid: int
+    version: Optional[int]
+    timestamp: Optional[str]
+    tags: Optional[str]
+    geometry: Optional[bytes]
+    element_ids: tuple[Optional[int], ...] = ()
+
+
+def geometry_wkb(blob: bytes) -> bytes:
+    """The WKB of a GeoPackage geometry blob, without the header."""
+    if blob[:2] != b"GP":
+        raise ValueError("Not a GeoPackage geometry blob")
+    envelope = (blob[3] >> 1) & 0b111
+    if envelope not in _ENVELOPE_SIZES:
+        raise ValueError(f"Invalid envelope contents indicator {envelope}")
+    return blob[8 + _ENVELOPE_SIZES[envelope] :]
+
+
+def _record_query(con: sqlite3.Connection, table: str, id_columns: Sequence[str]):
+    columns = _columns(con, table)
+
+    def column(name: str) -> str:
+        return _quote(name) if name in columns else "NULL"
+
+    fid = _quote(_primary_key(con, table))
+    selected = [
+        fid,
+        column("osm_version"),
+        column("osm_timestamp"),
+        column("all_tags"),
+        _quote(_geometry_column(con, table)),
+        *map(column, id_columns),
+    ]
+    return fid, f"SELECT {', '.join(selected)} FROM {_quote(table)}"
+
+
+def _to_record(row: tuple) -> FeatureRecord:
+    fid, version, timestamp, tags, geometry, *element_ids = row
+    return FeatureRecord(
+        fid,
+        version,
+        timestamp,
+        tags,
+        geometry,
+        tuple(None if value is None else int(value) for value in element_ids),
+    )
+
+
+def records(
+    path: Path,
+    table: str,
+    start: Optional[int] = None,
+    stop: Optional[int] = None,
+    fids: Optional[Iterable[int]] = None,
+    id_columns: Sequence[str] = (),
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> Iterator[list[FeatureRecord]]:
+    """Read the features of a table in batches of records, in FID order.
+
+    Reads the FIDs from 'start' (inclusive) to 'stop' (exclusive), or just
+    the given 'fids'. FIDs without a feature are skipped. The values of the
+    OSM id columns 'id_columns' are read into `FeatureRecord.element_ids`.
+    """
+    with closing(_connect(path, readonly=True)) as con:
+        fid, query = _record_query(con, table, id_columns)
+        if fids is not None:
+            ids = sorted(set(fids))
+            for chunk_start in range(0, len(ids), _MAX_PARAMS):
+                chunk = ids[chunk_start : chunk_start + _MAX_PARAMS]
+                placeholders = ", ".join("?" * len(chunk))
+                cursor = con.execute(
+                    f"{query} WHERE {fid} IN ({placeholders}) ORDER BY {fid}", chunk
+                )
+                batch = [_to_record(row) for row in cursor]
+                if batch:
+                    yield batch
+            return
+
+        conditions = []
+        params = []
+        if start is not None:
+            conditions.append(f"{fid} >= ?")
+            params.append(start)
+        if stop is not None:
+            conditions.append(f"{fid} < ?")
+            params.append(stop)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        cursor = con.execute(f"{query}{where} ORDER BY {fid}", params)
+        while batch := cursor.fetchmany(batch_size):
+            yield [_to_record(row) for row in batch]
+
+
+def tables(path: Path) -> list[str]:
+    """Names of the feature tables of a GeoPackage."""
+    with closing(_connect(path, readonly=True)) as con:
+        return [
+            row[0]
+            for row in con.execute(
+                "SELECT table_name FROM gpkg_contents WHERE data_type = 'features'"
+            )
+        ]
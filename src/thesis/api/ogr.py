@@ -1,14 +1,14 @@
 import logging
 import os
 import shutil
-import subprocess
 import tempfile
 from pathlib import Path
-from typing import Literal, Optional, cast
+from typing import Literal, Optional, Sequence, cast
 
 from osgeo import ogr
 
-from thesis import osm
+from thesis import osm, tuning
+from thesis.api import process
 
 _logger = logging.getLogger(__name__)
 
@@ -29,18 +29,9 @@ class Config:
     def __init__(
         self,
         osm_conf_path: Optional[Path] = Path(DEFAULT_OSM_CONFIG),
-        osm_max_tmpfile_size: int = 4000,
     ):
         if not hasattr(self, "_initialized"):
             self._osm_conf_path = osm_conf_path
-            self._osm_max_tmpfile_size = osm_max_tmpfile_size
-            tmp_fd = None
-            try:
-                tmp_fd, osm_out_tmp = tempfile.mkstemp(suffix=".osm.pbf")
-            finally:
-                if tmp_fd:
-                    os.close(tmp_fd)
-            self._osm_out_tmp = Path(osm_out_tmp)
             self._initialized = True
         else:
             _logger.debug("Config already initialized. Skipping reinitialization.")
@@ -49,27 +40,27 @@ class Config:
     def osm_conf_path(self) -> Optional[Path]:
         return self._osm_conf_path
 
-    @property
-    def osm_max_tmpfile_size(self) -> int:
-        return self._osm_max_tmpfile_size
-
-    @property
-    def osm_out_tmp(self) -> Path:
-        return self._osm_out_tmp
-
 
-def convert_osm_to_gpkg(osm_file_path: Path, gpkg_out_path: Path):
+def convert_osm_to_gpkg(
+    osm_file_path: Path,
+    gpkg_out_path: Path,
+    layers: Optional[Sequence[str]] = None,
+    spatial_index: bool = True,
+):
     """Convert osm file to gpkg file using `ogr2ogr`.
 
+    Only the OSM layers in 'layers' are written, all of them if None. Without
+    'spatial_index' the layers get no R-tree, which saves building it for
+    GeoPackages that are never queried spatially.
+    The GDAL options and the transaction size of ogr2ogr are taken from the
+    current tuning profile, see `tuning`.
     Requires `ogr2ogr` to be in $PATH.
     """
     if gpkg_out_path.exists():
         _logger.error(f"The GPKG output file already exists: {gpkg_out_path}")
         raise RuntimeError
     config = Config()
-    OGR_CONFIG = {
-        "OSM_MAX_TMPFILE_SIZE": str(config.osm_max_tmpfile_size),
-    }
+    OGR_CONFIG: dict[str, str] = {}
 
     if config.osm_conf_path:
         OGR_CONFIG["OSM_CONFIG_FILE"] = str(config.osm_conf_path)
@@ -85,31 +76,17 @@ def convert_osm_to_gpkg(osm_file_path: Path, gpkg_out_path: Path):
         "OSM",
         "-preserve_fid",
         "-overwrite",
-        str(gpkg_out_path),
-        str(osm_file_path),
+        "-progress",
+        "-gt",
+        str(tuning.current().group_transaction_size),
     ]
-    _logger.debug(
-        f"Executing command: `{' '.join(command)}`. Using variables: {OGR_CONFIG}"
-    )
-    with subprocess.Popen(
-        command,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        bufsize=2,
-        env=OGR_CONFIG,
-    ) as proc:
-        while proc.poll() is None:
-            continue
-        outb, errb = proc.communicate()
-        outs, errs = outb.decode("utf-8"), errb.decode("utf-8")
-
-        if len(outs) > 0:
-            _logger.debug(f"Output from ogr2ogr: \n\t{outs}")
-
-        if len(errs) > 0:
-            _logger.error(f"Error from ogr2ogr: \n\t{errs}")
-        else:
-            _logger.info("ogr2ogr ran without errors.")
+    if not spatial_index:
+        command += ["-lco", "SPATIAL_INDEX=NO"]
+    command += [str(gpkg_out_path), str(osm_file_path), *(layers or ())]
+    _logger.debug(f"Using variables: {OGR_CONFIG}")
+    timing = process.run(command, "ogr2ogr", env=OGR_CONFIG, check=False)
+    if timing.returncode == 0:
+        _logger.info("ogr2ogr ran without errors.")
 
 
 def get_all_features(gpkg_fpath: FileName, layer_name: str):
@@ -127,11 +104,15 @@ Create = tuple[Literal[osm.ChangeType.CREATE], ogr.Feature]
 def apply_changes(osm_fpath: Path, osc_fpath: Path) -> None:
     """Apply changes from osc file to osm file.
 
-    Overwrites the input osm file.
+    Overwrites the input osm file. The output is written next to it and
+    renamed over it, which replaces the file atomically and without a copy.
     Requires `osmium` to be in $PATH.
     """
-    config = Config()
-    osm_tmp_out = config.osm_out_tmp
+    tmp_fd, tmp_name = tempfile.mkstemp(
+        suffix=".osm.pbf", prefix=f".{osm_fpath.name}.", dir=osm_fpath.parent
+    )
+    os.close(tmp_fd)
+    osm_tmp_out = Path(tmp_name)
 
     def get_command() -> list[str]:
         osmium_cmd = shutil.which("osmium")
@@ -149,27 +130,89 @@ def apply_changes(osm_fpath: Path, osc_fpath: Path) -> None:
             str(osc_fpath),
         ]
 
-    command = get_command()
-    with subprocess.Popen(
-        command, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-    ) as proc:
-        _logger.debug(f"Applying change file with: `{' '.join(command)}`")
-        while proc.poll() is None:
-            continue
-        outb, errb = proc.communicate()
-        outs, errs = outb.decode("utf-8"), errb.decode("utf-8")
-
-        if len(outs) > 0:
-            _logger.debug(f"Output from osmium: \n\t{outs}")
-
-        if len(errs) > 0:
-            _logger.error(f"Error from osmium: \n\t{errs}")
-
-        if proc.returncode != 0:
-            raise RuntimeError(
-                f"Applying changes failed with return code {proc.returncode}."
-            )
-
-    _logger.debug("Copying temporary osm file to output file.")
-    shutil.copy(osm_tmp_out, osm_fpath)
+    try:
+        command = get_command()
+        _logger.debug("Applying change file")
+        process.run(command, "osmium apply-changes")
+        os.replace(osm_tmp_out, osm_fpath)
+    except BaseException:
+        osm_tmp_out.unlink(missing_ok=True)
+        raise
     _logger.info(f"Applied changes and wrote to file: {osm_fpath}")
+
+
+def merge_changes(osc_fpaths: Sequence[Path], out_fpath: Path) -> None:
+    """Merge consecutive change files into one.
+
+    Only the last version of every element is kept, so the result can be
+    applied in a single pass. The output format follows the file name of
+    'out_fpath', e.g. '.osc.gz'.
+    Requires `osmium` to be in $PATH.
+    """
+    osmium_cmd = shutil.which("osmium")
+    if osmium_cmd is None:
+        raise RuntimeError("osmium not found in path")
+    command = [
+        osmium_cmd,
+        "merge-changes",
+        "--simplify",
+        "--overwrite",
+        "-o",
+        str(out_fpath),
+        *map(str, osc_fpaths),
+    ]
+    _logger.debug(f"Merging {len(osc_fpaths)} change files")
+    process.run(command, "osmium merge-changes")
+
+
+def extract_elements(
+    osm_fpath: Path, elements: osm.ChangedElements, out_fpath: Path
+) -> None:
+    """Write the given elements of an osm file to a new osm file.
+
+    Also writes the elements they reference, recursively, so that their
+    geometries can be built from the new file alone. Elements that are not
+    in the input file, e.g. deleted ones, are left out. Element types that
+    are None in 'elements' are left out too.
+    Requires `osmium` to be in $PATH.
+    """
+    osmium_cmd = shutil.which("osmium")
+    if osmium_cmd is None:
+        raise RuntimeError("osmium not found in path")
+
+    prefixes = {
+        osm.ElementType.NODE: "n",
+        osm.ElementType.WAY: "w",
+        osm.ElementType.RELATION: "r",
+    }
+    with tempfile.NamedTemporaryFile("w", suffix=".ids") as id_file:
+        for etype, prefix in prefixes.items():
+            for element_id in elements.of(etype) or ():
+                id_file.write(f"{prefix}{element_id}\n")
+        id_file.flush()
+
+        command = [
+            osmium_cmd,
+            "getid",
+            "--add-referenced",
+            "--no-progress",
+            "-f",
+            "pbf",
+            "--overwrite",
+            "-o",
+            str(out_fpath),
+            "-i",
+            id_file.name,
+            str(osm_fpath),
+        ]
+        _logger.debug("Extracting elements")
+        timing = process.run(
+            command, "osmium getid", stderr_level=logging.DEBUG, check=False
+        )
+
+    # osmium getid returns 1 when some ids were not found as well as on errors
+    if timing.returncode not in (0, 1) or not out_fpath.exists():
+        raise RuntimeError(
+            f"Extracting elements failed with return code {timing.returncode}."
+        )
+    _logger.info(f"Extracted changed elements to file: {out_fpath}")
@@ -1,20 +1,135 @@
+"""Read OSMChange (.osc) files.
+
+The files are parsed incrementally, and every element is discarded once
+its record has been yielded, so memory use does not grow with the size of
+the file. Gzipped files (.osc.gz) are decompressed on the fly.
+"""
+from collections.abc import Iterator
 from datetime import datetime
+import gzip
+from pathlib import Path
 import xml.etree.ElementTree as ET
 
-from thesis.osm import ChangeType
+from thesis.osm import (
+    ChangeType,
+    ElementChange,
+    ElementID,
+    ElementIdentifier,
+    ElementType,
+    Member,
+)
 
 NODE_ELEMENT_TAG = "node"
+WAY_ELEMENT_TAG = "way"
+RELATION_ELEMENT_TAG = "relation"
+
+_ELEMENT_TYPES = {
+    NODE_ELEMENT_TAG: ElementType.NODE,
+    WAY_ELEMENT_TAG: ElementType.WAY,
+    RELATION_ELEMENT_TAG: ElementType.RELATION,
+}
+_CHANGE_TYPES = {change_type.name.lower(): change_type for change_type in ChangeType}
+
 
+def _record(change_type: ChangeType, element: ET.Element) -> ElementChange:
+    attrib = element.attrib
+    etype = _ELEMENT_TYPES[element.tag]
+    coordinates = None
+    node_refs: tuple[ElementID, ...] = ()
+    members: tuple[Member, ...] = ()
+    if etype == ElementType.NODE:
+        if "lon" in attrib and "lat" in attrib:
+            coordinates = (float(attrib["lon"]), float(attrib["lat"]))
+    elif etype == ElementType.WAY:
+        node_refs = tuple(int(nd.attrib["ref"]) for nd in element.iter("nd"))
+    else:
+        members = tuple(
+            Member(
+                ElementType[member.attrib["type"].upper()],
+                int(member.attrib["ref"]),
+                member.attrib.get("role", ""),
+            )
+            for member in element.iter("member")
+        )
+    return ElementChange(
+        change_type,
+        ElementIdentifier(int(attrib["id"]), etype),
+        int(attrib.get("version", 0)),
+        datetime.fromisoformat(attrib["timestamp"]),
+        coordinates,
+        node_refs,
+        members,
+    )
 
-def changed_nodes(osc_file_path: str):
-    tree = ET.parse(osc_file_path)
-    root = tree.getroot()
 
-    for change in root:
-        change_type = ChangeType[change.tag.upper()]
-        for element in change:
-            if element.tag != NODE_ELEMENT_TAG:
+def _elements(osc_file_path: str | Path) -> Iterator[tuple[ChangeType, ET.Element]]:
+    """Yield every element in an osc file with its change type, in file order.
+
+    An element is only valid until the next one is requested.
+    """
+    opener = gzip.open if str(osc_file_path).endswith(".gz") else open
+    with opener(osc_file_path, "rb") as f:
+        change_type = None
+        change = None
+        for event, element in ET.iterparse(f, events=("start", "end")):
+            if event == "start":
+                if element.tag in _CHANGE_TYPES:
+                    change_type = _CHANGE_TYPES[element.tag]
+                    change = element
                 continue
-            node_id = int(element.attrib["id"])
-            timestamp = datetime.fromisoformat(element.attrib["timestamp"])
-            yield (node_id, change_type, timestamp)
+            if element.tag in _ELEMENT_TYPES and change is not None:
+                assert change_type is not None
+                yield change_type, element
+                # Drop the element and its children, such as tags and node
+                # refs. The change element then never holds more than one.
+                change.remove(element)
+            elif element is change:
+                change.clear()
+                change = None
+
+
+def changes(osc_file_path: str | Path) -> Iterator[ElementChange]:
+    """Yield a record of every element in an osc file, in file order."""
+    for change_type, element in _elements(osc_file_path):
+        yield _record(change_type, element)
+
+
+def changed_nodes(osc_file_path: str | Path):
+    """Yield (node id, change type, timestamp) of the nodes in an osc file."""
+    for change in changes(osc_file_path):
+        if change.element.etype == ElementType.NODE:
+            yield (change.element.id, change.change_type, change.timestamp)
+
+
+def changed_ways(
+    osc_file_path: str | Path,
+) -> Iterator[tuple[ElementID, ChangeType, list[ElementID]]]:
+    """Yield (way id, change type, node ids) of the ways in an osc file.
+
+    Deleted ways have no node ids.
+    """
+    for change in changes(osc_file_path):
+        if change.element.etype == ElementType.WAY:
+            yield change.element.id, change.change_type, list(change.node_refs)
+
+
+def changed_relations(
+    osc_file_path: str | Path,
+) -> Iterator[tuple[ElementID, ChangeType, list[tuple[ElementType, ElementID]]]]:
+    """Yield (relation id, change type, members) of the relations in an osc file.
+
+    Members are (element type, id) pairs. Deleted relations have no members.
+    """
+    for change in changes(osc_file_path):
+        if change.element.etype == ElementType.RELATION:
+            members = [(member.etype, member.id) for member in change.members]
+            yield change.element.id, change.change_type, members
+
+
+def element_ids(osc_file_path: str | Path) -> Iterator[ElementIdentifier]:
+    """Yield the identifiers of all elements in an osc file, in file order.
+
+    Only the ids are read, other attributes are not validated.
+    """
+    for _, element in _elements(osc_file_path):
+        yield ElementIdentifier(int(element.attrib["id"]), _ELEMENT_TYPES[element.tag])
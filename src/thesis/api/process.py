@@ -0,0 +1,190 @@
+"""Run external tools and record how long they take.
+
+`run` starts a command and blocks until it exits, while its output is
+streamed line by line into the log. Each run is recorded as a `Timing`
+with the wall time and peak memory use of the command. Steps that run in
+this process are recorded with `timed`. `report` summarizes the recorded
+timings per stage.
+"""
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections.abc import Iterable, Iterator, Mapping, Sequence
+from contextlib import contextmanager
+from typing import IO, NamedTuple, Optional
+
+from thesis import tuning
+
+_logger = logging.getLogger(__name__)
+
+_CHUNK_SIZE = 4096
+
+
+class Timing(NamedTuple):
+    """Wall time and peak memory use of one stage run."""
+
+    stage: str
+    wall_time: float  # seconds
+    max_rss: Optional[int] = None  # bytes, None if not measured
+    returncode: int = 0
+
+
+_timings: list[Timing] = []
+
+
+def timings() -> list[Timing]:
+    """All timings recorded in this process, in order."""
+    return list(_timings)
+
+
+def clear_timings():
+    _timings.clear()
+
+
+def _log_stream(stream: IO[bytes], stage: str, level: int):
+    """Log the output of a command line by line as it arrives.
+
+    Output that ends with a '.' without a newline is logged right away.
+    That is how GDAL tools report progress ("0...10...20...").
+    """
+    buffer = b""
+    for chunk in iter(lambda: stream.read1(_CHUNK_SIZE), b""):  # type: ignore
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        if buffer.endswith(b"."):
+            lines.append(buffer)
+            buffer = b""
+        for line in lines:
+            text = line.decode("utf-8", errors="replace").rstrip()
+            if text:
+                _logger.log(level, f"{stage}: {text}")
+    text = buffer.decode("utf-8", errors="replace").rstrip()
+    if text:
+        _logger.log(level, f"{stage}: {text}")
+
+
+def _wait(proc: subprocess.Popen) -> Optional[int]:
+    """Block until 'proc' exits and return its peak RSS in bytes, if known."""
+    if not hasattr(os, "wait4"):
+        proc.wait()
+        return None
+    _, status, rusage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return rusage.ru_maxrss if sys.platform == "darwin" else rusage.ru_maxrss * 1024
+
+
+def run(
+    command: Sequence[str],
+    stage: Optional[str] = None,
+    env: Optional[Mapping[str, str]] = None,
+    stdout_level: int = logging.DEBUG,
+    stderr_level: int = logging.ERROR,
+    check: bool = True,
+) -> Timing:
+    """Run a command to completion and record its timing.
+
+    Parameters
+    ----------
+    command : sequence of str
+        The command and its arguments.
+    stage : str, optional
+        Name of the stage in the timing report. Defaults to the name of the
+        executable.
+    env : mapping, optional
+        Variables added to the environment of the command. It is the
+        environment of this process with the settings of the current tuning
+        profile, see `tuning.environment`.
+    stdout_level, stderr_level : int
+        Log levels of the output on stdout and stderr.
+    check : bool
+        Raise a RuntimeError if the command exits with a non-zero code.
+    """
+    stage = stage or os.path.basename(command[0])
+    _logger.debug(f"Running `{' '.join(command)}`")
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        command,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=tuning.environment(env),
+    )
+    readers = [
+        threading.Thread(target=_log_stream, args=(stream, stage, level))
+        for stream, level in ((proc.stdout, stdout_level), (proc.stderr, stderr_level))
+    ]
+    for reader in readers:
+        reader.start()
+    try:
+        max_rss = _wait(proc)
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        raise
+    finally:
+        for reader in readers:
+            reader.join()
+        assert proc.stdout is not None and proc.stderr is not None
+        proc.stdout.close()
+        proc.stderr.close()
+
+    timing = Timing(stage, time.perf_counter() - start, max_rss, proc.returncode)
+    _timings.append(timing)
+    _logger.info(
+        f"{stage} finished with return code {timing.returncode} "
+        f"in {timing.wall_time:.1f} s{_format_rss(max_rss, ', peak RSS ')}"
+    )
+    if check and proc.returncode != 0:
+        raise RuntimeError(f"{stage} failed with return code {proc.returncode}.")
+    return timing
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Record the wall time of the steps in a with block as a stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _timings.append(Timing(stage, time.perf_counter() - start))
+
+
+def _format_rss(max_rss: Optional[int], prefix: str = "") -> str:
+    if max_rss is None:
+        return ""
+    return f"{prefix}{max_rss / 2**20:.0f} MiB"
+
+
+def report(recorded: Optional[Iterable[Timing]] = None) -> str:
+    """Summarize timings per stage, in order of first appearance.
+
+    Lists the number of runs, the total and the longest wall time and the
+    peak RSS of every stage. Defaults to all timings recorded so far.
+    """
+    stages: dict[str, list[Timing]] = {}
+    for timing in _timings if recorded is None else recorded:
+        stages.setdefault(timing.stage, []).append(timing)
+
+    rows = [("stage", "runs", "total [s]", "max [s]", "peak RSS")]
+    for stage, runs in stages.items():
+        rss = [run.max_rss for run in runs if run.max_rss is not None]
+        rows.append(
+            (
+                stage,
+                str(len(runs)),
+                f"{sum(run.wall_time for run in runs):.1f}",
+                f"{max(run.wall_time for run in runs):.1f}",
+                _format_rss(max(rss)) if rss else "-",
+            )
+        )
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return "\n".join(
+        "  ".join(
+            [row[0].ljust(widths[0])]
+            + [cell.rjust(width) for cell, width in zip(row[1:], widths[1:])]
+        )
+        for row in rows
+    )
@@ -1,13 +1,16 @@
-import json
 import logging
+from collections.abc import Sequence
 from datetime import datetime
 from typing import Optional, cast
 
+import numpy as np
+import numpy.typing as npt
+import shapely
 from google.protobuf.timestamp_pb2 import Timestamp
 from osgeo import ogr
 
 from thesis import geo, gisevents, utils, geodiff, properties as props
-from thesis.api import event_store
+from thesis.api import event_store, gpkg
 
 _logger = logging.getLogger(__name__)
 
@@ -41,14 +44,10 @@ def creation_event(feature: ogr.Feature) -> gisevents.CreationEvent:
     event.version = osm_version
 
     # Properties (tags)
-    all_tags_str: Optional[str] = feature.GetFieldAsString("all_tags")
-    if all_tags_str:
-        all_tags: dict = json.loads(
-            all_tags_str, strict=False, object_hook=props.as_string
-        )
-        for key, val in all_tags.items():
-            event.properties.key.append(key)
-            event.properties.value.append(val)
+    all_tags = props.parse(feature.GetFieldAsString("all_tags"))
+    if all_tags:
+        event.properties.key.extend(all_tags.keys())
+        event.properties.value.extend(all_tags.values())
 
     geom: ogr.Geometry = feature.GetGeometryRef()
     match geom.GetGeometryType():
@@ -82,6 +81,92 @@ def _validate_modification_args(prev_feature: ogr.Feature, curr_feature: ogr.Fea
         raise geodiff.GeometryTypeMismatchError(gtype1, gtype2)
 
 
+def _max_edit_distance(coords: npt.NDArray[np.float64]) -> int:
+    """Cutoff for linestring diffs against the new vertices 'coords'.
+
+    An edit script with more commands than the new geometry has vertices is
+    no smaller than the geometry itself, so the geometry replaces the patch.
+    """
+    return len(coords)
+
+
+def _ogr_coordinates(geom: ogr.Geometry) -> npt.NDArray[np.float64]:
+    """Vertices of a point or linestring, or of the exterior ring of a polygon."""
+    match geom.GetGeometryType():
+        case ogr.wkbPoint:
+            return np.array([[geom.GetX(), geom.GetY()]])
+        case ogr.wkbPolygon:
+            return geo.get_coordinates(geom.GetGeometryRef(0))
+        case _:
+            return geo.get_coordinates(geom)
+
+
+def _patch_geometry(
+    event: gisevents.ModificationEvent,
+    geometry_name: str,
+    prev_coords: npt.NDArray[np.float64],
+    curr_coords: npt.NDArray[np.float64],
+):
+    """Set the geometry patch of a modification event.
+
+    The coordinates are (N, 2) arrays of degrees: the point, the vertices
+    of the linestring or the exterior ring of the polygon.
+    """
+    match geometry_name:
+        case "POINT":
+            # The difference of the quantized points, which adds up exactly
+            prev_point = geo.to100nano_array(prev_coords[0])
+            curr_point = geo.to100nano_array(curr_coords[0])
+            lon, lat = (curr_point - prev_point).tolist()
+            event.point_patch.CopyFrom(gisevents.Point(lon=lon, lat=lat))
+        case "LINESTRING":
+            try:
+                ls_patch = geodiff.diff_linestrings(
+                    prev_coords,
+                    curr_coords,
+                    max_d=_max_edit_distance(curr_coords),
+                )
+            except geodiff.EditDistanceExceededError:
+                ls_msg = gisevents.coordinates_to_linestring_message(curr_coords)
+                event.linestring.CopyFrom(ls_msg)
+            else:
+                ls_patch_msg = utils.to_lspatch_message(ls_patch)
+                event.linestring_patch.CopyFrom(ls_patch_msg)
+        case "POLYGON":
+            try:
+                poly_patch = geodiff.diff_linestrings(
+                    prev_coords,
+                    curr_coords,
+                    max_d=_max_edit_distance(curr_coords),
+                )
+            except geodiff.EditDistanceExceededError:
+                p_msg = gisevents.coordinates_to_polygon_message(curr_coords)
+                event.polygon.CopyFrom(p_msg)
+            else:
+                pp_msg = utils.to_lspatch_message(poly_patch)
+                event.polygon_patch.CopyFrom(pp_msg)
+        case _:
+            raise TypeError(f"Unsupported geometry type: {geometry_name}")
+
+
+def _patch_properties(
+    event: gisevents.ModificationEvent,
+    prev_tags: Optional[str],
+    curr_tags: Optional[str],
+):
+    """Add the property patch from the `all_tags` of two versions, if any.
+
+    Unchanged tags are detected on the raw strings, without parsing them.
+    """
+    if (prev_tags or "") == (curr_tags or ""):
+        return
+    prev_props = props.parse(prev_tags)
+    curr_props = props.parse(curr_tags)
+    if prev_props != curr_props:
+        prop_patch = props.diff(prev_props, curr_props)
+        event.prop_patch.CopyFrom(utils.to_prop_patch_msg(prop_patch))
+
+
 def modification_event(
     prev_feature: ogr.Feature, curr_feature: ogr.Feature
 ) -> gisevents.ModificationEvent:
@@ -92,6 +177,10 @@ def modification_event(
     The two features must be of the same type and have the same FID.
     The version number of the previous feature must be one less than the
     version number of the current feature.
+
+    Linestrings and polygons that have changed beyond patching, see
+    `_max_edit_distance`, are replaced: the event then carries the new
+    geometry instead of a patch.
     """
 
     try:
@@ -110,55 +199,210 @@ def modification_event(
     prev_geom = cast(ogr.Geometry, prev_feature.GetGeometryRef())
     curr_geom = cast(ogr.Geometry, curr_feature.GetGeometryRef())
 
-    prev_geom_wkt = cast(str, prev_geom.ExportToWkt())
-    curr_geom_wkt = cast(str, curr_geom.ExportToWkt())
-
-    geom_type = cast(int, prev_geom.GetGeometryType())
     if not curr_geom.Equals(prev_geom):
-        match geom_type:
-            case ogr.wkbPoint:
-                point_diff = geodiff.diff_points(prev_geom_wkt, curr_geom_wkt)
-                point_msg = utils.to_point_message(point_diff)
-                event.point_patch.CopyFrom(point_msg)
-            case ogr.wkbLineString:
-                ls_patch = geodiff.diff_linestrings(prev_geom_wkt, curr_geom_wkt)
-                ls_patch_msg = utils.to_lspatch_message(ls_patch)
-                event.linestring_patch.CopyFrom(ls_patch_msg)
-            case ogr.wkbPolygon:
-                lr1 = prev_geom.GetGeometryRef(0)
-                lr2 = curr_geom.GetGeometryRef(0)
-                poly_patch = geodiff.diff_linestrings(
-                    lr1.ExportToWkt(), lr2.ExportToWkt()
-                )
-                pp_msg = utils.to_lspatch_message(poly_patch)
-                event.polygon_patch.CopyFrom(pp_msg)
-            case _:
-                raise TypeError(f"Unsupported geometry type: {geom_type}")
+        _patch_geometry(
+            event,
+            prev_geom.GetGeometryName().upper(),
+            _ogr_coordinates(prev_geom),
+            _ogr_coordinates(curr_geom),
+        )
 
     # Check properties
-    prev_props: props.Properties = json.loads(
+    _patch_properties(
+        event,
         prev_feature.GetFieldAsString("all_tags"),
-        strict=False,
-        object_hook=props.as_string,
-    )
-    curr_props: props.Properties = json.loads(
         curr_feature.GetFieldAsString("all_tags"),
-        strict=False,
-        object_hook=props.as_string,
     )
-    if prev_props != curr_props:
-        prop_patch = props.diff(prev_props, curr_props)
-        event.prop_patch.CopyFrom(utils.to_prop_patch_msg(prop_patch))
 
     return event
 
 
-def deletion_event(feature: ogr.Feature) -> gisevents.DeletionEvent:
-    """Create a new DeletionEvent from an ogr feature."""
+def deletion_event(
+    feature: ogr.Feature, timestamp: Optional[datetime] = None
+) -> gisevents.DeletionEvent:
+    """Create a new DeletionEvent from an ogr feature.
+
+    The deleted feature carries no time of deletion. Pass the timestamp of
+    the change set that deleted it. Without one, the current time is used.
+    """
     event = gisevents.DeletionEvent()
     event.id = feature.GetFID()
     event.version = feature.GetFieldAsInteger("osm_version")
-    # NOTE: This is a hack
-    timestamp = datetime.now()
+    if timestamp is None:
+        # NOTE: This is a hack
+        timestamp = datetime.now()
     event.timestamp.FromDatetime(timestamp)
     return event
+
+
+# Record batches
+# --------------
+# The functions below create the events of whole batches of
+# `gpkg.FeatureRecord`s. The geometries of a batch are parsed with one call
+# to `shapely.from_wkb`, and their coordinates are read, quantized and delta
+# encoded as single arrays.
+
+_GEOMETRY_NAMES = {
+    shapely.GeometryType.POINT: "POINT",
+    shapely.GeometryType.LINESTRING: "LINESTRING",
+    shapely.GeometryType.POLYGON: "POLYGON",
+}
+
+
+class _Geometries:
+    """The parsed geometries of a batch of records.
+
+    'coords' holds the vertices of all geometries in degrees, the exterior
+    rings for polygons. The vertices of geometry i are
+    coords[offsets[i]:offsets[i + 1]].
+    """
+
+    def __init__(self, records: Sequence[gpkg.FeatureRecord]):
+        blobs = []
+        for record in records:
+            if record.geometry is None:
+                raise ValueError(f"Feature {record.fid} has no geometry")
+            blobs.append(gpkg.geometry_wkb(record.geometry))
+        self.geometries = shapely.from_wkb(blobs)
+        self.type_ids = shapely.get_type_id(self.geometries)
+        unsupported = ~np.isin(self.type_ids, list(_GEOMETRY_NAMES))
+        if unsupported.any():
+            type_id = self.type_ids[unsupported][0]
+            raise ValueError(f"Unsupported geometry type: {type_id}")
+
+        polygons = self.type_ids == shapely.GeometryType.POLYGON
+        if (shapely.get_num_interior_rings(self.geometries[polygons]) > 0).any():
+            raise ValueError("Does not support polygons with holes.")
+        curves = self.geometries.copy()
+        curves[polygons] = shapely.get_exterior_ring(self.geometries[polygons])
+        self.coords, index = shapely.get_coordinates(curves, return_index=True)
+        counts = np.bincount(index, minlength=len(records))
+        self.offsets = np.concatenate(([0], np.cumsum(counts)))
+
+    def name(self, i: int) -> str:
+        return _GEOMETRY_NAMES[shapely.GeometryType(self.type_ids[i])]
+
+    def vertices(self, i: int) -> npt.NDArray[np.float64]:
+        return self.coords[self.offsets[i] : self.offsets[i + 1]]
+
+    def delta_encoded(self) -> tuple[list[int], list[int]]:
+        """Delta encoded lon and lat of all vertices in 100 nano degrees.
+
+        Each geometry is encoded on its own: its first vertex holds the
+        absolute coordinates.
+        """
+        quantized = geo.to100nano_array(self.coords)
+        deltas = geo.delta_encode_array(quantized)
+        starts = self.offsets[:-1][self.offsets[:-1] < self.offsets[1:]]
+        deltas[starts] = quantized[starts]
+        return deltas[:, 0].tolist(), deltas[:, 1].tolist()
+
+
+def _record_version(record: gpkg.FeatureRecord) -> int:
+    if record.version is None or record.version < 1:
+        raise ValueError(
+            f'Invalid or no value for "osm_version" on feature {record.fid}'
+        )
+    return record.version
+
+
+def _record_timestamp(record: gpkg.FeatureRecord) -> datetime:
+    if record.timestamp is None:
+        raise ValueError(f'No value for "osm_timestamp" on feature {record.fid}')
+    return datetime.fromisoformat(record.timestamp)
+
+
+def creation_events(
+    records: Sequence[gpkg.FeatureRecord],
+) -> list[gisevents.CreationEvent]:
+    """Create the creation events of a batch of records.
+
+    Equivalent to `creation_event` on the corresponding features.
+    """
+    geometries = _Geometries(records)
+    lon, lat = geometries.delta_encoded()
+    offsets = geometries.offsets.tolist()
+
+    result = []
+    for i, record in enumerate(records):
+        event = gisevents.CreationEvent()
+        event.id = record.fid
+        event.version = _record_version(record)
+        event.timestamp.FromDatetime(_record_timestamp(record))
+        tags = props.parse(record.tags)
+        if tags:
+            event.properties.key.extend(tags.keys())
+            event.properties.value.extend(tags.values())
+
+        start, stop = offsets[i], offsets[i + 1]
+        match geometries.name(i):
+            case "POINT":
+                event.point.lon = lon[start] if stop > start else 0
+                event.point.lat = lat[start] if stop > start else 0
+            case "LINESTRING":
+                event.linestring.lon.extend(lon[start:stop])
+                event.linestring.lat.extend(lat[start:stop])
+            case "POLYGON":
+                event.polygon.lon.extend(lon[start:stop])
+                event.polygon.lat.extend(lat[start:stop])
+        result.append(event)
+    return result
+
+
+def modification_events(
+    pairs: Sequence[tuple[gpkg.FeatureRecord, gpkg.FeatureRecord]],
+) -> list[gisevents.ModificationEvent]:
+    """Create the modification events of a batch of (previous, current) records.
+
+    Equivalent to `modification_event` on the corresponding features.
+    Raises a ValueError if a current record has no valid version.
+    """
+    prev_geometries = _Geometries([prev for prev, _ in pairs])
+    curr_geometries = _Geometries([curr for _, curr in pairs])
+    equal = shapely.equals(prev_geometries.geometries, curr_geometries.geometries)
+
+    result = []
+    for i, (prev, curr) in enumerate(pairs):
+        if prev.fid != curr.fid:
+            raise ValueError("FID mismatch.")
+        prev_name = prev_geometries.name(i)
+        curr_name = curr_geometries.name(i)
+        if prev_name != curr_name:
+            raise geodiff.GeometryTypeMismatchError(prev_name, curr_name)
+
+        event = gisevents.ModificationEvent()
+        event.id = prev.fid
+        event.version = _record_version(curr)
+        event.timestamp.FromDatetime(_record_timestamp(curr))
+        if not equal[i]:
+            _patch_geometry(
+                event,
+                prev_name,
+                prev_geometries.vertices(i),
+                curr_geometries.vertices(i),
+            )
+        _patch_properties(event, prev.tags, curr.tags)
+        result.append(event)
+    return result
+
+
+def deletion_events(
+    records: Sequence[gpkg.FeatureRecord],
+    timestamps: Sequence[Optional[datetime]],
+) -> list[gisevents.DeletionEvent]:
+    """Create the deletion events of a batch of records.
+
+    Equivalent to `deletion_event` on the corresponding features, with one
+    timestamp per record. Raises a ValueError if a record has no valid
+    version.
+    """
+    now = datetime.now()
+    result = []
+    for record, timestamp in zip(records, timestamps, strict=True):
+        event = gisevents.DeletionEvent()
+        event.id = record.fid
+        event.version = _record_version(record)
+        # NOTE: This is a hack, see `deletion_event`
+        event.timestamp.FromDatetime(timestamp or now)
+        result.append(event)
+    return result
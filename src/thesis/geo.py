@@ -2,6 +2,8 @@ from datetime import datetime
 from functools import reduce
 from typing import Sequence, TypeGuard, cast
 
+import numpy as np
+import numpy.typing as npt
 from osgeo import ogr as _ogr
 
 
@@ -56,6 +58,14 @@ def to100nano(degree: float) -> int:
     return int(degree * 10**7)
 
 
+def to100nano_array(degrees: npt.ArrayLike) -> npt.NDArray[np.int64]:
+    """Convert an array of degrees to units of 100 nano degrees.
+
+    Truncates like `to100nano`, with one multiplication for all values.
+    """
+    return (np.asarray(degrees, dtype=np.float64) * 10**7).astype(np.int64)
+
+
 def coordsTo100nano(coords: Coordinates) -> list[tuple[int, int]]:
     """Convert coordinates to units of 100 nano degrees."""
     return [(to100nano(x), to100nano(y)) for x, y in coords]
@@ -67,6 +77,25 @@ def delta_encode(seq: Sequence[int]):
     return [seq[0]] + list(deltas)
 
 
+def delta_encode_array(values: npt.NDArray[np.int64]) -> npt.NDArray[np.int64]:
+    """Like `delta_encode`, along the first axis of an array.
+
+    An (N, 2) array of coordinates is delta encoded per column.
+    """
+    return np.diff(values, axis=0, prepend=np.zeros_like(values[:1]))
+
+
+def get_coordinates(geom: _ogr.Geometry) -> npt.NDArray[np.float64]:
+    """Vertices of a LineString or LinearRing as an (N, 2) array of degrees.
+
+    All points are read with a single call to `GetPoints`. Z is dropped.
+    """
+    points = geom.GetPoints()
+    if not points:
+        return np.empty((0, 2))
+    return np.array(points, dtype=np.float64)[:, :2]
+
+
 def delta_code_coordinates(coords: IntCoords):
     """Convert coordinates to delta code coordinates."""
     delta_x = [coords[0][0]]
@@ -1,5 +1,12 @@
 from .geodiff import diff_points, diff_linestrings
-from .types import LSPatch
-from .errors import GeometryTypeMismatchError
+from .types import ArrayPatch, LSPatch
+from .errors import EditDistanceExceededError, GeometryTypeMismatchError
 
-__all__ = ("LSPatch", "GeometryTypeMismatchError", "diff_points", "diff_linestrings")
+__all__ = (
+    "ArrayPatch",
+    "LSPatch",
+    "EditDistanceExceededError",
+    "GeometryTypeMismatchError",
+    "diff_points",
+    "diff_linestrings",
+)
@@ -0,0 +1,518 @@
+# vim: foldlevel=0
+"""Myers diff over NumPy coordinate arrays.
+
+This is the same algorithm as `geodiff._find_middle_snake` and
+`geodiff._shortest_edit_script`, written for long linestrings:
+
+* Vertices are compared as integer coordinates in units of 100 nano degrees,
+  the resolution of the gisevents messages.
+* Each distinct vertex is mapped to a single integer key up front, so a
+  vertex comparison is one integer comparison.
+* The common prefix and suffix are stripped before the search.
+* Subsequences are addressed by index ranges into the original arrays
+  instead of by slices, and the divide and conquer runs on an explicit
+  stack, so deep splits neither copy the input nor recurse.
+* An optional cutoff on the edit distance stops the search after the
+  D-steps that could find a script within it.
+* Once a D-step spans enough diagonals, all of its diagonals are extended
+  at once with array operations, and long snakes are followed with
+  vectorized comparisons of growing chunks of the key arrays.
+
+Short subsequences are still searched one diagonal at a time, where plain
+Python is faster than NumPy.
+"""
+from typing import Any, Optional, Sequence
+
+import numpy as np
+import numpy.typing as npt
+
+from thesis.geodiff.errors import EditDistanceExceededError
+from thesis.geodiff.types import EditScript, Vector2D
+
+CoordinateArray = npt.NDArray[np.int64]  # shape (N, 2)
+KeyArray = npt.NDArray[np.int64]  # shape (N,)
+
+_FIRST_CHUNK = 16
+# Number of snake steps taken in lockstep on all diagonals
+_LOCKSTEP = 4
+# Below this number of diagonals per D-step the search is done in Python
+_MIN_VECTOR_DIAGONALS = 64
+# Subsequences with fewer vertices in total are searched in Python
+_MIN_VECTOR_LENGTH = 1024
+
+
+def to_coordinate_array(coords) -> CoordinateArray:
+    """Convert coordinates in degrees to an integer array of 100 nano degrees.
+
+    Truncates like `thesis.geo.to100nano`.
+    """
+    arr = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    return (arr * 10**7).astype(np.int64)
+
+
+def vertex_keys(a: CoordinateArray, b: CoordinateArray) -> tuple[KeyArray, KeyArray]:
+    """Map every vertex of 'a' and 'b' to an integer key.
+
+    Two vertices get the same key if and only if they are equal.
+    """
+    both = np.concatenate((a.reshape(-1, 2), b.reshape(-1, 2))).astype(np.int64)
+    if len(both) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+    int32 = np.iinfo(np.int32)
+    if both.min() >= int32.min and both.max() <= int32.max:
+        # Coordinates in degrees always fit: pack both halves into one int64.
+        keys = (both[:, 0] << 32) | (both[:, 1] & 0xFFFFFFFF)
+    else:
+        _, inverse = np.unique(both, axis=0, return_inverse=True)
+        keys = inverse.reshape(-1).astype(np.int64)
+    return keys[: len(a)], keys[len(a) :]
+
+
+class _Keys:
+    """Key arrays of both sequences, as NumPy arrays and as lists.
+
+    The lists give fast scalar access while the edit graph is searched one
+    diagonal at a time.
+    """
+
+    def __init__(self, a: KeyArray, b: KeyArray):
+        self.a = a
+        self.b = b
+        self.a_list: list[int] = a.tolist()
+        self.b_list: list[int] = b.tolist()
+
+    def forward_match(self, i: int, j: int, limit: int) -> int:
+        """Length of the common run of a[i:] and b[j:], at most 'limit'."""
+        n = 0
+        chunk = _FIRST_CHUNK
+        while n < limit:
+            k = min(chunk, limit - n)
+            eq = self.a[i + n : i + n + k] == self.b[j + n : j + n + k]
+            if not eq.all():
+                return n + int(np.argmin(eq))
+            n += k
+            chunk *= 2
+        return limit
+
+    def backward_match(self, i: int, j: int, limit: int) -> int:
+        """Length of the common run of a[:i] and b[:j] read backwards."""
+        n = 0
+        chunk = _FIRST_CHUNK
+        while n < limit:
+            k = min(chunk, limit - n)
+            eq = self.a[i - n - k : i - n] == self.b[j - n - k : j - n]
+            if not eq.all():
+                return n + int(np.argmin(eq[::-1]))
+            n += k
+            chunk *= 2
+        return limit
+
+    def forward_snakes(self, i: KeyArray, j: KeyArray, limit: KeyArray) -> KeyArray:
+        """Follow the snakes starting at a[i] and b[j] on all diagonals at once.
+
+        Most snakes in an edit graph are short. They are followed in lockstep
+        for a few steps; the remaining long snakes are followed one at a time
+        with chunked comparisons.
+        """
+        n = np.zeros_like(limit)
+        active = np.flatnonzero(limit > 0)
+        for _ in range(_LOCKSTEP):
+            if active.size == 0:
+                return n
+            eq = self.a[i[active] + n[active]] == self.b[j[active] + n[active]]
+            active = active[eq]
+            n[active] += 1
+            active = active[n[active] < limit[active]]
+        for t in active.tolist():
+            n[t] += self.forward_match(
+                int(i[t] + n[t]), int(j[t] + n[t]), int(limit[t] - n[t])
+            )
+        return n
+
+    def backward_snakes(self, i: KeyArray, j: KeyArray, limit: KeyArray) -> KeyArray:
+        """Like `forward_snakes`, following a[:i] and b[:j] backwards."""
+        n = np.zeros_like(limit)
+        active = np.flatnonzero(limit > 0)
+        for _ in range(_LOCKSTEP):
+            if active.size == 0:
+                return n
+            eq = (
+                self.a[i[active] - n[active] - 1]
+                == self.b[j[active] - n[active] - 1]
+            )
+            active = active[eq]
+            n[active] += 1
+            active = active[n[active] < limit[active]]
+        for t in active.tolist():
+            n[t] += self.backward_match(
+                int(i[t] - n[t]), int(j[t] - n[t]), int(limit[t] - n[t])
+            )
+        return n
+
+    def equal(self, ax: int, N: int, by: int, M: int) -> bool:
+        if N != M:
+            return False
+        if N < _MIN_VECTOR_LENGTH:
+            return self.a_list[ax : ax + N] == self.b_list[by : by + M]
+        return bool(np.array_equal(self.a[ax : ax + N], self.b[by : by + M]))
+
+
+Snake = tuple[int, int, int, int, int]
+Range = tuple[int, int, int, int]  # ax, N, by, M
+
+
+def _find_middle_snake(
+    keys: _Keys, ax: int, N: int, by: int, M: int, max_d: Optional[int] = None
+) -> Snake:
+    """Find the middle snake of a[ax:ax+N] and b[by:by+M].
+
+    See `geodiff._find_middle_snake`. The returned coordinates are relative
+    to (ax, by).
+
+    Raises
+    ------
+    EditDistanceExceededError
+        If 'max_d' is given and the edit distance is larger.
+    """
+    if N + M < _MIN_VECTOR_LENGTH:
+        snake = _find_middle_snake_scalar(keys, ax, N, by, M, max_d)
+    else:
+        snake = _find_middle_snake_vector(keys, ax, N, by, M, max_d)
+    if snake is None or (max_d is not None and snake[0] > max_d):
+        raise EditDistanceExceededError(max_d)
+    return snake
+
+
+def _last_step(N: int, M: int, max_d: Optional[int]) -> int:
+    """The last D-step to search. A D-path in both directions has length 2D."""
+    max_D = (M + N + 1) // 2
+    if max_d is None:
+        return max_D
+    return min(max_D, (max_d + 1) // 2)
+
+
+def _find_middle_snake_scalar(
+    keys: _Keys, ax: int, N: int, by: int, M: int, max_d: Optional[int] = None
+) -> Optional[Snake]:
+    """`geodiff._find_middle_snake` on index ranges of the key lists."""
+    a = keys.a_list
+    b = keys.b_list
+    max_D = (M + N + 1) // 2
+    delta = N - M
+    vf = [-1] * (2 * max_D + 2)
+    vf[1] = 0
+    vb = vf[:]
+    check_forward = delta % 2 == 1
+    for D in range(0, _last_step(N, M, max_d) + 1):
+        kstart = -(D - 2 * max(0, D - M))
+        kend = D - 2 * max(0, D - N) + 1
+        for kf in range(kstart, kend, 2):
+            if kf == -D or (kf != D and vf[kf - 1] < vf[kf + 1]):
+                xf = vf[kf + 1]
+            else:
+                xf = vf[kf - 1] + 1
+            yf = xf - kf
+            x = xf
+            y = yf
+            while xf < N and yf < M and a[ax + xf] == b[by + yf]:
+                xf += 1
+                yf += 1
+            vf[kf] = xf
+            if check_forward and delta - (D - 1) <= kf <= delta + (D - 1):
+                if N - vb[delta - kf] <= xf:
+                    return 2 * D - 1, x, y, xf, yf
+        for kb in range(kstart, kend, 2):
+            if kb == -D or (kb != D and vb[kb - 1] < vb[kb + 1]):
+                xb = vb[kb + 1]
+            else:
+                xb = vb[kb - 1] + 1
+            yb = xb - kb
+            u = N - xb
+            v = M - yb
+            while xb < N and yb < M and a[ax + N - 1 - xb] == b[by + M - 1 - yb]:
+                xb += 1
+                yb += 1
+            vb[kb] = xb
+            if not check_forward and -D <= kb - delta <= D:
+                if vf[delta - kb] >= N - xb:
+                    return 2 * D, N - xb, M - yb, u, v
+
+    if max_d is None:
+        raise RuntimeError("Should not reach this code")
+    return None
+
+
+def _find_middle_snake_vector(
+    keys: _Keys, ax: int, N: int, by: int, M: int, max_d: Optional[int] = None
+) -> Optional[Snake]:
+    """`_find_middle_snake` for long sequences.
+
+    Within one D-step the furthest reaching paths are only read from
+    diagonals of the other parity, which were written in the previous step.
+    The diagonals of a step are therefore independent, and once there are
+    enough of them they are processed with array operations. When several
+    diagonals overlap, the one with the lowest k is chosen, as in the
+    sequential version.
+    """
+    max_D = (M + N + 1) // 2
+    delta = N - M
+    # v[off + k] is the x of the furthest reaching path in diagonal k
+    off = max_D + 1
+    vf: Any = [-1] * (2 * max_D + 3)
+    vf[off + 1] = 0
+    vb: Any = vf[:]
+    check_forward = delta % 2 == 1
+    step = _scalar_step
+    for D in range(0, _last_step(N, M, max_d) + 1):
+        kstart = -(D - 2 * max(0, D - M))  # inclusive
+        kend = D - 2 * max(0, D - N) + 1  # exclusive
+        if step is _scalar_step and kend - kstart >= 2 * _MIN_VECTOR_DIAGONALS:
+            # Enough diagonals to pay for array operations from now on
+            vf = np.array(vf, dtype=np.int64)
+            vb = np.array(vb, dtype=np.int64)
+            step = _vector_step
+        snake = step(keys, ax, N, by, M, D, kstart, kend, off, vf, vb, check_forward)
+        if snake is not None:
+            return snake
+        snake = step(
+            keys, ax, N, by, M, D, kstart, kend, off, vb, vf, not check_forward, True
+        )
+        if snake is not None:
+            return snake
+
+    if max_d is None:
+        raise RuntimeError("Should not reach this code")
+    return None
+
+
+def _scalar_step(
+    keys: _Keys,
+    ax: int,
+    N: int,
+    by: int,
+    M: int,
+    D: int,
+    kstart: int,
+    kend: int,
+    off: int,
+    v: list[int],
+    v_other: list[int],
+    check: bool,
+    backward: bool = False,
+) -> Optional[Snake]:
+    """Extend the furthest reaching D-paths one diagonal at a time.
+
+    Works on the forward paths 'v', or on the backward paths when 'backward'
+    is set. 'v_other' holds the paths in the opposite direction.
+    """
+    a = keys.a_list
+    b = keys.b_list
+    delta = N - M
+    for k in range(kstart, kend, 2):
+        below = v[off + k - 1]
+        above = v[off + k + 1]
+        if k == -D or (k != D and below < above):
+            x = above
+        else:
+            x = below + 1
+        y = x - k
+        if not backward:
+            # Record snake start. Ref (u,v) in [1]
+            xs, ys = x, y
+            if x < N and y < M and a[ax + x] == b[by + y]:
+                n = keys.forward_match(ax + x, by + y, min(N - x, M - y))
+                x += n
+                y += n
+            v[off + k] = x
+            if check and delta - (D - 1) <= k <= delta + (D - 1):
+                if N - v_other[off + delta - k] <= x:
+                    return 2 * D - 1, xs, ys, x, y
+        else:
+            u = N - x
+            w = M - y
+            if x < N and y < M and a[ax + u - 1] == b[by + w - 1]:
+                n = keys.backward_match(ax + u, by + w, min(u, w))
+                x += n
+                y += n
+            v[off + k] = x
+            if check and -D <= k - delta <= D:
+                if v_other[off + delta - k] >= N - x:
+                    return 2 * D, N - x, M - y, u, w
+    return None
+
+
+def _vector_step(
+    keys: _Keys,
+    ax: int,
+    N: int,
+    by: int,
+    M: int,
+    D: int,
+    kstart: int,
+    kend: int,
+    off: int,
+    v: KeyArray,
+    v_other: KeyArray,
+    check: bool,
+    backward: bool = False,
+) -> Optional[Snake]:
+    """Like `_scalar_step`, processing all diagonals with array operations."""
+    delta = N - M
+    ks = np.arange(kstart, kend, 2, dtype=np.int64)
+    # window[t] == v[off + kstart - 1 + t]
+    window = v[off + kstart - 1 : off + kend + 1]
+    below = window[ks - kstart]  # v[k - 1]
+    above = window[ks - kstart + 2]  # v[k + 1]
+    down = (ks == -D) | ((ks != D) & (below < above))
+    x = np.where(down, above, below + 1)
+    y = x - ks
+    if not backward:
+        xe = x + keys.forward_snakes(ax + x, by + y, np.minimum(N - x, M - y))
+    else:
+        u = N - x
+        w = M - y
+        xe = x + keys.backward_snakes(ax + u, by + w, np.minimum(u, w))
+    v[off + kstart : off + kend : 2] = xe
+    if not check:
+        return None
+
+    # Opposite paths are only read on diagonals with |k| <= D, see the
+    # ranges checked in `_scalar_step`.
+    lo = -D
+    other = v_other[off + lo : off + D + 1]
+    if not backward:
+        in_range = (delta - (D - 1) <= ks) & (ks <= delta + (D - 1))
+        opposite = np.where(in_range, delta - ks - lo, 0)
+        overlap = in_range & (N - other[opposite] <= xe)
+    else:
+        in_range = (-D <= ks - delta) & (ks - delta <= D)
+        opposite = np.where(in_range, delta - ks - lo, 0)
+        overlap = in_range & (other[opposite] >= N - xe)
+    if not overlap.any():
+        return None
+    t = int(np.argmax(overlap))
+    k = int(ks[t])
+    end = int(xe[t])
+    if not backward:
+        return 2 * D - 1, int(x[t]), int(y[t]), end, end - k
+    return 2 * D, N - end, M - (end - k), int(u[t]), int(w[t])
+
+
+def _leaf_or_split(
+    keys: _Keys,
+    ax: int,
+    N: int,
+    by: int,
+    M: int,
+    b_values: Sequence[Vector2D],
+    max_d: Optional[int] = None,
+) -> tuple[EditScript, Optional[tuple[Range, Range]]]:
+    """Solve a subproblem directly, or split it at its middle snake.
+
+    Returns the edit script of the subproblem, or the two subproblems on
+    either side of the middle snake. See `geodiff._shortest_edit_script`.
+    """
+    if max_d is not None and abs(N - M) > max_d:
+        # At least |N - M| vertices have to be inserted or deleted
+        raise EditDistanceExceededError(max_d)
+    if keys.equal(ax, N, by, M):
+        return [], None
+    if N == 0:
+        return [(ax - 1, "insert", b_values[by + j]) for j in range(M)], None
+    if M == 0:
+        return [(ax + i, "delete") for i in range(N)], None
+
+    D, x, y, u, v = _find_middle_snake(keys, ax, N, by, M, max_d)
+    if D > 1 or (x != u and y != v):
+        return [], ((ax, x, by, y), (ax + u, N - u, by + v, M - v))
+    elif M > N:
+        return [((N - 1) + ax, "insert", b_values[by + j]) for j in range(N, M)], None
+    else:
+        return [(i + ax, "delete") for i in range(M, N)], None
+
+
+def _shortest_edit_script(
+    keys: _Keys,
+    ax: int,
+    N: int,
+    by: int,
+    M: int,
+    b_values: Sequence[Vector2D],
+    max_d: Optional[int] = None,
+) -> EditScript:
+    """Divide and conquer over an explicit stack instead of recursion.
+
+    Subproblems are solved left to right, so the edit script comes out in
+    the same order as from the recursive version. The edit distances of the
+    subproblems add up to the distance found by the first middle snake, so
+    only the first search needs the cutoff 'max_d'.
+    """
+    script: list = []
+    stack: list[Range] = [(ax, N, by, M)]
+    while stack:
+        commands, halves = _leaf_or_split(keys, *stack.pop(), b_values, max_d)
+        max_d = None
+        if halves is None:
+            script.extend(commands)
+        else:
+            left, right = halves
+            stack.append(right)
+            stack.append(left)
+    return script
+
+
+def shortest_edit_script(
+    a: CoordinateArray,
+    b: CoordinateArray,
+    b_values: Sequence[Vector2D],
+    trim: bool = True,
+    max_d: Optional[int] = None,
+) -> EditScript:
+    """Calculate the shortest edit script that transforms 'a' into 'b'.
+
+    Unless 'trim' is false, the common prefix and suffix of 'a' and 'b' are
+    stripped in bulk first, and only the differing core is searched.
+
+    Parameters
+    ----------
+    a, b : (N, 2) integer arrays
+        Vertices of the two linestrings in units of 100 nano degrees.
+    b_values : sequence of coordinate tuples
+        The values used in insert commands. b_values[i] is the value of
+        vertex b[i].
+    trim : bool
+        Strip the common prefix and suffix before searching.
+    max_d : int, optional
+        Give up once it is clear that the edit script would have more than
+        'max_d' commands.
+
+    Returns
+    -------
+    EditScript
+        Without trimming, the same edit script as
+        `geodiff._shortest_edit_script` returns for the corresponding point
+        sequences. With trimming the script has the same length, but the
+        search may pick a different one of several equally short scripts.
+
+    Raises
+    ------
+    EditDistanceExceededError
+        If the edit script would be longer than 'max_d'.
+    """
+    ka, kb = vertex_keys(a, b)
+    keys = _Keys(ka, kb)
+    N, M = len(ka), len(kb)
+    prefix = suffix = 0
+    if trim:
+        prefix = keys.forward_match(0, 0, min(N, M))
+        suffix = keys.backward_match(N, M, min(N, M) - prefix)
+    return _shortest_edit_script(
+        keys,
+        prefix,
+        N - prefix - suffix,
+        prefix,
+        M - prefix - suffix,
+        b_values,
+        max_d,
+    )
@@ -17,3 +17,14 @@ class UnexpectedEditCommandTypeError(Exception):
 
     def __str__(self):
         return f"Unexpected command type '{self._op}'. Expected 'insert' or 'delete'"
+
+
+class EditDistanceExceededError(Exception):
+    _max_d: int
+
+    def __init__(self, max_d: int):
+        self._max_d = max_d
+        super().__init__(max_d)
+
+    def __str__(self):
+        return f"Edit distance exceeds the cutoff of {self._max_d} commands"
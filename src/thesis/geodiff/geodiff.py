@@ -1,24 +1,34 @@
 # vim: foldlevel=0
 from itertools import chain
-from typing import cast
-
-from shapely import GeometryType, LineString, Point, from_wkt, get_type_id
+from typing import Optional
+
+import numpy as np
+from shapely import (
+    Geometry,
+    GeometryType,
+    from_wkb,
+    from_wkt,
+    get_coordinates,
+    get_type_id,
+)
 
+from thesis.geodiff import arraydiff
 from thesis.geodiff.errors import (
     GeometryTypeMismatchError,
     UnexpectedEditCommandTypeError,
 )
 from thesis.geodiff.types import (
+    CHANGE,
+    DELETE,
+    INSERT,
+    OP_CODES,
+    ArrayPatch,
+    CoordinateArray,
     EditScript,
-    LSPatch,
+    GeometryLike,
+    OgrGeometry,
     PointSequence,
-    Vector2D,
     Wkt,
-    is_change_command,
-    is_delete_command,
-    is_insert_command,
-    is_point_sequence,
-    is_valid_edit_command,
 )
 
 
@@ -31,6 +41,45 @@ def _validate_diff_input(a: Wkt, b: Wkt):
         raise GeometryTypeMismatchError(geom_a, geom_b)
 
 
+def _parse(geom: GeometryLike) -> Geometry | OgrGeometry | CoordinateArray:
+    """Parse WKT and WKB with shapely. Other inputs are returned as they are."""
+    if isinstance(geom, Wkt):
+        return from_wkt(geom)
+    if isinstance(geom, (bytes, bytearray, memoryview)):
+        return from_wkb(bytes(geom))
+    return geom
+
+
+def _geometry_name(geom: Geometry | OgrGeometry | CoordinateArray) -> Optional[str]:
+    """Upper case geometry type name of 'geom', or None for bare coordinates."""
+    if isinstance(geom, np.ndarray):
+        return None
+    if isinstance(geom, Geometry):
+        return geom.geom_type.upper()
+    return geom.GetGeometryName().upper()
+
+
+def _coordinates(geom: Geometry | OgrGeometry | CoordinateArray) -> CoordinateArray:
+    """Vertices of 'geom' as an (N, 2) array of degrees.
+
+    OGR geometries are read with `GetPoints` and shapely geometries with
+    `get_coordinates`, so no text or binary format is produced on the way.
+    """
+    if isinstance(geom, np.ndarray):
+        return geom.reshape(-1, 2)
+    if isinstance(geom, Geometry):
+        return get_coordinates(geom)
+    points = geom.GetPoints()
+    if not points:
+        return np.empty((0, 2))
+    # Drop Z when present
+    return np.array(points, dtype=np.float64)[:, :2]
+
+
+def _as_tuples(coords: CoordinateArray) -> PointSequence:
+    return list(zip(*coords.T.tolist()))
+
+
 def diff(a: Wkt, b: Wkt):
     """Calculate a diff between geometries 'a' and 'b'
 
@@ -73,51 +122,75 @@ def diff(a: Wkt, b: Wkt):
             )
 
 
-def diff_linestrings(a: LineString | Wkt, b: LineString | Wkt) -> LSPatch:
-    """Calculate a diff between linestrings 'a' and 'b'"""
-    if isinstance(a, Wkt):
-        a = cast(LineString, from_wkt(a))
-    if isinstance(b, Wkt):
-        b = cast(LineString, from_wkt(b))
+def diff_linestrings(
+    a: GeometryLike, b: GeometryLike, max_d: Optional[int] = None
+) -> ArrayPatch:
+    """Calculate a diff between linestrings 'a' and 'b'
+
+    Vertices are compared at a resolution of 100 nano degrees. See
+    `arraydiff`. The patch is in the same unit: applied to the quantized
+    vertices of 'a' it gives exactly the quantized vertices of 'b'.
 
-    linestring_types = ["LineString", "LinearRing"]
-    if (
-        a.geom_type not in linestring_types
-        or b.geom_type not in linestring_types
-        or a.geom_type != b.geom_type
+    Parameters
+    ----------
+    a, b : LineString or LinearRing
+        As shapely or OGR geometries, WKT, WKB or (N, 2) coordinate arrays
+        in degrees. Arrays are not type checked.
+    max_d : int, optional
+        Cutoff on the edit distance, i.e. the number of vertices to insert
+        and delete. When a patch would need more, the search gives up early.
+        Without a cutoff the diff is always computed.
+
+    Raises
+    ------
+    EditDistanceExceededError
+        If the edit distance between 'a' and 'b' is larger than 'max_d'.
+    """
+    a = _parse(a)
+    b = _parse(b)
+    type_a = _geometry_name(a)
+    type_b = _geometry_name(b)
+    linestring_types = ["LINESTRING", "LINEARRING"]
+    if (type_a, type_b) != (None, None) and (
+        type_a not in linestring_types
+        or type_b not in linestring_types
+        or type_a != type_b
     ):
-        raise GeometryTypeMismatchError(a.geom_type, b.geom_type)
+        raise GeometryTypeMismatchError(str(type_a), str(type_b))
 
-    if a.is_empty and b.is_empty:
-        return []
-    if a.equals_exact(b, tolerance=1e-7):
-        return []
-    coords_a = cast(PointSequence, list(a.coords))
-    coords_b = cast(PointSequence, list(b.coords))
-    ses = _shortest_edit_script(coords_a, coords_b, 0, 0)
-    patch = _clean_up_edit_script(ses, coords_a)
-    return patch
+    coords_a = _coordinates(a)
+    coords_b = _coordinates(b)
+    int_a = arraydiff.to_coordinate_array(coords_a)
+    int_b = arraydiff.to_coordinate_array(coords_b)
+    if np.array_equal(int_a, int_b):
+        return ArrayPatch.from_commands([])
+    ses = arraydiff.shortest_edit_script(int_a, int_b, _as_tuples(int_b), max_d=max_d)
+    return _clean_up_edit_script(ses, int_a)
 
 
-def diff_points(a: Point | Wkt, b: Point | Wkt) -> tuple[float, float]:
+def diff_points(a: GeometryLike, b: GeometryLike) -> tuple[float, float]:
     """Calculate a diff between two points
     Parameters
     ----------
-    a, b : shapely.Point
+    a, b : Point
+        As shapely or OGR geometries, WKT, WKB or coordinate arrays.
 
     Returns
     -------
     tuple
         The return value is a 2D vector representation the difference.
     """
-    if isinstance(a, Wkt):
-        a = cast(Point, from_wkt(a))
-    if isinstance(b, Wkt):
-        b = cast(Point, from_wkt(b))
-
-    if a.geom_type != "Point" or b.geom_type != "Point":
+    a = _parse(a)
+    b = _parse(b)
+    for geom in (a, b):
+        if _geometry_name(geom) not in ("POINT", None):
+            raise ValueError("Both arguments must be of type Point.")
+    coords_a = _coordinates(a)
+    coords_b = _coordinates(b)
+    if len(coords_a) != 1 or len(coords_b) != 1:
         raise ValueError("Both arguments must be of type Point.")
-    return (b.x - a.x, b.y - a.y)
+    (xa, ya), (xb, yb) = coords_a.tolist()[0], coords_b.tolist()[0]
+    return (xb - xa, yb - ya)
 
 
 # TODO: Complete docstring for D
@@ -282,7 +355,9 @@ def _shortest_edit_script(
         return [(i + cur_x, "delete") for i in range(M, N)]
 
 
-def _clean_up_edit_script(edit_script: EditScript, old_state: PointSequence) -> LSPatch:
+def _clean_up_edit_script(
+    edit_script: EditScript, old_state: PointSequence | CoordinateArray
+) -> ArrayPatch:
     """Clean up edit script
 
     Merge consecutive insert/delete commands into a single change command.
@@ -293,50 +368,41 @@ def _clean_up_edit_script(edit_script: EditScript, old_state: PointSequence) ->
         [(0, 'delete'), (0, 'insert', (3,3))]
         We want to return:
         [(0, 'change', (2,2))]
+
+    The commands are converted to op codes once, and the change vectors are
+    computed for all merged commands at once. The values of the edit script
+    and 'old_state' are integers in units of 100 nano degrees, see
+    `arraydiff.to_coordinate_array`.
     """
     # TODO: implement change ranges
-    # commands: list[EditCommand] = []  # to remember commands
-    patch = []  # store processed commands
-    for _, cmd in enumerate(edit_script):
-        if len(patch) == 0:
-            if is_valid_edit_command(cmd):
-                patch.append(cmd)
-                continue
-            else:
-                raise UnexpectedEditCommandTypeError(cmd[1])
-        prev_cmd = patch[-1]
-        if is_insert_command(prev_cmd):
-            if is_insert_command(cmd):
-                # TODO: Chain insert commands
-                patch.append(cmd)
-                continue
-            if is_delete_command(cmd):
-                if cmd[0] == prev_cmd[0] + 1:
-                    # Merge insert/delete into change command
-                    old_val = old_state[cmd[0]]
-                    new_val = prev_cmd[2]
-                    change_val = (new_val[0] - old_val[0], new_val[1] - old_val[1])
-                    # Add change command to result. Replace previous insert command
-                    patch[-1] = (cmd[0], "change", change_val)
-                    continue
-                patch.append(cmd)
-        elif is_delete_command(prev_cmd):
-            if is_delete_command(cmd):
-                # TODO: Chain delete commands
-                patch.append(cmd)
-                continue
-            if is_insert_command(cmd):
-                if cmd[0] == prev_cmd[0]:
-                    # Merge insert/delete into change command
-                    old_val = old_state[cmd[0]]
-                    new_val = cmd[2]
-                    change_val = (new_val[0] - old_val[0], new_val[1] - old_val[1])
-                    # Add change command to result. Replace previous delete command
-                    patch[-1] = (cmd[0], "change", change_val)
-                    continue
-                patch.append(cmd)
-        elif is_change_command(prev_cmd):
-            patch.append(cmd)
-        else:
+    ops: list[int] = []
+    index: list[int] = []
+    # Row in 'values' of the inserted value of each command
+    sources: list[int] = []
+    values = []
+    for row, cmd in enumerate(edit_script):
+        op = OP_CODES.get(cmd[1], CHANGE)
+        if op == CHANGE or len(cmd) != (3 if op == INSERT else 2):
             raise UnexpectedEditCommandTypeError(cmd[1])
-    return list(patch)
+        i = cmd[0]
+        values.append(cmd[2] if op == INSERT else (0, 0))  # type: ignore
+        if ops and ops[-1] == INSERT and op == DELETE and i == index[-1] + 1:
+            # Merge insert/delete into change command
+            ops[-1] = CHANGE
+            index[-1] = i
+            continue
+        if ops and ops[-1] == DELETE and op == INSERT and i == index[-1]:
+            # Merge delete/insert into change command
+            ops[-1] = CHANGE
+            sources[-1] = row
+            continue
+        ops.append(op)
+        index.append(i)
+        sources.append(row)
+
+    patch = ArrayPatch(ops, index, np.asarray(values).reshape(-1, 2)[sources])
+    changes = patch.ops == CHANGE
+    if changes.any():
+        old_values = np.asarray(old_state).reshape(-1, 2)[patch.index[changes]]
+        patch.vectors[changes] -= old_values
+    return patch
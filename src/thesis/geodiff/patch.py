@@ -1,9 +1,15 @@
 from collections import deque
 from typing import Deque
 
-from thesis.geodiff.types import (LSPatch, PointSequence, Vector2D,
-                                  is_change_command, is_delete_command,
-                                  is_insert_command)
+from thesis.geodiff.types import (
+    DELETE,
+    INSERT,
+    OP_CODES,
+    ArrayPatch,
+    LSPatch,
+    PointSequence,
+    Vector2D,
+)
 
 
 def apply_patch(patch: LSPatch, points: PointSequence) -> PointSequence:
@@ -13,27 +19,31 @@ def apply_patch(patch: LSPatch, points: PointSequence) -> PointSequence:
     point_sequence : PointSequence
         Sequence of points
     patch : Patch
-        Sequence of patch commands
+        An `ArrayPatch` or a sequence of patch commands, in the unit of
+        'points'
     Returns
     -------
     PointSequence
         The sequence of points after applying the patch
     """
-    N = len(points)
-    idxMap: dict[int, int] = {}
+    if isinstance(patch, ArrayPatch):
+        commands = list(
+            zip(patch.ops.tolist(), patch.index.tolist(), patch.vectors.tolist())
+        )
+    else:
+        # Command tuples may hold values in degrees, keep them as they are
+        commands = [(OP_CODES[cmd[1]], cmd[0], cmd[-1]) for cmd in patch]
     result: Deque[Vector2D] = deque(points)
     # Reverse the patch
-    for _, cmd in enumerate(reversed(patch)):
-        i = cmd[0]
-        if is_insert_command(cmd):
+    for op, i, vector in reversed(commands):
+        if op == INSERT:
             # Insert cmd to result, after index i:
-            result.insert(i + 1, cmd[2])
-        if is_delete_command(cmd):
+            result.insert(i + 1, tuple(vector))
+        elif op == DELETE:
             del result[i]
-        if is_change_command(cmd):
+        else:
             # Change cmd to result at index i:
-            diff = cmd[2]
-            result[i] = add_difference(result[i], diff)
+            result[i] = add_difference(result[i], vector)
     return list(result)
 
 
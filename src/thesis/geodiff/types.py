@@ -1,6 +1,12 @@
-from typing import Literal, Sequence, TypeGuard
+from collections.abc import Iterable, Iterator
+from typing import Literal, Optional, Protocol, Sequence, TypeGuard, overload
+
+import numpy as np
+import numpy.typing as npt
+from shapely import Geometry
 
 Wkt = str
+Wkb = bytes
 Vector2D = tuple[float, float]
 InsertCommand = tuple[int, Literal["insert"], Vector2D]  # (0, 'insert', (1,1))
 DeleteCommand = tuple[int, Literal["delete"]]  # (2, 'delete')
@@ -11,6 +17,113 @@ EditScript = Sequence[EditCommand]
 LSPatch = Sequence[PatchCommand]  # LineString Patch
 PointSequence = Sequence[Vector2D]
 
+# Op codes of `ArrayPatch`, the same as the values of
+# `gisevents.LineStringPatch.Command`
+INSERT = 0
+DELETE = 1
+CHANGE = 2
+OP_CODES = {"insert": INSERT, "delete": DELETE, "change": CHANGE}
+OP_NAMES = {code: name for name, code in OP_CODES.items()}
+
+
+class ArrayPatch(Sequence[PatchCommand]):
+    """A linestring patch stored as parallel NumPy arrays.
+
+    'ops' holds the op code of every command, see `OP_CODES`, 'index' its
+    index and 'vectors' its value as an (N, 2) int64 array in units of 100
+    nano degrees, zero for deletes. Integer vectors add up exactly, so a
+    patch applied to quantized coordinates gives the quantized target.
+
+    Items are the commands as tuples, like in an `LSPatch`, and a patch
+    equals any sequence of the same commands.
+    """
+
+    __slots__ = ("ops", "index", "vectors")
+
+    def __init__(self, ops, index, vectors):
+        self.ops = np.asarray(ops, dtype=np.int8)
+        self.index = np.asarray(index, dtype=np.int64)
+        vectors = np.asarray(vectors).reshape(-1, 2)
+        if vectors.dtype.kind == "f" and not np.array_equal(np.trunc(vectors), vectors):
+            raise ValueError("The vectors of a patch must be integers.")
+        self.vectors = vectors.astype(np.int64, copy=False)
+        if not len(self.ops) == len(self.index) == len(self.vectors):
+            raise ValueError("The arrays of a patch must have the same length.")
+
+    @classmethod
+    def from_commands(cls, commands: Iterable[PatchCommand]) -> "ArrayPatch":
+        """Convert a sequence of command tuples.
+
+        Raises a ValueError on unknown commands and on values that are not
+        integers.
+        """
+        ops = []
+        index = []
+        vectors = []
+        for cmd in commands:
+            try:
+                ops.append(OP_CODES[cmd[1]])
+            except (KeyError, IndexError, TypeError):
+                raise ValueError(f"Invalid patch command: {cmd}")
+            index.append(cmd[0])
+            vectors.append(cmd[2] if len(cmd) == 3 else (0, 0))  # type: ignore
+        return cls(ops, index, vectors if vectors else np.empty((0, 2), np.int64))
+
+    def __len__(self) -> int:
+        return len(self.ops)
+
+    @overload
+    def __getitem__(self, i: int) -> PatchCommand:
+        ...
+
+    @overload
+    def __getitem__(self, i: slice) -> "ArrayPatch":
+        ...
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return ArrayPatch(self.ops[i], self.index[i], self.vectors[i])
+        return _command(
+            int(self.ops[i]), int(self.index[i]), tuple(self.vectors[i].tolist())
+        )
+
+    def __iter__(self) -> Iterator[PatchCommand]:
+        vectors = map(tuple, self.vectors.tolist())
+        return map(_command, self.ops.tolist(), self.index.tolist(), vectors)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return len(self) == len(other) and all(
+            a == b for a, b in zip(self, other)
+        )
+
+    __hash__ = None  # type: ignore
+
+    def __repr__(self) -> str:
+        return f"ArrayPatch({list(self)!r})"
+
+
+def _command(op: int, index: int, vector: Vector2D) -> PatchCommand:
+    if op == DELETE:
+        return (index, "delete")
+    return (index, OP_NAMES[op], vector)  # type: ignore
+
+
+class OgrGeometry(Protocol):
+    """The part of `osgeo.ogr.Geometry` used to read coordinates."""
+
+    def GetGeometryName(self) -> str:
+        ...
+
+    def GetPoints(self) -> Optional[list[tuple[float, ...]]]:
+        ...
+
+
+# Coordinates in degrees, shape (N, 2)
+CoordinateArray = npt.NDArray[np.float64]
+GeometryLike = Geometry | OgrGeometry | Wkt | Wkb | CoordinateArray
+
 
 def is_insert_command(cmd) -> TypeGuard[InsertCommand]:
     if isinstance(cmd, tuple) and len(cmd) == 3:
@@ -12,7 +12,13 @@ from .gisevents_pb2 import (
     PropPatch,
     PropUpdate,
 )
-from .utils import to_linestring_message, to_point_message, to_polygon_message
+from .utils import (
+    coordinates_to_linestring_message,
+    coordinates_to_polygon_message,
+    to_linestring_message,
+    to_point_message,
+    to_polygon_message,
+)
 
 __all__ = (
     "CreationEvent",
@@ -27,6 +33,8 @@ __all__ = (
     "Properties",
     "PropPatch",
     "PropUpdate",
+    "coordinates_to_linestring_message",
+    "coordinates_to_polygon_message",
     "to_linestring_message",
     "to_point_message",
     "to_polygon_message",
@@ -15,7 +15,7 @@ _sym_db = _symbol_database.Default()
 from google.protobuf import timestamp_pb2 as google_dot_protobuf_dot_timestamp__pb2
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x19gisevents/gisevents.proto\x12\tgisevents\x1a\x1fgoogle/protobuf/timestamp.proto\"\xc9\x02\n\rCreationEvent\x12\x0e\n\x02id\x18\x01 \x01(\x03R\x02id\x12\x38\n\ttimestamp\x18\x02 \x01(\x0b\x32\x1a.google.protobuf.TimestampR\ttimestamp\x12\x18\n\x07version\x18\x03 \x01(\x05R\x07version\x12(\n\x05point\x18\x04 \x01(\x0b\x32\x10.gisevents.PointH\x00R\x05point\x12\x37\n\nlinestring\x18\x05 \x01(\x0b\x32\x15.gisevents.LineStringH\x00R\nlinestring\x12.\n\x07polygon\x18\x06 \x01(\x0b\x32\x12.gisevents.PolygonH\x00R\x07polygon\x12\x35\n\nproperties\x18\x07 \x01(\x0b\x32\x15.gisevents.PropertiesR\npropertiesB\n\n\x08geometry\"4\n\nProperties\x12\x10\n\x03key\x18\x01 \x03(\tR\x03key\x12\x14\n\x05value\x18\x02 \x03(\tR\x05value\"\xf6\x02\n\x11ModificationEvent\x12\x0e\n\x02id\x18\x01 \x01(\x03R\x02id\x12\x38\n\ttimestamp\x18\x02 \x01(\x0b\x32\x1a.google.protobuf.TimestampR\ttimestamp\x12\x18\n\x07version\x18\x03 \x01(\x05R\x07version\x12\x33\n\x0bpoint_patch\x18\x04 \x01(\x0b\x32\x10.gisevents.PointH\x00R\npointPatch\x12G\n\x10linestring_patch\x18\x05 \x01(\x0b\x32\x1a.gisevents.LineStringPatchH\x00R\x0flinestringPatch\x12\x41\n\rpolygon_patch\x18\x06 \x01(\x0b\x32\x1a.gisevents.LineStringPatchH\x00R\x0cpolygonPatch\x12\x33\n\nprop_patch\x18\x07 \x01(\x0b\x32\x14.gisevents.PropPatchR\tpropPatchB\x07\n\x05patch\"s\n\rDeletionEvent\x12\x0e\n\x02id\x18\x01 \x01(\x03R\x02id\x12\x38\n\ttimestamp\x18\x02 \x01(\x0b\x32\x1a.google.protobuf.TimestampR\ttimestamp\x12\x18\n\x07version\x18\x03 \x01(\x05R\x07version\"+\n\x05Point\x12\x10\n\x03lon\x18\x02 \x01(\x11R\x03lon\x12\x10\n\x03lat\x18\x01 \x01(\x11R\x03lat\"0\n\nLineString\x12\x10\n\x03lat\x18\x01 \x03(\x11R\x03lat\x12\x10\n\x03lon\x18\x02 \x03(\x11R\x03lon\"-\n\x07Polygon\x12\x10\n\x03lat\x18\x01 \x03(\x11R\x03lat\x12\x10\n\x03lon\x18\x02 \x03(\x11R\x03lon\"\xbe\x01\n\x0fLineStringPatch\x12\x14\n\x05index\x18\x01 \x03(\x05R\x05index\x12<\n\x07\x63ommand\x18\x02 \x03(\x0e\x32\".gisevents.LineStringPatch.CommandR\x07\x63ommand\x12(\n\x06vector\x18\x03 \x03(\x0b\x32\x10.gisevents.PointR\x06vector\"-\n\x07\x43ommand\x12\n\n\x06INSERT\x10\x00\x12\n\n\x06\x44\x45LETE\x10\x01\x12\n\n\x06\x43HANGE\x10\x02\"\xb3\x01\n\tPropPatch\x12\x36\n\x0bprop_delete\x18\x01 \x01(\x0b\x32\x15.gisevents.PropDeleteR\npropDelete\x12\x36\n\x0bprop_insert\x18\x02 \x01(\x0b\x32\x15.gisevents.PropInsertR\npropInsert\x12\x36\n\x0bprop_update\x18\x03 \x01(\x0b\x32\x15.gisevents.PropUpdateR\npropUpdate\"\x1e\n\nPropDelete\x12\x10\n\x03key\x18\x01 \x03(\tR\x03key\"4\n\nPropInsert\x12\x10\n\x03key\x18\x01 \x03(\tR\x03key\x12\x14\n\x05value\x18\x02 \x03(\tR\x05value\"4\n\nPropUpdate\x12\x10\n\x03key\x18\x01 \x03(\tR\x03key\x12\x14\n\x05value\x18\x02 \x03(\tR\x05valueBc\n\rcom.giseventsB\x0eGiseventsProtoP\x01\xa2\x02\x03GXX\xaa\x02\tGisevents\xca\x02\tGisevents\xe2\x02\x15Gisevents\\GPBMetadata\xea\x02\tGiseventsb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x19gisevents/gisevents.proto\x12\tgisevents\x1a\x1fgoogle/protobuf/timestamp.proto\"\xc9\x02\n\rCreationEvent\x12\x0e\n\x02id\x18\x01 \x01(\x03R\x02id\x12\x38\n\ttimestamp\x18\x02 \x01(\x0b\x32\x1a.google.protobuf.TimestampR\ttimestamp\x12\x18\n\x07version\x18\x03 \x01(\x05R\x07version\x12(\n\x05point\x18\x04 \x01(\x0b\x32\x10.gisevents.PointH\x00R\x05point\x12\x37\n\nlinestring\x18\x05 \x01(\x0b\x32\x15.gisevents.LineStringH\x00R\nlinestring\x12.\n\x07polygon\x18\x06 \x01(\x0b\x32\x12.gisevents.PolygonH\x00R\x07polygon\x12\x35\n\nproperties\x18\x07 \x01(\x0b\x32\x15.gisevents.PropertiesR\npropertiesB\n\n\x08geometry\"4\n\nProperties\x12\x10\n\x03key\x18\x01 \x03(\tR\x03key\x12\x14\n\x05value\x18\x02 \x03(\tR\x05value\"\xdf\x03\n\x11ModificationEvent\x12\x0e\n\x02id\x18\x01 \x01(\x03R\x02id\x12\x38\n\ttimestamp\x18\x02 \x01(\x0b\x32\x1a.google.protobuf.TimestampR\ttimestamp\x12\x18\n\x07version\x18\x03 \x01(\x05R\x07version\x12\x33\n\x0bpoint_patch\x18\x04 \x01(\x0b\x32\x10.gisevents.PointH\x00R\npointPatch\x12G\n\x10linestring_patch\x18\x05 \x01(\x0b\x32\x1a.gisevents.LineStringPatchH\x00R\x0flinestringPatch\x12\x41\n\rpolygon_patch\x18\x06 \x01(\x0b\x32\x1a.gisevents.LineStringPatchH\x00R\x0cpolygonPatch\x12\x37\n\nlinestring\x18\x08 \x01(\x0b\x32\x15.gisevents.LineStringH\x00R\nlinestring\x12.\n\x07polygon\x18\t \x01(\x0b\x32\x12.gisevents.PolygonH\x00R\x07polygon\x12\x33\n\nprop_patch\x18\x07 \x01(\x0b\x32\x14.gisevents.PropPatchR\tpropPatchB\x07\n\x05patch\"s\n\rDeletionEvent\x12\x0e\n\x02id\x18\x01 \x01(\x03R\x02id\x12\x38\n\ttimestamp\x18\x02 \x01(\x0b\x32\x1a.google.protobuf.TimestampR\ttimestamp\x12\x18\n\x07version\x18\x03 \x01(\x05R\x07version\"+\n\x05Point\x12\x10\n\x03lon\x18\x02 \x01(\x11R\x03lon\x12\x10\n\x03lat\x18\x01 \x01(\x11R\x03lat\"0\n\nLineString\x12\x10\n\x03lat\x18\x01 \x03(\x11R\x03lat\x12\x10\n\x03lon\x18\x02 \x03(\x11R\x03lon\"-\n\x07Polygon\x12\x10\n\x03lat\x18\x01 \x03(\x11R\x03lat\x12\x10\n\x03lon\x18\x02 \x03(\x11R\x03lon\"\xbe\x01\n\x0fLineStringPatch\x12\x14\n\x05index\x18\x01 \x03(\x05R\x05index\x12<\n\x07\x63ommand\x18\x02 \x03(\x0e\x32\".gisevents.LineStringPatch.CommandR\x07\x63ommand\x12(\n\x06vector\x18\x03 \x03(\x0b\x32\x10.gisevents.PointR\x06vector\"-\n\x07\x43ommand\x12\n\n\x06INSERT\x10\x00\x12\n\n\x06\x44\x45LETE\x10\x01\x12\n\n\x06\x43HANGE\x10\x02\"\xb3\x01\n\tPropPatch\x12\x36\n\x0bprop_delete\x18\x01 \x01(\x0b\x32\x15.gisevents.PropDeleteR\npropDelete\x12\x36\n\x0bprop_insert\x18\x02 \x01(\x0b\x32\x15.gisevents.PropInsertR\npropInsert\x12\x36\n\x0bprop_update\x18\x03 \x01(\x0b\x32\x15.gisevents.PropUpdateR\npropUpdate\"\x1e\n\nPropDelete\x12\x10\n\x03key\x18\x01 \x03(\tR\x03key\"4\n\nPropInsert\x12\x10\n\x03key\x18\x01 \x03(\tR\x03key\x12\x14\n\x05value\x18\x02 \x03(\tR\x05value\"4\n\nPropUpdate\x12\x10\n\x03key\x18\x01 \x03(\tR\x03key\x12\x14\n\x05value\x18\x02 \x03(\tR\x05valueBc\n\rcom.giseventsB\x0eGiseventsProtoP\x01\xa2\x02\x03GXX\xaa\x02\tGisevents\xca\x02\tGisevents\xe2\x02\x15Gisevents\\GPBMetadata\xea\x02\tGiseventsb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -28,25 +28,25 @@ if _descriptor._USE_C_DESCRIPTORS == False:
   _globals['_PROPERTIES']._serialized_start=405
   _globals['_PROPERTIES']._serialized_end=457
   _globals['_MODIFICATIONEVENT']._serialized_start=460
-  _globals['_MODIFICATIONEVENT']._serialized_end=834
-  _globals['_DELETIONEVENT']._serialized_start=836
-  _globals['_DELETIONEVENT']._serialized_end=951
-  _globals['_POINT']._serialized_start=953
-  _globals['_POINT']._serialized_end=996
-  _globals['_LINESTRING']._serialized_start=998
-  _globals['_LINESTRING']._serialized_end=1046
-  _globals['_POLYGON']._serialized_start=1048
-  _globals['_POLYGON']._serialized_end=1093
-  _globals['_LINESTRINGPATCH']._serialized_start=1096
-  _globals['_LINESTRINGPATCH']._serialized_end=1286
-  _globals['_LINESTRINGPATCH_COMMAND']._serialized_start=1241
-  _globals['_LINESTRINGPATCH_COMMAND']._serialized_end=1286
-  _globals['_PROPPATCH']._serialized_start=1289
-  _globals['_PROPPATCH']._serialized_end=1468
-  _globals['_PROPDELETE']._serialized_start=1470
-  _globals['_PROPDELETE']._serialized_end=1500
-  _globals['_PROPINSERT']._serialized_start=1502
-  _globals['_PROPINSERT']._serialized_end=1554
-  _globals['_PROPUPDATE']._serialized_start=1556
-  _globals['_PROPUPDATE']._serialized_end=1608
+  _globals['_MODIFICATIONEVENT']._serialized_end=939
+  _globals['_DELETIONEVENT']._serialized_start=941
+  _globals['_DELETIONEVENT']._serialized_end=1056
+  _globals['_POINT']._serialized_start=1058
+  _globals['_POINT']._serialized_end=1101
+  _globals['_LINESTRING']._serialized_start=1103
+  _globals['_LINESTRING']._serialized_end=1151
+  _globals['_POLYGON']._serialized_start=1153
+  _globals['_POLYGON']._serialized_end=1198
+  _globals['_LINESTRINGPATCH']._serialized_start=1201
+  _globals['_LINESTRINGPATCH']._serialized_end=1391
+  _globals['_LINESTRINGPATCH_COMMAND']._serialized_start=1346
+  _globals['_LINESTRINGPATCH_COMMAND']._serialized_end=1391
+  _globals['_PROPPATCH']._serialized_start=1394
+  _globals['_PROPPATCH']._serialized_end=1573
+  _globals['_PROPDELETE']._serialized_start=1575
+  _globals['_PROPDELETE']._serialized_end=1605
+  _globals['_PROPINSERT']._serialized_start=1607
+  _globals['_PROPINSERT']._serialized_end=1659
+  _globals['_PROPUPDATE']._serialized_start=1661
+  _globals['_PROPUPDATE']._serialized_end=1713
 # @@protoc_insertion_point(module_scope)
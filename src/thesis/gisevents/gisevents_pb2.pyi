@@ -34,13 +34,15 @@ class Properties(_message.Message):
     def __init__(self, key: _Optional[_Iterable[str]] = ..., value: _Optional[_Iterable[str]] = ...) -> None: ...
 
 class ModificationEvent(_message.Message):
-    __slots__ = ("id", "timestamp", "version", "point_patch", "linestring_patch", "polygon_patch", "prop_patch")
+    __slots__ = ("id", "timestamp", "version", "point_patch", "linestring_patch", "polygon_patch", "linestring", "polygon", "prop_patch")
     ID_FIELD_NUMBER: _ClassVar[int]
     TIMESTAMP_FIELD_NUMBER: _ClassVar[int]
     VERSION_FIELD_NUMBER: _ClassVar[int]
     POINT_PATCH_FIELD_NUMBER: _ClassVar[int]
     LINESTRING_PATCH_FIELD_NUMBER: _ClassVar[int]
     POLYGON_PATCH_FIELD_NUMBER: _ClassVar[int]
+    LINESTRING_FIELD_NUMBER: _ClassVar[int]
+    POLYGON_FIELD_NUMBER: _ClassVar[int]
     PROP_PATCH_FIELD_NUMBER: _ClassVar[int]
     id: int
     timestamp: _timestamp_pb2.Timestamp
@@ -48,8 +50,10 @@ class ModificationEvent(_message.Message):
     point_patch: Point
     linestring_patch: LineStringPatch
     polygon_patch: LineStringPatch
+    linestring: LineString
+    polygon: Polygon
     prop_patch: PropPatch
-    def __init__(self, id: _Optional[int] = ..., timestamp: _Optional[_Union[_timestamp_pb2.Timestamp, _Mapping]] = ..., version: _Optional[int] = ..., point_patch: _Optional[_Union[Point, _Mapping]] = ..., linestring_patch: _Optional[_Union[LineStringPatch, _Mapping]] = ..., polygon_patch: _Optional[_Union[LineStringPatch, _Mapping]] = ..., prop_patch: _Optional[_Union[PropPatch, _Mapping]] = ...) -> None: ...
+    def __init__(self, id: _Optional[int] = ..., timestamp: _Optional[_Union[_timestamp_pb2.Timestamp, _Mapping]] = ..., version: _Optional[int] = ..., point_patch: _Optional[_Union[Point, _Mapping]] = ..., linestring_patch: _Optional[_Union[LineStringPatch, _Mapping]] = ..., polygon_patch: _Optional[_Union[LineStringPatch, _Mapping]] = ..., linestring: _Optional[_Union[LineString, _Mapping]] = ..., polygon: _Optional[_Union[Polygon, _Mapping]] = ..., prop_patch: _Optional[_Union[PropPatch, _Mapping]] = ...) -> None: ...
 
 class DeletionEvent(_message.Message):
     __slots__ = ("id", "timestamp", "version")
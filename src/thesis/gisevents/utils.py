@@ -1,5 +1,7 @@
 from typing import cast
 
+import numpy as np
+import numpy.typing as npt
 from osgeo import ogr
 
 from thesis import geo, gisevents
@@ -16,19 +18,40 @@ def to_point_message(geom: ogr.Geometry) -> gisevents.Point:
     )
 
 
-def _get_deltas(geom: ogr.Geometry) -> tuple[list[int], list[int]]:
+def _get_deltas(
+    geom: ogr.Geometry,
+) -> tuple[npt.NDArray[np.int64], npt.NDArray[np.int64]]:
+    """Delta encoded longitudes and latitudes of a geometry in 100 nano degrees.
+
+    All points are converted and encoded at once, as arrays.
+    """
     if not (geo.is_linestring(geom) or geo.is_linearring(geom)):
         raise ValueError(f"Geometry type is not appropriate: {geom.GetGeometryName()}")
 
-    lon: list[int] = []
-    lat: list[int] = []
+    return _coordinate_deltas(geo.get_coordinates(geom))
+
+
+def _coordinate_deltas(
+    coords: npt.NDArray[np.float64],
+) -> tuple[npt.NDArray[np.int64], npt.NDArray[np.int64]]:
+    deltas = geo.delta_encode_array(geo.to100nano_array(coords))
+    return deltas[:, 0], deltas[:, 1]
+
+
+def coordinates_to_linestring_message(
+    coords: npt.NDArray[np.float64],
+) -> gisevents.LineString:
+    """Convert an (N, 2) array of degrees to a LineString message."""
+    delta_lon, delta_lat = _coordinate_deltas(coords)
+    return gisevents.LineString(lon=delta_lon.tolist(), lat=delta_lat.tolist())
+
 
-    for i in range(geom.GetPointCount()):
-        lon.append(geo.to100nano(geom.GetX(i)))
-        lat.append(geo.to100nano(geom.GetY(i)))
-    delta_lon = geo.delta_encode(lon)
-    delta_lat = geo.delta_encode(lat)
-    return delta_lon, delta_lat
+def coordinates_to_polygon_message(
+    coords: npt.NDArray[np.float64],
+) -> gisevents.Polygon:
+    """Convert the exterior ring of a polygon, in degrees, to a Polygon message."""
+    delta_lon, delta_lat = _coordinate_deltas(coords)
+    return gisevents.Polygon(lon=delta_lon.tolist(), lat=delta_lat.tolist())
 
 
 def to_linestring_message(geom: ogr.Geometry) -> gisevents.LineString:
@@ -42,7 +65,7 @@ def to_linestring_message(geom: ogr.Geometry) -> gisevents.LineString:
         raise
 
     delta_lon, delta_lat = _get_deltas(geom)
-    return gisevents.LineString(lon=delta_lon, lat=delta_lat)
+    return gisevents.LineString(lon=delta_lon.tolist(), lat=delta_lat.tolist())
 
 
 def to_polygon_message(geom: ogr.Geometry) -> gisevents.Polygon:
@@ -54,4 +77,4 @@ def to_polygon_message(geom: ogr.Geometry) -> gisevents.Polygon:
     ring = cast(ogr.Geometry, geom.GetGeometryRef(0))
     delta_lon, delta_lat = _get_deltas(ring)
 
-    return gisevents.Polygon(lon=delta_lon, lat=delta_lat)
+    return gisevents.Polygon(lon=delta_lon.tolist(), lat=delta_lat.tolist())
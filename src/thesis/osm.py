@@ -1,5 +1,7 @@
 import enum
-from typing import NamedTuple
+from collections.abc import Collection
+from datetime import datetime
+from typing import NamedTuple, Optional
 
 ElementID = int
 
@@ -36,3 +38,53 @@ class ChangeInfo(NamedTuple):
     element_identifier: ElementIdentifier
 
 OSCInfo = list[ChangeInfo]
+
+
+class Member(NamedTuple):
+    """A member of a relation."""
+
+    etype: ElementType
+    id: ElementID
+    role: str = ""
+
+
+class ElementChange(NamedTuple):
+    """A changed element as recorded in an OSMChange file.
+
+    Only the field for the element type is filled in: 'coordinates' (lon,
+    lat) for nodes, 'node_refs' for ways and 'members' for relations.
+    Deleted elements have neither coordinates, node refs nor members.
+    """
+
+    change_type: ChangeType
+    element: ElementIdentifier
+    version: int
+    timestamp: datetime
+    coordinates: Optional[tuple[float, float]] = None
+    node_refs: tuple[ElementID, ...] = ()
+    members: tuple[Member, ...] = ()
+
+    @property
+    def info(self) -> ChangeInfo:
+        return ChangeInfo(self.change_type, self.element)
+
+
+class ChangedElements(NamedTuple):
+    """Ids of the OSM elements whose features may have changed.
+
+    None means that the changed elements of that type are not known, and all
+    features derived from that element type must be compared.
+    """
+
+    nodes: Optional[Collection[ElementID]] = None
+    ways: Optional[Collection[ElementID]] = None
+    relations: Optional[Collection[ElementID]] = None
+
+    def of(self, etype: ElementType) -> Optional[Collection[ElementID]]:
+        match etype:
+            case ElementType.NODE:
+                return self.nodes
+            case ElementType.WAY:
+                return self.ways
+            case ElementType.RELATION:
+                return self.relations
@@ -0,0 +1,87 @@
+"""Overlap the preparation of replication steps with their processing.
+
+Each replication step has two halves. Preparing a dataset runs osmium and
+ogr2ogr and mostly waits for them. Processing diffs the dataset and writes
+events in Python. `prefetch` runs the preparation of the next steps in a
+background thread while the current step is processed.
+"""
+import logging
+import queue
+import threading
+from collections.abc import Iterable, Iterator
+from typing import TypeVar
+
+_logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_ITEM = "item"
+_DONE = "done"
+_ERROR = "error"
+
+# How often a blocked producer checks whether the consumer has stopped
+_POLL_INTERVAL = 0.5  # seconds
+
+
+def _acquire(slots: threading.Semaphore, stop: threading.Event) -> bool:
+    """Reserve a slot for the next item, unless the consumer stops first."""
+    while not stop.is_set():
+        if slots.acquire(timeout=_POLL_INTERVAL):
+            return True
+    return False
+
+
+def prefetch(items: Iterable[T], depth: int) -> Iterator[T]:
+    """Produce 'items' in a background thread, up to 'depth' ahead.
+
+    Yields the items in order. The producer reserves a slot before it starts
+    on an item and the slot is freed when the consumer takes the item, so at
+    most 'depth' items are buffered or in production besides the one the
+    consumer holds. This caps the resources held by prepared items.
+    Exceptions of the producer are raised in the consumer. If the consumer
+    stops early, the producer stops after the item it is working on, and
+    the items left in the buffer are dropped, so they must not need any
+    cleanup beyond what the caller does anyway.
+    With a 'depth' of 0 the items are produced on demand in the calling
+    thread.
+    """
+    if depth < 1:
+        yield from items
+        return
+
+    buffer: queue.Queue = queue.Queue()
+    slots = threading.Semaphore(depth)
+    stop = threading.Event()
+    iterator = iter(items)
+
+    def produce():
+        try:
+            while _acquire(slots, stop):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    buffer.put((_DONE, None))
+                    return
+                buffer.put((_ITEM, item))
+        except BaseException as e:
+            buffer.put((_ERROR, e))
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    thread = threading.Thread(target=produce, name="prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            kind, value = buffer.get()
+            if kind == _DONE:
+                return
+            if kind == _ERROR:
+                raise value
+            slots.release()
+            yield value
+    finally:
+        stop.set()
+        _logger.debug("Waiting for the prefetch thread to stop")
+        thread.join()
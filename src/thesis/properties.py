@@ -1,5 +1,8 @@
 import enum
-from typing import Literal
+import functools
+import json
+import sys
+from typing import Iterable, Literal, Optional
 
 Properties = dict[str, str]
 
@@ -24,6 +27,38 @@ def as_string(obj):
     return {key: str(val) for key, val in obj.items()}
 
 
+def _interned_pairs(pairs: list[tuple[str, object]]) -> Properties:
+    """Build the properties of a JSON object with interned keys and values.
+
+    Tags repeat heavily across features ("highway", "building": "yes", ...),
+    so interning lets all of them share one string object each.
+    """
+    return {sys.intern(key): sys.intern(str(val)) for key, val in pairs}
+
+
+_decoder = json.JSONDecoder(strict=False, object_pairs_hook=_interned_pairs)
+
+# Number of distinct `all_tags` strings whose properties are kept
+PARSE_CACHE_SIZE = 2**16
+
+
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _decode(all_tags: str) -> Properties:
+    return _decoder.decode(all_tags)
+
+
+def parse(all_tags: Optional[str]) -> Properties:
+    """Parse the JSON of an `all_tags` field into properties.
+
+    Equivalent to ``json.loads(all_tags, strict=False, object_hook=as_string)``.
+    Identical strings are decoded once, so the returned properties are shared
+    and must not be modified, see `apply` to derive new properties.
+    """
+    if not all_tags:
+        return {}
+    return _decode(all_tags)
+
+
 def diff(props_a: Properties, props_b: Properties):
     for key, val in props_a.items():
         if key in props_b and props_b[key] != val:
@@ -33,3 +68,15 @@ def diff(props_a: Properties, props_b: Properties):
     only_b_keys = set(props_b.keys()) - set(props_a.keys())
     for key in only_b_keys:
         yield (ChangeType.INSERT, key, props_b[key])
+
+
+def apply(props: Properties, patch: Iterable[PatchCommand]) -> Properties:
+    """Return a copy of 'props' with the patch applied."""
+    result = dict(props)
+    for cmd in patch:
+        ch_type, key, *value = cmd
+        if ch_type is ChangeType.DELETE:
+            result.pop(key, None)
+        else:
+            result[key] = value[0]
+    return result
@@ -0,0 +1,225 @@
+"""Rebuild feature state from the event store.
+
+The replay engine streams an event log written by `thesis.api.event_store`
+and applies creation, modification and deletion events to an in-memory
+feature set. Coordinates are kept in units of 100 nano degrees, the unit of
+the gisevents messages.
+
+"State at T" is the result of applying, in log order, every event with a
+timestamp at or before T. To bound the cost of repeated queries the replayer
+keeps checkpoints: snapshots of the complete state at segment boundaries of
+the log. A checkpoint can serve a query for T when no event before it is
+newer than T, so replay only has to cover the segments after the nearest
+usable checkpoint.
+
+Every checkpoint holds a copy of the feature set, so their number is
+capped. When a new checkpoint exceeds the cap, the interval between
+checkpoints doubles and the checkpoints off the new interval are dropped.
+The spacing grows with the log and memory use stays bounded.
+"""
+import logging
+from bisect import bisect_left
+from collections.abc import Iterator
+from datetime import datetime
+from itertools import accumulate
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from google.protobuf import message
+
+from thesis import gisevents, utils, properties as props
+from thesis.api import event_log
+from thesis.geodiff.patch import apply_patch
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_CHECKPOINT_INTERVAL = 64  # in log segments
+DEFAULT_MAX_CHECKPOINTS = 16
+
+IntCoords = tuple[tuple[int, int], ...]
+
+
+class Feature(NamedTuple):
+    """A feature as materialized from the event log."""
+
+    id: int
+    version: int
+    timestamp: int
+    geometry_type: str
+    coords: IntCoords
+    properties: props.Properties
+
+
+FeatureSet = dict[int, Feature]
+
+
+class Checkpoint(NamedTuple):
+    segment: int  # index of the first segment not included in the state
+    state: FeatureSet
+
+
+def _decode_deltas(lon, lat) -> IntCoords:
+    return tuple(zip(accumulate(lon), accumulate(lat)))
+
+
+def _create(event: gisevents.CreationEvent) -> Feature:
+    geometry_type = event.WhichOneof("geometry")
+    match geometry_type:
+        case "point":
+            coords: IntCoords = ((event.point.lon, event.point.lat),)
+        case "linestring":
+            coords = _decode_deltas(event.linestring.lon, event.linestring.lat)
+        case "polygon":
+            coords = _decode_deltas(event.polygon.lon, event.polygon.lat)
+        case _:
+            raise ValueError(f"Creation event {event.id} has no geometry")
+    return Feature(
+        id=event.id,
+        version=event.version,
+        timestamp=event.timestamp.seconds,
+        geometry_type=geometry_type,
+        coords=coords,
+        properties=dict(zip(event.properties.key, event.properties.value)),
+    )
+
+
+def _modify(feature: Feature, event: gisevents.ModificationEvent) -> Feature:
+    coords = feature.coords
+    match event.WhichOneof("patch"):
+        case "point_patch":
+            (lon, lat), *_ = coords
+            coords = ((lon + event.point_patch.lon, lat + event.point_patch.lat),)
+        case "linestring_patch":
+            patch = utils.from_lspatch_message(event.linestring_patch)
+            coords = tuple(apply_patch(patch, coords))
+        case "polygon_patch":
+            patch = utils.from_lspatch_message(event.polygon_patch)
+            coords = tuple(apply_patch(patch, coords))
+        case "linestring":
+            coords = _decode_deltas(event.linestring.lon, event.linestring.lat)
+        case "polygon":
+            coords = _decode_deltas(event.polygon.lon, event.polygon.lat)
+    properties = feature.properties
+    if event.HasField("prop_patch"):
+        properties = props.apply(
+            properties, utils.from_prop_patch_msg(event.prop_patch)
+        )
+    return feature._replace(
+        version=event.version,
+        timestamp=event.timestamp.seconds,
+        coords=coords,
+        properties=properties,
+    )
+
+
+def apply_event(state: FeatureSet, event: message.Message):
+    """Apply a single event to a feature set in place."""
+    if isinstance(event, gisevents.CreationEvent):
+        state[event.id] = _create(event)
+    elif isinstance(event, gisevents.ModificationEvent):
+        feature = state.get(event.id)
+        if feature is None:
+            _logger.debug(f"Modification of unknown feature {event.id}. Skipping.")
+            return
+        state[event.id] = _modify(feature, event)
+    elif isinstance(event, gisevents.DeletionEvent):
+        state.pop(event.id, None)
+    else:
+        raise TypeError(f"Unsupported event message: {type(event).__name__}")
+
+
+class Replayer:
+    """Materialize the feature set of an event log at any point in time."""
+
+    def __init__(
+        self,
+        path: Path,
+        checkpoint_interval: int = DEFAULT_CHECKPOINT_INTERVAL,
+        max_checkpoints: int = DEFAULT_MAX_CHECKPOINTS,
+    ):
+        if checkpoint_interval < 1:
+            raise ValueError("Checkpoint interval must be positive.")
+        if max_checkpoints < 2:
+            raise ValueError("At least two checkpoints must be kept.")
+        self._path = path
+        self._checkpoint_interval = checkpoint_interval
+        self._max_checkpoints = max_checkpoints
+        self._checkpoints: list[Checkpoint] = [Checkpoint(0, {})]
+        with open(path, "rb") as f:
+            segments = event_log.EventLogReader(f).segments
+        self._segments = segments
+        # _prefix_max[i] is the newest timestamp in segments[:i]
+        self._prefix_max: list[Optional[int]] = [None]
+        for seg in segments:
+            prev = self._prefix_max[-1]
+            newest = seg.max_timestamp
+            if prev is not None:
+                newest = max(prev, newest)
+            self._prefix_max.append(newest)
+
+    @property
+    def checkpoints(self) -> list[Checkpoint]:
+        return list(self._checkpoints)
+
+    def _nearest_checkpoint(self, seconds: int) -> Checkpoint:
+        for checkpoint in reversed(self._checkpoints):
+            newest = self._prefix_max[checkpoint.segment]
+            if newest is None or newest <= seconds:
+                return checkpoint
+        return self._checkpoints[0]
+
+    def _add_checkpoint(self, segment: int, state: FeatureSet):
+        i = bisect_left([c.segment for c in self._checkpoints], segment)
+        if i == len(self._checkpoints) or self._checkpoints[i].segment != segment:
+            self._checkpoints.insert(i, Checkpoint(segment, dict(state)))
+        end = len(self._segments)
+        while len(self._checkpoints) > self._max_checkpoints:
+            # The empty state at 0 and the complete state at the end are kept
+            self._checkpoint_interval *= 2
+            self._checkpoints = [
+                c
+                for c in self._checkpoints
+                if c.segment % self._checkpoint_interval == 0 or c.segment == end
+            ]
+
+    def state_at(self, timestamp: Optional[datetime] = None) -> FeatureSet:
+        """Return the feature set after all events up to 'timestamp'.
+
+        Without a timestamp the complete log is replayed.
+        """
+        seconds = None if timestamp is None else event_log.to_seconds(timestamp)
+        start = (
+            self._checkpoints[-1]
+            if seconds is None
+            else self._nearest_checkpoint(seconds)
+        )
+        state = dict(start.state)
+        # True as long as no event has been skipped, i.e. while 'state' is a
+        # valid checkpoint for its segment boundary.
+        complete = True
+        with open(self._path, "rb") as f:
+            reader = event_log.EventLogReader(f)
+            for i in range(start.segment, len(self._segments)):
+                seg = self._segments[i]
+                if complete and i % self._checkpoint_interval == 0:
+                    self._add_checkpoint(i, state)
+                if seconds is not None and seg.min_timestamp > seconds:
+                    complete = False
+                    continue
+                for frame in reader.frames([seg]):
+                    event = frame.event
+                    if seconds is not None and event.timestamp.seconds > seconds:
+                        complete = False
+                        continue
+                    apply_event(state, event)
+        if complete:
+            self._add_checkpoint(len(self._segments), state)
+        return state
+
+    def features_at(self, timestamp: Optional[datetime] = None) -> Iterator[Feature]:
+        yield from self.state_at(timestamp).values()
+
+
+def replay(path: Path, timestamp: Optional[datetime] = None) -> FeatureSet:
+    """Replay an event log from the start, up to 'timestamp'."""
+    return Replayer(path).state_at(timestamp)
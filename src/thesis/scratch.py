@@ -0,0 +1,127 @@
+"""Choose where the intermediate files of a run are stored.
+
+A run rewrites the working OSM file and writes a GeoPackage per replication
+step, several GB each on a country extract. None of it outlives the run, so
+it is best kept in memory, on a tmpfs, where it never reaches the page cache
+and journal of a persistent volume. The files are opened by ogr2ogr, osmium,
+the `sqlite3` module and worker processes, so they must be real files. GDAL's
+/vsimem/ is private to one process and is not an option.
+
+`choose` places the scratch directory on a tmpfs when the estimated size of
+the files fits under a memory budget, and on disk otherwise.
+"""
+import enum
+import logging
+import tempfile
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from thesis import tuning
+
+_logger = logging.getLogger(__name__)
+
+# Conventional tmpfs mount, used if the temporary directory is on disk
+SHM_DIR = Path("/dev/shm")
+# Conventional temporary directory on disk, used if the temporary directory
+# is on a tmpfs that is too small
+DISK_TEMP_DIR = Path("/var/tmp")
+
+# Estimated size of a simplified GeoPackage relative to its OSM file
+GPKG_PER_PBF = 8
+# Share of the physical memory that scratch files may use by default
+DEFAULT_MEMORY_SHARE = 0.5
+
+
+@enum.unique
+class Mode(enum.Enum):
+    AUTO = "auto"  # in memory if the files fit, on disk otherwise
+    MEMORY = "memory"  # in memory, fails if no tmpfs is found
+    DISK = "disk"  # on disk
+
+
+class Placement(NamedTuple):
+    """Where the scratch files go and why."""
+
+    directory: Path
+    in_memory: bool
+    required: int  # bytes, estimated
+    budget: Optional[int]  # bytes, None if unknown
+
+
+def estimate(osm_size: int, gpkgs: int) -> int:
+    """Estimated size in bytes of the scratch files of a run.
+
+    The working OSM file and its replacement while changes are applied, and
+    'gpkgs' GeoPackages at a time.
+    """
+    return 2 * osm_size + gpkgs * GPKG_PER_PBF * osm_size
+
+
+def _memory_dir() -> Optional[Path]:
+    """A writable directory on a tmpfs, if there is one."""
+    temp_dir = Path(tempfile.gettempdir())
+    for candidate in (temp_dir, SHM_DIR):
+        if candidate.is_dir() and tuning.detect(candidate).temp_fs == "tmpfs":
+            return candidate
+    return None
+
+
+def _disk_dir() -> Path:
+    temp_dir = Path(tempfile.gettempdir())
+    if tuning.detect(temp_dir).temp_fs == "tmpfs" and DISK_TEMP_DIR.is_dir():
+        return DISK_TEMP_DIR
+    return temp_dir
+
+
+def choose(
+    required: int,
+    mode: Mode = Mode.AUTO,
+    budget: Optional[int] = None,
+) -> Placement:
+    """Choose the directory of the scratch files.
+
+    Parameters
+    ----------
+    required : int
+        Estimated size of the scratch files in bytes, see `estimate`.
+    mode : Mode
+        Whether to keep the files in memory.
+    budget : int, optional
+        Bytes of memory the files may use. Defaults to
+        `DEFAULT_MEMORY_SHARE` of the physical memory. The free space of the
+        tmpfs limits it further.
+    """
+    if mode is Mode.DISK:
+        return Placement(_disk_dir(), False, required, budget)
+
+    memory_dir = _memory_dir()
+    if memory_dir is None:
+        if mode is Mode.MEMORY:
+            raise RuntimeError("No tmpfs found for the scratch files.")
+        _logger.info("No tmpfs found, keeping scratch files on disk")
+        return Placement(_disk_dir(), False, required, budget)
+
+    resources = tuning.detect(memory_dir)
+    if budget is None and resources.memory is not None:
+        budget = int(resources.memory * DEFAULT_MEMORY_SHARE)
+    if resources.temp_free is not None:
+        free = resources.temp_free
+        budget = free if budget is None else min(budget, free)
+
+    if mode is Mode.MEMORY or (budget is not None and required <= budget):
+        return Placement(memory_dir, True, required, budget)
+    _logger.info(
+        f"Scratch files need about {required / 2**20:.0f} MiB, more than the "
+        "memory budget, keeping them on disk"
+    )
+    return Placement(_disk_dir(), False, required, budget)
+
+
+def make_dir(placement: Placement) -> Path:
+    """Create a new scratch directory as placed."""
+    directory = Path(tempfile.mkdtemp(prefix="thesis-", dir=placement.directory))
+    _logger.info(
+        f"Scratch directory: {directory} "
+        f"({'in memory' if placement.in_memory else 'on disk'})"
+    )
+    return directory
@@ -1,20 +1,31 @@
 import argparse
-from collections.abc import Iterator
+from collections import deque
+from collections.abc import Callable, Collection, Iterable, Iterator, Mapping
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import closing
 from datetime import datetime
+from itertools import islice
 import logging
+import multiprocessing
 import os
 import pathlib
 import shutil
-import tempfile
 from pathlib import Path
-from typing import Optional, Sequence, cast
+from typing import NamedTuple, Optional, Sequence, TypeVar, cast
 from alive_progress import alive_bar
+from google.protobuf import message
 
 from osgeo import ogr
-from thesis import events
-from thesis.api import event_store
+from thesis import events, pipeline, scratch, tuning
+from thesis.api import dependency_index, event_store, gpkg, osc, process
+from thesis.osm import ChangedElements, ElementID, ElementIdentifier, ElementType
 
-from thesis.api.ogr import convert_osm_to_gpkg, apply_changes
+from thesis.api.ogr import (
+    convert_osm_to_gpkg,
+    apply_changes,
+    extract_elements,
+    merge_changes,
+)
 from thesis.geo import (
     polygon_has_holes,
 )
@@ -23,49 +34,137 @@ _logger = logging.getLogger(__name__)
 _logger.setLevel(logging.DEBUG)
 
 
+# Features written per transaction when polygons are converted in Python
+CONVERSION_TRANSACTION_SIZE = 100_000
+
+
 def _get_simplified_polygon_features(layer: ogr.Layer) -> Iterator[ogr.Feature]:
     """Simplify multipolygons in the dataset.
 
     Find all multi-polygon features where the multi-polygon only contains a
-    single polygon and that polygon has no holes. Copy the resulting features
-    and replace the multi-polygons with the polygons.
+    single polygon and that polygon has no holes. Replace the multi-polygons
+    of these features with the polygons.
 
-    Return an iterator of the new features.
+    Return an iterator of the features.
 
     """
-    features = filter(lambda feature: feature.geometry().GetGeometryCount() == 1, layer)
-    features = filter(
-        lambda feature: not polygon_has_holes(feature.geometry().GetGeometryRef(0)),
-        features,
-    )
+    for feature in layer:
+        multipolygon = feature.GetGeometryRef()
+        if multipolygon is None or multipolygon.GetGeometryCount() != 1:
+            continue
+        polygon = multipolygon.GetGeometryRef(0)
+        if polygon_has_holes(polygon):
+            continue
+        feature.SetGeometry(polygon.Clone())
+        yield feature
 
-    def replace_mp_with_polygon(feat: ogr.Feature):
-        poly = feat.geometry().GetGeometryRef(0).Clone()
-        new_feat = feat.Clone()
-        new_feat.SetGeometry(poly)
-        return new_feat
 
-    features = map(replace_mp_with_polygon, features)
-    return features
+def _sql_conversion_supported(ds: ogr.DataSource) -> bool:
+    """Whether the SQL functions of `_convert_polygons_sql` are available.
 
+    They are provided by SpatiaLite, if GDAL is built with it.
+    """
+    try:
+        result = ds.ExecuteSQL(
+            "SELECT ST_NumGeometries(NULL), ST_NumInteriorRings(NULL), AsGPB(NULL)"
+        )
+    except RuntimeError:
+        return False
+    if result is None:
+        return False
+    ds.ReleaseResultSet(result)
+    return True
+
+
+def _convert_polygons_sql(
+    ds: ogr.DataSource, mp_layer: ogr.Layer, poly_layer: ogr.Layer
+):
+    """Copy the simple multipolygons into the polygons layer in one statement.
 
-def simplify_data(gpkg_file_path: Path):
+    The selection and the extraction of the polygons happens in SQLite, see
+    `_get_simplified_polygon_features` for the rules. The FIDs are kept.
+    """
+    layer_defn = cast(ogr.FeatureDefn, mp_layer.GetLayerDefn())
+    fields = [
+        f'"{layer_defn.GetFieldDefn(i).GetName()}"'
+        for i in range(layer_defn.GetFieldCount())
+    ]
+    fid = f'"{mp_layer.GetFIDColumn()}"'
+    mp_geom = f'"{mp_layer.GetGeometryColumn()}"'
+    poly_geom = f'"{poly_layer.GetGeometryColumn()}"'
+    ds.StartTransaction()
+    try:
+        ds.ExecuteSQL(
+            f'INSERT INTO "{poly_layer.GetName()}" '
+            f"({fid}, {poly_geom}, {', '.join(fields)}) "
+            f"SELECT {fid}, AsGPB(ST_GeometryN({mp_geom}, 1)), {', '.join(fields)} "
+            f'FROM "{mp_layer.GetName()}" '
+            f"WHERE ST_NumGeometries({mp_geom}) = 1 "
+            f"AND ST_NumInteriorRings(ST_GeometryN({mp_geom}, 1)) = 0"
+        )
+    except BaseException:
+        ds.RollbackTransaction()
+        raise
+    ds.CommitTransaction()
+
+
+def _convert_polygons(
+    ds: ogr.DataSource,
+    mp_layer: ogr.Layer,
+    poly_layer: ogr.Layer,
+    show_progress: bool = True,
+):
+    """Copy the simple multipolygons into the polygons layer feature by feature.
+
+    The features are written in transactions of `CONVERSION_TRANSACTION_SIZE`.
+    """
+    ds.StartTransaction()
+    try:
+        with alive_bar(
+            title="Converting multipolygons to polygons", disable=not show_progress
+        ) as bar:
+            for count, feat in enumerate(
+                _get_simplified_polygon_features(mp_layer), start=1
+            ):
+                poly_layer.CreateFeature(feat)
+                if count % CONVERSION_TRANSACTION_SIZE == 0:
+                    ds.CommitTransaction()
+                    ds.StartTransaction()
+                bar()
+    except BaseException:
+        ds.RollbackTransaction()
+        raise
+    ds.CommitTransaction()
+
+
+def simplify_data(gpkg_file_path: Path, show_progress: bool = True):
     """Clean up gpkg file.
 
-    1.  Extract all simple polygons from multipolygon layer and add them as
-        LineString in 'lines' layer.
+    The GeoPackage is expected to contain the `OSM_LAYERS`.
+
+    1.  Extract all simple polygons from multipolygon layer and add them to
+        a 'polygons' layer. This runs as a single SQL statement if the SQL
+        functions are available, see `_convert_polygons_sql`, and feature by
+        feature otherwise.
     2.  Remove all redundant layers.
+    3.  Fingerprint the features of the remaining layers, see `gpkg`.
     """
     _logger.debug(f"Pruning GPKG file {gpkg_file_path}")
     with cast(ogr.DataSource, ogr.Open(str(gpkg_file_path), 1)) as ds:
         mp_layer = cast(ogr.Layer, ds.GetLayerByName("multipolygons"))
-        poly_feats = _get_simplified_polygon_features(mp_layer)
 
-        # Create a new layer for polygons
+        # Create a new layer for polygons, with a spatial index only if the
+        # multipolygons have one
+        options = []
+        if not mp_layer.TestCapability(ogr.OLCFastSpatialFilter):
+            options.append("SPATIAL_INDEX=NO")
         poly_layer = cast(
             ogr.Layer | None,
             ds.CreateLayer(
-                "polygons", srs=mp_layer.GetSpatialRef(), geom_type=ogr.wkbPolygon
+                "polygons",
+                srs=mp_layer.GetSpatialRef(),
+                geom_type=ogr.wkbPolygon,
+                options=options,
             ),
         )
         if poly_layer is None:
@@ -78,12 +177,12 @@ def simplify_data(gpkg_file_path: Path):
             poly_layer.CreateField(field_defn)
 
         # Write all polygon features to the new layer
-        poly_count = 0
-        with alive_bar(title="Converting multipolygons to polygons") as bar:
-            for feat in poly_feats:
-                poly_layer.CreateFeature(feat)
-                poly_count += 1
-                bar()
+        if _sql_conversion_supported(ds):
+            _logger.debug("Converting multipolygons to polygons in SQL")
+            _convert_polygons_sql(ds, mp_layer, poly_layer)
+        else:
+            _convert_polygons(ds, mp_layer, poly_layer, show_progress)
+        poly_count = poly_layer.GetFeatureCount()
 
         _logger.debug(
             f"Successfully wrote {poly_count} polygon features to layer 'polygons'."
@@ -101,9 +200,418 @@ def simplify_data(gpkg_file_path: Path):
 
         _logger.debug("Successfully pruned GPKG file.")
 
+    gpkg.add_fingerprints(gpkg_file_path, ["lines", "points", "polygons"])
+    for layer_name, lookups in LAYER_ELEMENTS.items():
+        for column, _ in lookups:
+            gpkg.add_osm_id_index(gpkg_file_path, layer_name, column)
+
+
+DEFAULT_SHARD_SIZE = 1024  # features per unit of work
+
+# The layers of the OSM driver that are converted, see `simplify_data` for
+# how they are used. The GeoPackages are only read by FID and OSM id, so
+# they are written without spatial index.
+OSM_LAYERS = ("points", "lines", "multipolygons")
+
+# The columns that link the features of each layer to the OSM elements they
+# are derived from. Polygons are closed ways or multipolygon relations.
+LAYER_ELEMENTS: dict[str, list[tuple[str, ElementType]]] = {
+    "points": [("osm_id", ElementType.NODE)],
+    "lines": [("osm_id", ElementType.WAY)],
+    "polygons": [("osm_way_id", ElementType.WAY), ("osm_id", ElementType.RELATION)],
+}
+
+T = TypeVar("T")
+
+
+class Shard(NamedTuple):
+    """A unit of work for `process_changes`: a range of FIDs in one layer.
+
+    'start' is inclusive and 'stop' exclusive. None leaves the range open.
+    When 'fids' is given, the shard covers just those FIDs instead.
+    """
+
+    layer: int
+    start: Optional[int] = None
+    stop: Optional[int] = None
+    fids: Optional[list[int]] = None
+
+
+def _fid_column(layer: ogr.Layer) -> str:
+    return layer.GetFIDColumn() or "fid"
+
+
+def _lookup_shards(
+    gpkg_a: Path,
+    gpkg_b: Path,
+    layer: int,
+    name: str,
+    lookups: list[tuple[str, Collection[ElementID]]],
+    shard_size: Optional[int],
+) -> list[Shard]:
+    """Shards of the features of the given OSM elements.
+
+    'lookups' are pairs of an OSM id column of the layer and element ids.
+    The features are found through the index of the column.
+    """
+    found: set[int] = set()
+    for path in (gpkg_a, gpkg_b):
+        for column, ids in lookups:
+            found.update(gpkg.fids_by_osm_id(path, name, ids, column))
+    fids = sorted(found)
+    size = shard_size or max(len(fids), 1)
+    return [
+        Shard(layer, fids=fids[start : start + size])
+        for start in range(0, len(fids), size)
+    ]
+
+
+def _element_lookups(
+    name: str, changed: Optional[ChangedElements]
+) -> Optional[list[tuple[str, Collection[ElementID]]]]:
+    """Lookups of the changed features of a layer, if all are known."""
+    if changed is None or name not in LAYER_ELEMENTS:
+        return None
+    lookups = []
+    for column, etype in LAYER_ELEMENTS[name]:
+        ids = changed.of(etype)
+        if ids is None:
+            return None
+        lookups.append((column, ids))
+    return lookups
+
+
+def _shards(
+    gpkg_a: Path,
+    gpkg_b: Path,
+    shard_size: Optional[int],
+    changed: Optional[ChangedElements] = None,
+) -> list[Shard]:
+    """Split the layers of two datasets into FID ranges.
+
+    Without a 'shard_size' there is one shard per layer. Otherwise the range
+    boundaries are every 'shard_size'th FID of the layer in 'gpkg_a'. Only
+    the FID column is read for that. Processing the shards in order visits
+    the features of each layer in FID order.
+
+    Layers whose features derive from element types with known 'changed'
+    elements are only searched for the features of those elements, see
+    `_lookup_shards` and `LAYER_ELEMENTS`.
+    """
+    shards: list[Shard] = []
+    with (
+        cast(ogr.DataSource, ogr.Open(str(gpkg_a))) as ds_a,
+        cast(ogr.DataSource, ogr.Open(str(gpkg_b))) as ds_b,
+    ):
+        assert ds_a.GetLayerCount() == ds_b.GetLayerCount()
+
+        for i in range(ds_a.GetLayerCount()):
+            name = ds_a.GetLayer(i).GetName()
+            lookups = _element_lookups(name, changed)
+            if lookups is not None:
+                shards.extend(
+                    _lookup_shards(gpkg_a, gpkg_b, i, name, lookups, shard_size)
+                )
+                continue
+            if shard_size is None:
+                shards.append(Shard(i))
+                continue
+            layer = ds_a.GetLayer(i)
+            fid_column = _fid_column(layer)
+            result = ds_a.ExecuteSQL(
+                f'SELECT "{fid_column}" FROM "{layer.GetName()}" '
+                f'ORDER BY "{fid_column}"'
+            )
+            try:
+                fids = [feature.GetFID() for feature in result]
+            finally:
+                ds_a.ReleaseResultSet(result)
+            bounds = [None, *fids[shard_size::shard_size], None]
+            shards.extend(Shard(i, lo, hi) for lo, hi in zip(bounds, bounds[1:]))
+    return shards
+
+
+def _records(
+    path: Path, name: str, shard: Shard
+) -> Iterator[gpkg.FeatureRecord]:
+    """Read the features of a shard in FID order as records."""
+    id_columns = [column for column, _ in LAYER_ELEMENTS.get(name, [])]
+    batches = gpkg.records(
+        path, name, shard.start, shard.stop, shard.fids, id_columns=id_columns
+    )
+    for batch in batches:
+        yield from batch
+
+
+def _merge_join(
+    a: Iterable[T], b: Iterable[T], key: Callable[[T], int]
+) -> Iterator[tuple[Optional[T], Optional[T]]]:
+    """Join two sequences that are sorted by 'key'.
+
+    Yields (item_a, item_b) pairs for keys in both sequences, (item_a, None)
+    for keys only in 'a' and (None, item_b) for keys only in 'b', in key
+    order. Keys must be unique within each sequence.
+    """
+    iter_a = iter(a)
+    iter_b = iter(b)
+    item_a = next(iter_a, None)
+    item_b = next(iter_b, None)
+    while item_a is not None and item_b is not None:
+        key_a = key(item_a)
+        key_b = key(item_b)
+        if key_a == key_b:
+            yield item_a, item_b
+            item_a = next(iter_a, None)
+            item_b = next(iter_b, None)
+        elif key_a < key_b:
+            yield item_a, None
+            item_a = next(iter_a, None)
+        else:
+            yield None, item_b
+            item_b = next(iter_b, None)
+    while item_a is not None:
+        yield item_a, None
+        item_a = next(iter_a, None)
+    while item_b is not None:
+        yield None, item_b
+        item_b = next(iter_b, None)
+
+
+def _fingerprinted(ds_a: ogr.DataSource, ds_b: ogr.DataSource, shard: Shard) -> bool:
+    name = ds_a.GetLayer(shard.layer).GetName()
+    return all(
+        gpkg.has_fingerprints(Path(ds.GetName()), name) for ds in (ds_a, ds_b)
+    )
+
+
+def _changed_fids(path_a: Path, path_b: Path, name: str, shard: Shard) -> list[int]:
+    """FIDs of the features of a shard that are missing on one side or differ.
+
+    Only the FID and fingerprint columns of both layers are read.
+    """
+    rows = _merge_join(
+        gpkg.fingerprints(path_a, name, shard.start, shard.stop),
+        gpkg.fingerprints(path_b, name, shard.start, shard.stop),
+        key=lambda row: row[0],
+    )
+    return [
+        (row_a or row_b)[0]
+        for row_a, row_b in rows
+        if row_a is None or row_b is None or row_a[1] != row_b[1]
+    ]
+
+
+def _same_record(record_a: gpkg.FeatureRecord, record_b: gpkg.FeatureRecord):
+    return (
+        record_a.version == record_b.version
+        and record_a.timestamp == record_b.timestamp
+        and record_a.tags == record_b.tags
+        and record_a.geometry == record_b.geometry
+    )
+
+
+class DeletionTimes(NamedTuple):
+    """Times of deletion of the features that were deleted by a change.
+
+    A deleted feature carries no time of deletion. Features derived from an
+    element in 'elements' get the time of that element, e.g. the time of the
+    change file that last changed it when several change files are applied
+    at once. Other features get the 'default' time.
+    """
+
+    default: Optional[datetime] = None
+    elements: Optional[Mapping[ElementIdentifier, datetime]] = None
+
+    def of(
+        self, layer_name: str, record: gpkg.FeatureRecord
+    ) -> Optional[datetime]:
+        """The time of deletion of a feature read with the id columns of its
+        layer in `LAYER_ELEMENTS`."""
+        if not self.elements:
+            return self.default
+        lookups = LAYER_ELEMENTS.get(layer_name, [])
+        for (_, etype), element_id in zip(lookups, record.element_ids):
+            if element_id is None:
+                continue
+            element = ElementIdentifier(element_id, etype)
+            if element in self.elements:
+                return self.elements[element]
+        return self.default
+
+
+def _pair_events(
+    pairs: Iterable[
+        tuple[Optional[gpkg.FeatureRecord], Optional[gpkg.FeatureRecord]]
+    ],
+    layer_name: str,
+    times: DeletionTimes,
+) -> Iterator[message.Message]:
+    """Create the events of joined records, in batches, in FID order.
+
+    Pairs of records with equal contents are skipped.
+    """
+    pairs = iter(pairs)
+    while batch := list(islice(pairs, gpkg.DEFAULT_BATCH_SIZE)):
+        created = []
+        modified = []
+        deleted = []
+        for record_a, record_b in batch:
+            if record_b is None:
+                deleted.append(record_a)
+            elif record_a is None:
+                created.append(record_b)
+            elif not _same_record(record_a, record_b):
+                modified.append((record_a, record_b))
+        batch_events: list[message.Message] = []
+        if deleted:
+            batch_events.extend(
+                events.deletion_events(
+                    deleted, [times.of(layer_name, record) for record in deleted]
+                )
+            )
+        if created:
+            batch_events.extend(events.creation_events(created))
+        if modified:
+            batch_events.extend(events.modification_events(modified))
+        # FIDs are unique within a layer, so this restores the order of the pairs
+        yield from sorted(batch_events, key=lambda event: event.id)
+
+
+def _shard_events(
+    ds_a: ogr.DataSource,
+    ds_b: ogr.DataSource,
+    shard: Shard,
+    times: Optional[DeletionTimes],
+) -> list[message.Message]:
+    """Create the events of one shard in a single pass over both layers.
+
+    The features are read directly from the GeoPackages as batches of
+    records, see `gpkg.records`, and the events are created per batch, see
+    `events.creation_events`. When both layers are fingerprinted only the
+    changed features are read, see `_changed_fids`. Otherwise both layers
+    are read in FID order and joined on the FID, so every feature is read
+    once, sequentially. Shards with a list of FIDs read just those features.
+    """
+    times = times or DeletionTimes()
+    name = ds_a.GetLayer(shard.layer).GetName()
+    path_a = Path(ds_a.GetName())
+    path_b = Path(ds_b.GetName())
+    if shard.fids is None and _fingerprinted(ds_a, ds_b, shard):
+        shard = shard._replace(fids=_changed_fids(path_a, path_b, name, shard))
+    pairs = _merge_join(
+        _records(path_a, name, shard),
+        _records(path_b, name, shard),
+        key=lambda record: record.fid,
+    )
+    return list(_pair_events(pairs, name, times))
+
+
+# Read-only datasources and deletion times of a worker process, set up by
+# `_init_worker`
+_worker_datasources: tuple[ogr.DataSource, ogr.DataSource]
+_worker_times: DeletionTimes
+
+
+def _init_worker(
+    gpkg_a: Path, gpkg_b: Path, times: DeletionTimes, profile: tuning.Profile
+):
+    global _worker_datasources, _worker_times
+    tuning.configure(profile, log=False)
+    _worker_datasources = (
+        cast(ogr.DataSource, ogr.Open(str(gpkg_a))),
+        cast(ogr.DataSource, ogr.Open(str(gpkg_b))),
+    )
+    _worker_times = times
+
+
+def _worker_shard_events(shard: Shard) -> list[message.Message]:
+    return _shard_events(*_worker_datasources, shard, _worker_times)
+
+
+def _parallel_shard_events(
+    gpkg_a: Path,
+    gpkg_b: Path,
+    shards: list[Shard],
+    times: DeletionTimes,
+    workers: int,
+) -> Iterator[tuple[Shard, list[message.Message]]]:
+    """Create the events of all shards in a process pool.
 
-def process_changes(gpkg_a: Path, gpkg_b: Path):
+    Yields the events in shard order. At most two shards per worker are in
+    flight, so results never pile up in memory when writing is slower than
+    diffing.
     """
+    # Workers are spawned rather than forked, as other threads may be running,
+    # see `pipeline.prefetch`.
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(gpkg_a, gpkg_b, times, tuning.current()),
+    ) as executor:
+
+        def submit(shard: Shard) -> tuple[Shard, Future]:
+            return shard, executor.submit(_worker_shard_events, shard)
+
+        remaining = iter(shards)
+        pending = deque(map(submit, islice(remaining, 2 * workers)))
+        while pending:
+            shard, future = pending.popleft()
+            pending.extend(map(submit, islice(remaining, 1)))
+            yield shard, future.result()
+
+
+def _sequential_shard_events(
+    gpkg_a: Path,
+    gpkg_b: Path,
+    shards: list[Shard],
+    times: DeletionTimes,
+) -> Iterator[tuple[Shard, list[message.Message]]]:
+    with (
+        cast(ogr.DataSource, ogr.Open(str(gpkg_a))) as ds_a,
+        cast(ogr.DataSource, ogr.Open(str(gpkg_b))) as ds_b,
+    ):
+        for shard in shards:
+            yield shard, _shard_events(ds_a, ds_b, shard, times)
+
+
+def process_changes(
+    gpkg_a: Path,
+    gpkg_b: Path,
+    timestamp: Optional[datetime] = None,
+    workers: int = 1,
+    shard_size: int = DEFAULT_SHARD_SIZE,
+    changed: Optional[ChangedElements] = None,
+    element_times: Optional[Mapping[ElementIdentifier, datetime]] = None,
+):
+    """Write events for all changes from 'gpkg_a' to 'gpkg_b' to the event store.
+
+    Parameters
+    ----------
+    gpkg_a, gpkg_b : Path
+        The datasets before and after the changes.
+    timestamp : datetime, optional
+        Time of the changes, used for deletion events.
+    workers : int
+        Number of worker processes. With more than one, the FIDs of each
+        layer are split into shards of 'shard_size' features that are
+        processed in a process pool. Every worker opens its own read-only
+        datasources. The events are written in the same order as in a
+        sequential run.
+    changed : ChangedElements, optional
+        Ids of the OSM elements affected by the changes, e.g. the nodes of
+        the OSMChange file and the ways and relations found through the
+        dependency index. Layers derived from element types with known ids
+        are only compared for the features of those elements, as found
+        through their OSM id indexes, instead of in full. See the note below.
+    element_times : mapping, optional
+        Times of the changes of single OSM elements, used for deletion
+        events of their features instead of 'timestamp', see
+        `DeletionTimes`.
+
+    Both datasets are read sequentially in FID order and merge joined on
+    the FID, see `_shard_events`. Events are written in FID order per layer.
+
     NOTE:
     There are three relevant layers in each dataset:
       * points
@@ -135,54 +643,160 @@ def process_changes(gpkg_a: Path, gpkg_b: Path):
     assume that changes to lines and polygons can be inferred from the
     contents of the OSMChange file.
     """
-    with (
-        cast(ogr.DataSource, ogr.Open(str(gpkg_a))) as ds_a,
-        cast(ogr.DataSource, ogr.Open(str(gpkg_b))) as ds_b,
-    ):
-        assert ds_a.GetLayerCount() == ds_b.GetLayerCount()
+    if workers < 1:
+        raise ValueError("Number of workers must be positive.")
+    times = DeletionTimes(timestamp, element_times)
+    if workers == 1:
+        shards = _shards(gpkg_a, gpkg_b, None, changed)
+        results = _sequential_shard_events(gpkg_a, gpkg_b, shards, times)
+    else:
+        shards = _shards(gpkg_a, gpkg_b, shard_size, changed)
+        results = _parallel_shard_events(gpkg_a, gpkg_b, shards, times, workers)
+    with alive_bar(
+        len(shards), title="Searching for and writing change events"
+    ) as bar:
+        for _, shard_events in results:
+            event_store.write_stream(shard_events)
+            bar()
 
-        for i in range(ds_a.GetLayerCount()):
-            layer_a = ds_a.GetLayer(i)
-            layer_b = ds_b.GetLayer(i)
-            fids_a = set(map(lambda f: f.GetFID(), layer_a))
-            fids_b = set(map(lambda f: f.GetFID(), layer_b))
-            common_fids = fids_a & fids_b
-            with alive_bar(title="Searching for and writing change events") as bar:
-                for fid in common_fids:
-                    feature_a = cast(ogr.Feature, layer_a.GetFeature(fid))
-                    feature_b = cast(ogr.Feature, layer_b.GetFeature(fid))
-                    if not feature_a.Equal(feature_b):
-                        event = events.modification_event(feature_a, feature_b)
-                        event_store.write_events(event)
-                    bar()
-
-            with alive_bar(title="Writing delete events") as bar:
-                for fid in fids_a - fids_b:
-                    feature_a = cast(ogr.Feature, layer_a.GetFeature(fid))
-                    event = events.deletion_event(feature_a)
-                    event_store.write_events(event)
-                    bar()
-
-            with alive_bar(title="Writing creation events") as bar:
-                for fid in fids_b - fids_a:
-                    feature_b = cast(ogr.Feature, layer_b.GetFeature(fid))
-                    event = events.creation_event(feature_b)
-                    event_store.write_events(event)
-                    bar()
-
-
-def _get_temp_file_paths():
+
+def update_features(gpkg_path: Path, delta_path: Path, changed: ChangedElements):
+    """Bring the features of changed OSM elements in 'gpkg_path' up to date.
+
+    'delta_path' is a dataset converted from just the changed elements, see
+    `extract_elements`. Features of the 'changed' elements are copied from
+    it to 'gpkg_path' by FID, replacing existing ones, and deleted where
+    'delta_path' has none. Other features are left as they are, so the cost
+    depends on the number of changes rather than on the size of the dataset.
+    The ids of all element types in 'changed' must be known.
+    """
+    shards = _shards(gpkg_path, delta_path, None, changed)
+    if any(shard.fids is None for shard in shards):
+        raise ValueError("The ids of all changed elements must be known.")
+
+    updated = deleted = 0
     with (
-        tempfile.NamedTemporaryFile(suffix=".osm.pbf") as osm_tmp,
-        tempfile.NamedTemporaryFile(suffix=".gpkg") as gpkg_tmp_a,
-        tempfile.NamedTemporaryFile(suffix=".gpkg") as gpkg_tmp_b,
+        cast(ogr.DataSource, ogr.Open(str(gpkg_path), 1)) as ds,
+        cast(ogr.DataSource, ogr.Open(str(delta_path))) as delta_ds,
     ):
-        # These files are deleted upon return. We only want their path.
-        return (
-            pathlib.Path(osm_tmp.name),
-            pathlib.Path(gpkg_tmp_a.name),
-            pathlib.Path(gpkg_tmp_b.name),
-        )
+        ds.StartTransaction()
+        try:
+            for shard in shards:
+                layer = ds.GetLayer(shard.layer)
+                delta_layer = delta_ds.GetLayer(shard.layer)
+                for fid in shard.fids or []:
+                    exists = layer.GetFeature(fid) is not None
+                    source = delta_layer.GetFeature(fid)
+                    if source is None:
+                        if exists:
+                            layer.DeleteFeature(fid)
+                            deleted += 1
+                        continue
+                    feature = ogr.Feature(layer.GetLayerDefn())
+                    feature.SetFrom(source)
+                    feature.SetFID(fid)
+                    if exists:
+                        layer.SetFeature(feature)
+                    else:
+                        layer.CreateFeature(feature)
+                    updated += 1
+        except:
+            ds.RollbackTransaction()
+            raise
+        ds.CommitTransaction()
+    _logger.debug(f"Updated {updated} and deleted {deleted} features in {gpkg_path}")
+
+
+class PreparedStep(NamedTuple):
+    """A replication step that is ready to be diffed, see `_prepare_steps`.
+
+    'gpkg_path' is None if no elements changed in an incremental run.
+    'element_times' are the times of the changed elements when the step
+    merges several change files.
+    """
+
+    osc_paths: list[Path]
+    timestamp: datetime
+    gpkg_path: Optional[Path]
+    changed: ChangedElements
+    element_times: Optional[dict[ElementIdentifier, datetime]] = None
+
+
+def _element_times(
+    batch: Iterable[tuple[Path, datetime]]
+) -> dict[ElementIdentifier, datetime]:
+    """Map the elements of change files to the time of the last file changing them."""
+    times: dict[ElementIdentifier, datetime] = {}
+    for osc_path, osc_date in batch:
+        times.update((element, osc_date) for element in osc.element_ids(osc_path))
+    return times
+
+
+def _prepare_steps(
+    batches: Iterable[list[tuple[Path, datetime]]],
+    osm_tmp: Path,
+    work_dir: Path,
+    index: Optional[dependency_index.DependencyIndex],
+    incremental: bool = False,
+    scan_points: bool = False,
+    show_progress: bool = True,
+) -> Iterator[PreparedStep]:
+    """Apply the change files in order and convert the results to GeoPackages.
+
+    Each batch of consecutive change files is merged into one and applied
+    to 'osm_tmp' and the dependency 'index' at once. The resulting OSM file,
+    or just its changed elements when 'incremental', is converted and
+    simplified into a new GeoPackage in 'work_dir'.
+    Nothing here depends on the diffs of earlier steps, so the steps can be
+    prepared ahead, see `pipeline.prefetch`.
+    """
+    for batch in batches:
+        osc_paths = [osc_path for osc_path, _ in batch]
+        osc_date = batch[-1][1]
+        _logger.info(f"Preparing {', '.join(map(str, osc_paths))}")
+        first, last = (p.name.split(".")[0] for p in (osc_paths[0], osc_paths[-1]))
+        seq_nr = first if first == last else f"{first}-{last}"
+        gpkg_path = work_dir / f"{seq_nr}.gpkg"
+
+        element_times = None
+        osc_path = osc_paths[0]
+        if len(batch) > 1:
+            element_times = _element_times(batch)
+            osc_path = work_dir / f"{seq_nr}.osc.gz"
+            merge_changes(osc_paths, osc_path)
+
+        _logger.info("Applygin changes to OSM file")
+        apply_changes(osm_tmp, osc_path)
+
+        if index is not None:
+            with process.timed("update dependency index"):
+                changed = index.changed_elements(osc_path)
+                index.apply_changes(osc_path)
+        else:
+            changed = ChangedElements(
+                nodes={node_id for node_id, _, _ in osc.changed_nodes(osc_path)}
+            )
+        if len(batch) > 1:
+            osc_path.unlink()
+        if scan_points:
+            changed = changed._replace(nodes=None)
+
+        if incremental and not any(changed):
+            yield PreparedStep(osc_paths, osc_date, None, changed, element_times)
+            continue
+        if incremental:
+            _logger.info("Extracting changed elements from OSM file")
+            osm_delta = work_dir / f"{seq_nr}.osm.pbf"
+            extract_elements(osm_tmp, changed, osm_delta)
+            convert_osm_to_gpkg(osm_delta, gpkg_path, OSM_LAYERS, spatial_index=False)
+            osm_delta.unlink()
+        else:
+            _logger.info("Converting OSM to GeoPackage")
+            convert_osm_to_gpkg(osm_tmp, gpkg_path, OSM_LAYERS, spatial_index=False)
+        _logger.info("Simplifying data")
+        with process.timed("simplify"):
+            simplify_data(gpkg_path, show_progress)
+        yield PreparedStep(osc_paths, osc_date, gpkg_path, changed, element_times)
 
 
 def _get_timestamp_from_statefile(state_file: str) -> datetime:
@@ -209,76 +823,217 @@ def _get_osm_date(osm_file_path: pathlib.Path) -> datetime:
     return datetime.strptime(date_str, "%y%m%d")
 
 
-def _initialize_events_from(gpkg: Path):
-    with cast(ogr.DataSource, ogr.Open(str(gpkg))) as ds:
-        for i in range(ds.GetLayerCount()):
-            layer = ds.GetLayer(i)
-            for feature in layer:
-                yield events.creation_event(feature)
+def _initialize_events_from(gpkg_path: Path):
+    """Create the creation events of all features, layer by layer, reading
+    the features as batches of records."""
+    with cast(ogr.DataSource, ogr.Open(str(gpkg_path))) as ds:
+        names = [ds.GetLayer(i).GetName() for i in range(ds.GetLayerCount())]
+    for name in names:
+        for batch in gpkg.records(gpkg_path, name):
+            yield from events.creation_events(batch)
 
 
 def main(argv: Optional[Sequence[str]] = None):
     parser = argparse.ArgumentParser()
     parser.add_argument("osm_file_path", type=Path, metavar="OSM_FILE")
     parser.add_argument("updates_dir_path", type=Path, metavar="UPDATES_DIR")
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes used to search for changes (default: 1)",
+    )
+    parser.add_argument(
+        "--scan-points",
+        action="store_true",
+        help="Compare all points instead of the nodes in the change files",
+    )
+    parser.add_argument(
+        "--dependency-index",
+        type=Path,
+        metavar="INDEX_FILE",
+        help="Build an index of the nodes and members of ways and relations "
+        "in INDEX_FILE, and only compare the lines and polygons affected by "
+        "each change file",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Convert only the elements affected by each change file and "
+        "update them in place, instead of converting the whole OSM file. "
+        "Requires --dependency-index",
+    )
+    parser.add_argument(
+        "--lookahead",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Number of change files to apply and convert in the background "
+        "while the changes of the current one are processed. Each holds a "
+        "GeoPackage on disk. 0 disables the background work (default: 1)",
+    )
+    parser.add_argument(
+        "--batch",
+        type=int,
+        default=1,
+        metavar="K",
+        help="Merge every K consecutive change files and apply them at once, "
+        "e.g. to catch up after downtime. Deletions are still dated by the "
+        "state file of the change file that made them (default: 1)",
+    )
+    parser.add_argument(
+        "--tuning",
+        type=Path,
+        metavar="INI_FILE",
+        help=f"Read settings of GDAL, SQLite and osmium from the [{tuning.SECTION}] "
+        "section of INI_FILE. They override the settings derived from the "
+        "resources of the machine",
+    )
+    parser.add_argument(
+        "--tune",
+        action="append",
+        default=[],
+        metavar="SETTING=VALUE",
+        help="Override a setting of GDAL, SQLite or osmium, e.g. "
+        f"osmium_threads=4. Takes precedence over --tuning. Settings: "
+        f"{', '.join(tuning.Profile._fields)}",
+    )
+    parser.add_argument(
+        "--scratch",
+        choices=[mode.value for mode in scratch.Mode],
+        default=scratch.Mode.AUTO.value,
+        help="Where to keep the working OSM file and the GeoPackages: in memory "
+        "on a tmpfs, on disk, or in memory if they fit under the budget "
+        "(default: auto)",
+    )
+    parser.add_argument(
+        "--scratch-budget",
+        type=int,
+        metavar="MiB",
+        help="Memory the scratch files may use (default: half of the memory)",
+    )
     args = parser.parse_args(argv)
+    if args.batch < 1:
+        parser.error("--batch must be positive")
+    if args.lookahead < 0:
+        parser.error("--lookahead must not be negative")
+    if args.incremental and args.dependency_index is None:
+        parser.error("--incremental requires --dependency-index")
+    if args.incremental and args.scan_points:
+        parser.error("--incremental cannot be combined with --scan-points")
+    settings = tuning.load(args.tuning) if args.tuning is not None else {}
+    for setting in args.tune:
+        name, sep, value = setting.partition("=")
+        if not sep:
+            parser.error(f"--tune expects SETTING=VALUE, got '{setting}'")
+        settings[name.strip()] = value.strip()
+    try:
+        profile = tuning.override(tuning.derive(tuning.detect()), settings)
+    except ValueError as e:
+        parser.error(str(e))
+    tuning.configure(profile)
 
     osm_file_path: Path = args.osm_file_path
     updates_dir_path: Path = args.updates_dir_path
     osm_date = _get_osm_date(osm_file_path)
 
-    osm_tmp, gpkg_tmp_a, gpkg_tmp_b = _get_temp_file_paths()
+    # The base GeoPackage, the one of the current step and up to 'lookahead'
+    # prepared ones, see `pipeline.prefetch`
+    placement = scratch.choose(
+        scratch.estimate(osm_file_path.stat().st_size, args.lookahead + 2),
+        scratch.Mode(args.scratch),
+        None if args.scratch_budget is None else args.scratch_budget * 2**20,
+    )
+    work_dir = scratch.make_dir(placement)
+    osm_tmp = work_dir / "base.osm.pbf"
+    gpkg_tmp_a = work_dir / "base.gpkg"
 
     shutil.copy(osm_file_path, osm_tmp)
 
     _logger.info("Setting up initial data state")
-    convert_osm_to_gpkg(osm_tmp, gpkg_tmp_a)
+    convert_osm_to_gpkg(osm_tmp, gpkg_tmp_a, OSM_LAYERS, spatial_index=False)
     # Simplify the dataset.
-    simplify_data(gpkg_tmp_a)
+    with process.timed("simplify"):
+        simplify_data(gpkg_tmp_a)
+
+    index: Optional[dependency_index.DependencyIndex] = None
+    if args.dependency_index is not None:
+        _logger.info("Building dependency index")
+        with process.timed("build dependency index"):
+            index = dependency_index.build(args.dependency_index, osm_tmp)
 
     _logger.info("Finished setting up initial data state")
 
     try:
         events = _initialize_events_from(gpkg_tmp_a)
         event_store.init(events=events)
-        osc_files = sorted(updates_dir_path.glob("*.osc*"))
-        osc_counter = 1
-        osc_total = len(osc_files)
-
-        for osc_path in osc_files:
+        steps = []
+        for osc_path in sorted(updates_dir_path.glob("*.osc*")):
             # Remove fileextensions from osc_fpath_base
             seq_nr = osc_path.name.split(".")[0]
             state_file = os.path.join(updates_dir_path, f"{seq_nr}.state.txt")
             osc_date = _get_timestamp_from_statefile(state_file)
-            if osc_date.date() <= osm_date.date():
-                # skip this file
-                osc_total -= 1
-                continue
-            _logger.info(f"Processing {osc_path}. File {osc_counter}/{osc_total}...")
-            _logger.info("Applygin changes to OSM file")
-            apply_changes(osm_tmp, osc_path)
+            if osc_date.date() > osm_date.date():
+                steps.append((osc_path, osc_date))
 
-            _logger.info("Converting OSM to GeoPackage")
-            convert_osm_to_gpkg(osm_tmp, gpkg_tmp_b)
-            _logger.info("Simplifying data")
-            simplify_data(gpkg_tmp_b)
-
-            _logger.info("Processing changes...")
-            process_changes(gpkg_tmp_a, gpkg_tmp_b)
-            _logger.info(f"Deleting tmp GPKG file: {gpkg_tmp_a}")
-            gpkg_tmp_a.unlink()
-            tmp = gpkg_tmp_a
-            gpkg_tmp_a = gpkg_tmp_b
-            gpkg_tmp_b = tmp
-            osc_counter += 1
+        batches = [
+            steps[start : start + args.batch]
+            for start in range(0, len(steps), args.batch)
+        ]
+        prepared_steps = pipeline.prefetch(
+            _prepare_steps(
+                batches,
+                osm_tmp,
+                work_dir,
+                index,
+                incremental=args.incremental,
+                scan_points=args.scan_points,
+                show_progress=args.lookahead == 0,
+            ),
+            args.lookahead,
+        )
+        # Closing stops the background work before the index and files go
+        with closing(prepared_steps):
+            for step_counter, step in enumerate(prepared_steps, 1):
+                _logger.info(
+                    f"Processing {', '.join(map(str, step.osc_paths))}. "
+                    f"Step {step_counter}/{len(batches)}..."
+                )
+                if step.gpkg_path is None:
+                    _logger.info("No elements changed")
+                    continue
+
+                _logger.info("Processing changes...")
+                with process.timed("process changes"):
+                    process_changes(
+                        gpkg_tmp_a,
+                        step.gpkg_path,
+                        step.timestamp,
+                        workers=args.workers,
+                        changed=step.changed,
+                        element_times=step.element_times,
+                    )
+                if args.incremental:
+                    _logger.info("Updating changed features")
+                    with process.timed("update features"):
+                        update_features(gpkg_tmp_a, step.gpkg_path, step.changed)
+                    step.gpkg_path.unlink()
+                else:
+                    _logger.info(f"Deleting tmp GPKG file: {gpkg_tmp_a}")
+                    gpkg_tmp_a.unlink()
+                    gpkg_tmp_a = step.gpkg_path
     except:
         raise
     finally:
         _logger.info("Tearing down")
         event_store.teardown()
-        osm_tmp.unlink()
-        gpkg_tmp_a.unlink()
-        gpkg_tmp_b.unlink(missing_ok=True)
+        if index is not None:
+            index.close()
+        # Holds the working files and the prepared steps that were not
+        # processed
+        shutil.rmtree(work_dir, ignore_errors=True)
+        _logger.info(f"Timing per stage:\n{process.report()}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,232 @@
+"""Tune GDAL, SQLite and osmium to the resources of the machine.
+
+`detect` finds the cores, the memory and the temporary file system of the
+machine, and `derive` turns them into a `Profile` of settings. The settings
+can be overridden from the `SECTION` section of an INI file, see `load`, or
+from the command line, see `override`.
+
+`configure` makes a profile the current one. It sets the GDAL configuration
+options of this process, which apply to every datasource opened with OGR.
+External tools get the settings through their environment, see
+`environment`, and SQLite connections opened with `sqlite3` through
+`apply_pragmas`.
+"""
+import configparser
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+from collections.abc import Mapping
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from osgeo import gdal
+
+_logger = logging.getLogger(__name__)
+
+SECTION = "tuning"
+
+_MiB = 2**20
+_GiB = 2**30
+
+# Valid values of the text settings, which end up in SQL
+_CHOICES = {
+    "sqlite_journal": ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"),
+    "sqlite_synchronous": ("OFF", "NORMAL", "FULL", "EXTRA"),
+}
+
+
+class Resources(NamedTuple):
+    """What the machine offers to this process."""
+
+    cores: int
+    memory: Optional[int]  # bytes, None if unknown
+    temp_dir: Path
+    temp_fs: Optional[str]  # file system type, e.g. 'tmpfs', None if unknown
+    temp_free: Optional[int]  # bytes, None if unknown
+
+
+class Profile(NamedTuple):
+    """Settings of the external tools and libraries."""
+
+    # Block cache of GDAL in MiB (GDAL_CACHEMAX)
+    gdal_cachemax: int = 256
+    # Nodes and ways the OSM driver keeps in memory before it uses a
+    # temporary file, in MiB (OSM_MAX_TMPFILE_SIZE)
+    osm_max_tmpfile_size: int = 4000
+    # Features per transaction of ogr2ogr (-gt)
+    group_transaction_size: int = 100_000
+    # Journal mode and synchronous setting of the GeoPackages. They are
+    # scratch files that are recreated after a crash.
+    sqlite_journal: str = "MEMORY"
+    sqlite_synchronous: str = "OFF"
+    # Page cache of every SQLite connection in MiB (OGR_SQLITE_CACHE)
+    sqlite_cache: int = 64
+    # Worker threads of osmium (OSMIUM_POOL_THREADS)
+    osmium_threads: int = 1
+
+
+def _cores() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _memory() -> Optional[int]:
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def _file_system(path: Path) -> Optional[str]:
+    """The type of the file system 'path' is on, from /proc/mounts."""
+    try:
+        with open("/proc/mounts") as f:
+            mounts = [line.split()[1:3] for line in f]
+    except OSError:
+        return None
+    path = path.resolve()
+    matches = [
+        (len(Path(mount_point).parts), fs_type)
+        for mount_point, fs_type in mounts
+        if path == Path(mount_point) or Path(mount_point) in path.parents
+    ]
+    return max(matches)[1] if matches else None
+
+
+def detect(temp_dir: Optional[Path] = None) -> Resources:
+    """Detect the resources of the machine.
+
+    'temp_dir' defaults to the directory of temporary files of `tempfile`.
+    """
+    temp_dir = temp_dir or Path(tempfile.gettempdir())
+    try:
+        temp_free: Optional[int] = shutil.disk_usage(temp_dir).free
+    except OSError:
+        temp_free = None
+    return Resources(_cores(), _memory(), temp_dir, _file_system(temp_dir), temp_free)
+
+
+def _clamp(value: int, low: int, high: int) -> int:
+    return max(low, min(value, high))
+
+
+def derive(resources: Resources) -> Profile:
+    """Derive the settings for the given resources.
+
+    Without known memory the defaults of `Profile` are used for the memory
+    settings.
+    """
+    profile = Profile(osmium_threads=resources.cores)
+    if resources.memory is None:
+        return profile
+    memory = resources.memory // _MiB
+    # On a tmpfs the temporary file of the OSM driver is in memory as well
+    tmpfile_share = 8 if resources.temp_fs == "tmpfs" else 4
+    return profile._replace(
+        gdal_cachemax=_clamp(memory // 16, 64, 2048),
+        osm_max_tmpfile_size=_clamp(memory // tmpfile_share, 100, 16000),
+        group_transaction_size=1_000_000 if resources.memory >= 8 * _GiB else 100_000,
+        sqlite_cache=_clamp(memory // 32, 16, 1024),
+    )
+
+
+def load(path: Path) -> dict[str, str]:
+    """Read the settings in the `SECTION` section of an INI file."""
+    parser = configparser.ConfigParser()
+    if not parser.read(path):
+        raise FileNotFoundError(f"Tuning file not found: {path}")
+    if not parser.has_section(SECTION):
+        return {}
+    return dict(parser.items(SECTION))
+
+
+def override(profile: Profile, settings: Mapping[str, str]) -> Profile:
+    """Replace settings of a profile by the values of 'settings'.
+
+    The values are text, as read from a file or the command line, and are
+    converted to the type of the setting. Raises a ValueError on unknown
+    settings and invalid values.
+    """
+    values = {}
+    for name, text in settings.items():
+        if name not in Profile._fields:
+            raise ValueError(
+                f"Unknown tuning setting '{name}', "
+                f"expected one of {', '.join(Profile._fields)}"
+            )
+        kind = type(getattr(profile, name))
+        try:
+            value = kind(text.replace("_", "") if kind is int else text.upper())
+        except ValueError:
+            raise ValueError(f"Invalid value for tuning setting '{name}': {text}")
+        if name in _CHOICES and value not in _CHOICES[name]:
+            raise ValueError(
+                f"Invalid value for tuning setting '{name}': {text}, "
+                f"expected one of {', '.join(_CHOICES[name])}"
+            )
+        values[name] = value
+    return profile._replace(**values)
+
+
+def gdal_options(profile: Profile) -> dict[str, str]:
+    """The GDAL configuration options of a profile."""
+    return {
+        "GDAL_CACHEMAX": str(profile.gdal_cachemax),
+        "OSM_MAX_TMPFILE_SIZE": str(profile.osm_max_tmpfile_size),
+        "OGR_SQLITE_JOURNAL": profile.sqlite_journal,
+        "OGR_SQLITE_SYNCHRONOUS": profile.sqlite_synchronous,
+        "OGR_SQLITE_CACHE": str(profile.sqlite_cache),
+    }
+
+
+_profile: Optional[Profile] = None
+
+
+def configure(profile: Profile, log: bool = True):
+    """Make 'profile' the current profile and set the GDAL options of it."""
+    global _profile
+    _profile = profile
+    for key, value in gdal_options(profile).items():
+        gdal.SetConfigOption(key, value)
+    if log:
+        _logger.info(
+            "Tuning profile: "
+            + ", ".join(f"{name}={value}" for name, value in profile._asdict().items())
+        )
+
+
+def current() -> Profile:
+    """The current profile. Derived from the detected resources if none is
+    configured yet."""
+    if _profile is None:
+        resources = detect()
+        _logger.debug(f"Detected {resources}")
+        configure(derive(resources))
+    assert _profile is not None
+    return _profile
+
+
+def environment(extra: Optional[Mapping[str, str]] = None) -> dict[str, str]:
+    """The environment of an external tool.
+
+    The environment of this process with the settings of the current profile,
+    updated with 'extra'.
+    """
+    profile = current()
+    env = dict(os.environ)
+    env.update(gdal_options(profile))
+    env["OSMIUM_POOL_THREADS"] = str(profile.osmium_threads)
+    env.update(extra or {})
+    return env
+
+
+def apply_pragmas(con: sqlite3.Connection, readonly: bool = False):
+    """Apply the SQLite settings of the current profile to a connection."""
+    profile = current()
+    con.execute(f"PRAGMA cache_size = -{profile.sqlite_cache * 1024}")
+    if not readonly:
+        con.execute(f"PRAGMA journal_mode = {profile.sqlite_journal}")
+        con.execute(f"PRAGMA synchronous = {profile.sqlite_synchronous}")
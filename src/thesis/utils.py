@@ -1,7 +1,9 @@
 from typing import Iterable
 
+import numpy as np
+
 from thesis import geo, gisevents, properties as props
-from thesis.geodiff import geodiff
+from thesis.geodiff.types import ArrayPatch, LSPatch, PatchCommand
 from thesis.osm import ElementType
 
 
@@ -21,29 +23,42 @@ def to_point_message(point: tuple[float, float]) -> gisevents.Point:
     return gisevents.Point(lat=ilat, lon=ilon)
 
 
-def to_lspatch_message(patch: geodiff.LSPatch) -> gisevents.LineStringPatch:
-    command: list[gisevents.LineStringPatch.Command] = []
-    index: list[int] = []
-    vector: list[gisevents.Point] = []
-
-    to_command = {
-        "insert": gisevents.LineStringPatch.INSERT,
-        "change": gisevents.LineStringPatch.CHANGE,
-        "delete": gisevents.LineStringPatch.DELETE,
-    }
+def to_lspatch_message(patch: LSPatch) -> gisevents.LineStringPatch:
+    """Convert a patch to a gisevents message.
 
-    for patch_cmd in patch:
-        index.append(patch_cmd[0])
-        command.append(to_command[patch_cmd[1]])
-        if patch_cmd[1] == "delete":
-            vector.append(gisevents.Point(lon=0, lat=0))
-        else:
-            vector.append(to_point_message(patch_cmd[2]))
+    An `ArrayPatch`, as returned by `geodiff.diff_linestrings`, is in units of
+    100 nano degrees already and is copied in bulk, as its op codes are the
+    values of `gisevents.LineStringPatch.Command`. The values of a sequence
+    of command tuples are in degrees and are converted first.
+    """
+    if not isinstance(patch, ArrayPatch):
+        patch = ArrayPatch.from_commands(map(_to100nano_command, patch))
 
-    result = gisevents.LineStringPatch(command=command, index=index, vector=vector)
+    result = gisevents.LineStringPatch()
+    result.command.extend(patch.ops.tolist())
+    result.index.extend(patch.index.tolist())
+    # Deletes carry a zero vector
+    result.vector.extend(map(_point, *patch.vectors.T.tolist()))
     return result
 
 
+def _to100nano_command(cmd: PatchCommand) -> PatchCommand:
+    if len(cmd) != 3:
+        return cmd
+    i, op, (lon, lat) = cmd  # type: ignore
+    return (i, op, (geo.to100nano(lon), geo.to100nano(lat)))
+
+
+def _point(lon: int, lat: int) -> gisevents.Point:
+    return gisevents.Point(lon=lon, lat=lat)
+
+
+def from_lspatch_message(msg: gisevents.LineStringPatch) -> ArrayPatch:
+    """Convert a gisevents message to a patch in units of 100 nano degrees."""
+    vectors = np.array([(vec.lon, vec.lat) for vec in msg.vector], dtype=np.int64)
+    return ArrayPatch(msg.command, msg.index, vectors.reshape(-1, 2))
+
+
 def to_prop_patch_msg(patch: Iterable[props.PatchCommand]) -> gisevents.PropPatch:
     deletes = []
     update_keys: list[str] = []
@@ -72,3 +87,14 @@ def to_prop_patch_msg(patch: Iterable[props.PatchCommand]) -> gisevents.PropPatc
             gisevents.PropInsert(key=insert_keys, value=insert_vals)
         )
     return prop_patch
+
+
+def from_prop_patch_msg(msg: gisevents.PropPatch) -> list[props.PatchCommand]:
+    patch: list[props.PatchCommand] = []
+    for key in msg.prop_delete.key:
+        patch.append((props.ChangeType.DELETE, key))
+    for key, val in zip(msg.prop_update.key, msg.prop_update.value):
+        patch.append((props.ChangeType.UPDATE, key, val))
+    for key, val in zip(msg.prop_insert.key, msg.prop_insert.value):
+        patch.append((props.ChangeType.INSERT, key, val))
+    return patch
@@ -0,0 +1,88 @@
+import pytest
+
+from thesis.api import dependency_index
+from thesis.osm import ChangedElements, ElementType
+
+OPL = [
+    "w1 v1 dV c1 t2024-01-01T00:00:00Z i1 utest Thighway=road Nn1,n2,n3",
+    "w2 v1 dV c1 t2024-01-01T00:00:00Z i1 utest T Nn3,n4",
+    "w3 v1 dV c1 t2024-01-01T00:00:00Z i1 utest T Nn5,n6,n5",
+    "r10 v1 dV c1 t2024-01-01T00:00:00Z i1 utest Ttype=multipolygon Mw3@outer",
+    "r11 v1 dV c1 t2024-01-01T00:00:00Z i1 utest T Mn1@,r10@a%20%b",
+    "r12 v1 dV c1 t2024-01-01T00:00:00Z i1 utest T Mr11@",
+    "r13 v1 dV c1 t2024-01-01T00:00:00Z i1 utest T M",
+]
+
+OSC = """<?xml version="1.0" encoding="UTF-8"?>
+<osmChange version="0.6">
+  <modify>
+    <node id="4" version="2" timestamp="2024-01-02T00:00:00Z" lat="1" lon="1"/>
+    <way id="2" version="2" timestamp="2024-01-02T00:00:00Z">
+      <nd ref="4"/><nd ref="7"/>
+    </way>
+    <relation id="10" version="2" timestamp="2024-01-02T00:00:00Z">
+      <member type="way" ref="2" role="outer"/>
+    </relation>
+  </modify>
+  <delete>
+    <way id="1" version="2" timestamp="2024-01-02T00:00:00Z"/>
+    <relation id="11" version="2" timestamp="2024-01-02T00:00:00Z"/>
+  </delete>
+</osmChange>
+"""
+
+
+@pytest.mark.parametrize(
+    "line, want",
+    [
+        (OPL[0], ("w", 1, [1, 2, 3])),
+        (OPL[4] + "\n", ("r", 11, [(ElementType.NODE, 1), (ElementType.RELATION, 10)])),
+        (OPL[6], ("r", 13, [])),
+        ("n5 v1 dV c1 t2024-01-01T00:00:00Z i1 utest T x1 y2", ("n", 5, [])),
+    ],
+)
+def test_parse_opl_line(line, want):
+    assert dependency_index.parse_opl_line(line) == want
+
+
+@pytest.fixture
+def index(tmp_path):
+    with dependency_index.DependencyIndex(tmp_path / "deps.sqlite") as index:
+        index.load(map(dependency_index.parse_opl_line, OPL))
+        yield index
+
+
+@pytest.mark.parametrize(
+    "nodes, ways, relations, want",
+    [
+        ([], [], [], ChangedElements(set(), set(), set())),
+        ([2], [], [], ChangedElements({2}, {1}, set())),
+        ([3], [], [], ChangedElements({3}, {1, 2}, set())),
+        ([5], [], [], ChangedElements({5}, {3}, {10, 11, 12})),
+        ([1], [], [], ChangedElements({1}, {1}, {11, 12})),
+        ([], [], [13], ChangedElements(set(), set(), {13})),
+        ([99], [98], [97], ChangedElements({99}, {98}, {97})),
+    ],
+)
+def test_affected(index, nodes, ways, relations, want):
+    assert index.affected(nodes, ways, relations) == want
+
+
+def test_changed_elements_and_apply_changes(index, tmp_path):
+    osc_path = tmp_path / "change.osc"
+    osc_path.write_text(OSC)
+    # Way 3 was a member of relation 10 before the change
+    assert index.changed_elements(osc_path) == ChangedElements(
+        {4}, {1, 2, 3}, {10, 11, 12}
+    )
+
+    index.apply_changes(osc_path)
+    assert index.ways_of_nodes([1, 2, 3, 4, 7]) == {2}
+    assert index.relations_of(ElementType.RELATION, [10]) == set()
+    assert index.relations_of(ElementType.WAY, [2, 3]) == {10}
+
+
+def test_members_of(index):
+    assert index.members_of([10, 11], ElementType.WAY) == {3}
+    assert index.members_of([10, 11, 12], ElementType.RELATION) == {10, 11}
+    assert index.members_of([13, 99], ElementType.NODE) == set()
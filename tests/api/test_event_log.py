@@ -0,0 +1,136 @@
+import io
+from datetime import datetime, timezone
+
+import pytest
+
+from thesis import gisevents
+from thesis.api import event_log
+
+
+def creation(fid: int, seconds: int) -> gisevents.CreationEvent:
+    event = gisevents.CreationEvent(id=fid, version=1)
+    event.timestamp.seconds = seconds
+    event.point.CopyFrom(gisevents.Point(lon=fid, lat=-fid))
+    return event
+
+
+def deletion(fid: int, seconds: int) -> gisevents.DeletionEvent:
+    event = gisevents.DeletionEvent(id=fid, version=2)
+    event.timestamp.seconds = seconds
+    return event
+
+
+@pytest.fixture
+def events():
+    return [
+        creation(1, 100),
+        creation(2, 100),
+        creation(3, 200),
+        deletion(1, 300),
+        creation(4, 400),
+    ]
+
+
+def write_log(events, segment_size=2, close=True) -> io.BytesIO:
+    buf = io.BytesIO()
+    writer = event_log.EventLogWriter(buf, segment_size=segment_size)
+    for event in events:
+        writer.write(event)
+    if close:
+        writer.close()
+    else:
+        writer.flush()
+    return buf
+
+
+@pytest.mark.parametrize("value", [0, 1, 127, 128, 300, 2**32, 2**63 - 1])
+def test_varint_roundtrip(value):
+    encoded = event_log.encode_varint(value)
+    assert event_log.decode_varint(encoded) == (value, len(encoded))
+
+
+@pytest.mark.parametrize("value", [0, -1, 1, -(2**40), 2**40])
+def test_zigzag_roundtrip(value):
+    assert event_log.unzigzag(event_log.zigzag(value)) == value
+
+
+def test_frame_layout():
+    event = creation(1, 100)
+    payload = event.SerializeToString()
+    frame = event_log.encode_frame(event)
+    assert frame[0] == len(payload)
+    assert frame[1] == event_log.EventType.CREATION
+    assert frame[2:] == payload
+
+
+def test_read_back_all_events(events):
+    reader = event_log.EventLogReader(write_log(events))
+    assert list(reader.events()) == events
+
+
+def test_footer_index(events):
+    reader = event_log.EventLogReader(write_log(events))
+    segments = reader.segments
+    assert [seg.frame_count for seg in segments] == [2, 2, 1]
+    assert [seg.ids for seg in segments] == [(1, 2), (1, 3), (4,)]
+    assert [(seg.min_timestamp, seg.max_timestamp) for seg in segments] == [
+        (100, 100),
+        (200, 300),
+        (400, 400),
+    ]
+
+
+def test_feature_history(events):
+    reader = event_log.EventLogReader(write_log(events))
+    assert list(reader.feature_history(1)) == [events[0], events[3]]
+    assert list(reader.feature_history(5)) == []
+
+
+def test_between(events):
+    reader = event_log.EventLogReader(write_log(events))
+    start = datetime.fromtimestamp(200, timezone.utc)
+    end = datetime.fromtimestamp(400, timezone.utc)
+    assert list(reader.between(start, end)) == [events[2], events[3]]
+
+
+def test_unclosed_log_is_scanned(events):
+    reader = event_log.EventLogReader(write_log(events, close=False))
+    assert list(reader.events()) == events
+    assert list(reader.feature_history(1)) == [events[0], events[3]]
+
+
+def test_buffered_frames_are_flushed_by_count(events):
+    buf = io.BytesIO()
+    writer = event_log.EventLogWriter(buf, flush_count=3)
+    writer.write_all(events[:2])
+    assert buf.getvalue() == b""
+    writer.write(events[2])
+    assert len(buf.getvalue()) == writer.offset
+
+
+def test_buffered_frames_are_flushed_by_size(events):
+    buf = io.BytesIO()
+    frame_size = len(event_log.encode_frame(events[0]))
+    writer = event_log.EventLogWriter(
+        buf, flush_bytes=len(event_log.HEADER) + frame_size
+    )
+    writer.write(events[0])
+    assert len(buf.getvalue()) == writer.offset
+
+
+def test_write_all_consumes_iterable_lazily(events):
+    consumed = []
+
+    def generate():
+        for event in events:
+            consumed.append(event)
+            yield event
+
+    writer = event_log.EventLogWriter(io.BytesIO(), flush_count=1)
+    assert writer.write_all(generate()) == len(events)
+    assert consumed == events
+
+
+def test_not_an_event_log_raises():
+    with pytest.raises(ValueError):
+        event_log.EventLogReader(io.BytesIO(b"not a log"))
@@ -0,0 +1,45 @@
+import pytest
+
+from thesis import gisevents
+from thesis.api import event_log, event_store
+
+
+@pytest.fixture(autouse=True)
+def reset_event_store(request):
+    """Close the event store and drop its configuration after each test."""
+
+    def reset():
+        event_store.teardown()
+        event_store._config = event_store.DEFAULT_CONFIG.copy()
+        event_store._configured = False
+
+    request.addfinalizer(reset)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return tmp_path / "events.pbf"
+
+
+def test_init_streams_initial_events(store):
+    def generate():
+        for fid in range(10):
+            yield gisevents.DeletionEvent(id=fid, version=1)
+
+    event_store.init({"event_store_path": store, "flush_count": 4}, events=generate())
+    event_store.write_events(gisevents.DeletionEvent(id=10, version=2))
+    event_store.teardown()
+
+    with open(store, "rb") as f:
+        got = [event.id for event in event_log.EventLogReader(f).events()]
+    assert got == list(range(11))
+
+
+def test_write_before_init_raises():
+    with pytest.raises(RuntimeError):
+        event_store.write_events(gisevents.DeletionEvent(id=1, version=1))
+
+
+def test_config_does_not_leak_between_tests():
+    assert not event_store._configured
+    assert event_store._config == event_store.DEFAULT_CONFIG
@@ -0,0 +1,130 @@
+import sqlite3
+
+import pytest
+
+from thesis.api import gpkg
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = tmp_path / "test.gpkg"
+    con = sqlite3.connect(path)
+    con.executescript(
+        """
+        CREATE TABLE gpkg_geometry_columns (table_name TEXT, column_name TEXT);
+        INSERT INTO gpkg_geometry_columns VALUES ('points', 'geom');
+        CREATE TABLE points (
+            fid INTEGER PRIMARY KEY, geom BLOB, all_tags TEXT, osm_version INTEGER
+        );
+        INSERT INTO points VALUES (1, x'0101', '{"a":"b"}', 1);
+        INSERT INTO points VALUES (2, x'0101', '{"a":"b"}', 1);
+        INSERT INTO points VALUES (3, x'0102', '{"a":"b"}', 1);
+        INSERT INTO points VALUES (4, x'0101', '{"a":"c"}', 1);
+        INSERT INTO points VALUES (5, x'0101', '{"a":"b"}', 2);
+        INSERT INTO points VALUES (6, NULL, NULL, NULL);
+        """
+    )
+    con.commit()
+    con.close()
+    return path
+
+
+def test_add_fingerprints(path):
+    assert not gpkg.has_fingerprints(path, "points")
+    gpkg.add_fingerprints(path, ["points"])
+    assert gpkg.has_fingerprints(path, "points")
+
+    rows = list(gpkg.fingerprints(path, "points"))
+    assert [fid for fid, _ in rows] == [1, 2, 3, 4, 5, 6]
+    values = [value for _, value in rows]
+    assert values[0] == values[1]
+    assert len(set(values)) == 5
+    assert values[0] == gpkg.fingerprint(b"\x01\x01", '{"a":"b"}', 1)
+
+
+def test_add_fingerprints_twice_refreshes(path):
+    gpkg.add_fingerprints(path, ["points"])
+    with sqlite3.connect(path) as con:
+        con.execute("UPDATE points SET osm_version = 3 WHERE fid = 1")
+    gpkg.add_fingerprints(path, ["points"])
+    (_, got), *_ = gpkg.fingerprints(path, "points")
+    assert got == gpkg.fingerprint(b"\x01\x01", '{"a":"b"}', 3)
+
+
+@pytest.mark.parametrize(
+    "start, stop, want",
+    [(None, None, [1, 2, 3, 4, 5, 6]), (2, None, [2, 3, 4, 5, 6]), (2, 4, [2, 3])],
+)
+def test_fingerprints_range(path, start, stop, want):
+    gpkg.add_fingerprints(path, ["points"])
+    assert [fid for fid, _ in gpkg.fingerprints(path, "points", start, stop)] == want
+
+
+@pytest.mark.parametrize(
+    "a, b",
+    [
+        ((b"ab", "c"), (b"a", "bc")),
+        ((None,), ("",)),
+        ((b"1",), ("1",)),
+        ((1,), (2,)),
+    ],
+)
+def test_fingerprint_distinguishes(a, b):
+    assert gpkg.fingerprint(*a) != gpkg.fingerprint(*b)
+    assert -(2**63) <= gpkg.fingerprint(*a) < 2**63
+
+
+@pytest.mark.parametrize("column_type", ["TEXT", "INTEGER"])
+def test_fids_by_osm_id(tmp_path, column_type):
+    path = tmp_path / "test.gpkg"
+    with sqlite3.connect(path) as con:
+        con.execute(
+            f"CREATE TABLE points (fid INTEGER PRIMARY KEY, osm_id {column_type})"
+        )
+        con.executemany(
+            "INSERT INTO points VALUES (?, ?)",
+            [(fid, str(1000 + fid)) for fid in range(1, 1200)],
+        )
+    gpkg.add_osm_id_index(path, "points")
+    gpkg.add_osm_id_index(path, "points")
+
+    # 1 and 5000 have no feature
+    osm_ids = [2100, 1001, 1005, 1, 1001, 5000] + list(range(1500, 2100))
+    assert gpkg.fids_by_osm_id(path, "points", osm_ids) == [1, 5] + list(
+        range(500, 1101)
+    )
+    assert gpkg.fids_by_osm_id(path, "points", []) == []
+
+
+@pytest.mark.parametrize(
+    "start, stop, fids, want",
+    [
+        (None, None, None, [1, 2, 3, 4, 5, 6]),
+        (2, 4, None, [2, 3]),
+        (None, None, [5, 1, 7, 1], [1, 5]),
+    ],
+)
+def test_records(path, start, stop, fids, want):
+    batches = list(
+        gpkg.records(path, "points", start, stop, fids, ("osm_version",), batch_size=4)
+    )
+    got = [record for batch in batches for record in batch]
+    assert [record.fid for record in got] == want
+    assert all(len(batch) <= 4 for batch in batches)
+    # osm_timestamp is missing from the table
+    assert got[0] == gpkg.FeatureRecord(
+        got[0].fid, 1, None, '{"a":"b"}', b"\x01\x01", (1,)
+    )
+
+
+@pytest.mark.parametrize("flags, envelope_size", [(0b001, 0), (0b011, 32), (0b101, 48)])
+def test_geometry_wkb(flags, envelope_size):
+    wkb = bytes.fromhex("0101000000000000000000f03f0000000000000040")
+    blob = b"GP\x00" + bytes([flags]) + b"\x00" * (4 + envelope_size) + wkb
+    assert gpkg.geometry_wkb(blob) == wkb
+
+
+@pytest.mark.parametrize("blob", [b"XX\x00\x01\x00\x00\x00\x00", b"GP\x00\x0f"])
+def test_geometry_wkb_raises_on_invalid_blob(blob):
+    with pytest.raises(ValueError):
+        gpkg.geometry_wkb(blob)
@@ -0,0 +1,133 @@
+import gzip
+import tracemalloc
+from datetime import datetime, timezone
+
+import pytest
+
+from thesis.api import osc
+from thesis.osm import (
+    ChangeInfo,
+    ChangeType,
+    ElementIdentifier,
+    ElementType,
+    Member,
+)
+
+OSC = b"""<?xml version="1.0" encoding="UTF-8"?>
+<osmChange version="0.6">
+  <create>
+    <node id="1" version="1" timestamp="2024-01-01T00:00:00Z" lat="1" lon="1"/>
+    <way id="10" version="1" timestamp="2024-01-01T00:00:00Z"><nd ref="1"/></way>
+  </create>
+  <modify>
+    <node id="2" version="2" timestamp="2024-01-01T00:01:00Z" lat="1" lon="1"/>
+  </modify>
+  <delete>
+    <node id="3" version="3" timestamp="2024-01-01T00:02:00Z"/>
+    <way id="11" version="2" timestamp="2024-01-01T00:02:00Z"/>
+    <relation id="20" version="2" timestamp="2024-01-01T00:02:00Z">
+      <member type="way" ref="10" role="outer"/>
+      <member type="node" ref="1" role=""/>
+      <member type="relation" ref="21" role="sub"/>
+    </relation>
+  </delete>
+</osmChange>
+"""
+
+
+@pytest.fixture(params=["change.osc", "change.osc.gz"])
+def path(tmp_path, request):
+    path = tmp_path / request.param
+    path.write_bytes(gzip.compress(OSC) if path.suffix == ".gz" else OSC)
+    return path
+
+
+def test_changed_nodes(path):
+    got = list(osc.changed_nodes(path))
+    assert got == [
+        (1, ChangeType.CREATE, datetime(2024, 1, 1, 0, 0, tzinfo=timezone.utc)),
+        (2, ChangeType.MODIFY, datetime(2024, 1, 1, 0, 1, tzinfo=timezone.utc)),
+        (3, ChangeType.DELETE, datetime(2024, 1, 1, 0, 2, tzinfo=timezone.utc)),
+    ]
+
+
+def test_changed_ways(path):
+    assert list(osc.changed_ways(path)) == [
+        (10, ChangeType.CREATE, [1]),
+        (11, ChangeType.DELETE, []),
+    ]
+
+
+def test_changed_relations(path):
+    assert list(osc.changed_relations(path)) == [
+        (
+            20,
+            ChangeType.DELETE,
+            [
+                (ElementType.WAY, 10),
+                (ElementType.NODE, 1),
+                (ElementType.RELATION, 21),
+            ],
+        )
+    ]
+
+
+def test_element_ids(path):
+    assert list(osc.element_ids(path)) == [
+        ElementIdentifier(1, ElementType.NODE),
+        ElementIdentifier(10, ElementType.WAY),
+        ElementIdentifier(2, ElementType.NODE),
+        ElementIdentifier(3, ElementType.NODE),
+        ElementIdentifier(11, ElementType.WAY),
+        ElementIdentifier(20, ElementType.RELATION),
+    ]
+
+
+def test_element_ids_reads_only_ids(tmp_path):
+    path = tmp_path / "change.osc"
+    path.write_text(
+        '<osmChange><modify><node id="1" timestamp="x"/></modify></osmChange>'
+    )
+    assert list(osc.element_ids(path)) == [ElementIdentifier(1, ElementType.NODE)]
+
+
+def test_changes(path):
+    got = list(osc.changes(path))
+    assert [change.info for change in got] == [
+        ChangeInfo(ChangeType.CREATE, ElementIdentifier(1, ElementType.NODE)),
+        ChangeInfo(ChangeType.CREATE, ElementIdentifier(10, ElementType.WAY)),
+        ChangeInfo(ChangeType.MODIFY, ElementIdentifier(2, ElementType.NODE)),
+        ChangeInfo(ChangeType.DELETE, ElementIdentifier(3, ElementType.NODE)),
+        ChangeInfo(ChangeType.DELETE, ElementIdentifier(11, ElementType.WAY)),
+        ChangeInfo(ChangeType.DELETE, ElementIdentifier(20, ElementType.RELATION)),
+    ]
+    assert [change.version for change in got] == [1, 1, 2, 3, 2, 2]
+    assert got[0].coordinates == (1.0, 1.0)
+    assert got[1].node_refs == (1,)
+    assert got[3].coordinates is None
+    assert got[5].members == (
+        Member(ElementType.WAY, 10, "outer"),
+        Member(ElementType.NODE, 1, ""),
+        Member(ElementType.RELATION, 21, "sub"),
+    )
+
+
+def test_changes_memory_does_not_grow_with_file_size(tmp_path):
+    def peak_memory(count):
+        path = tmp_path / f"{count}.osc.gz"
+        nodes = "".join(
+            f'<node id="{i}" version="1" timestamp="2024-01-01T00:00:00Z" '
+            f'lat="1" lon="1"><tag k="name" v="node {i}"/></node>'
+            for i in range(count)
+        )
+        path.write_bytes(
+            gzip.compress(f"<osmChange><modify>{nodes}</modify></osmChange>".encode())
+        )
+        tracemalloc.start()
+        try:
+            assert sum(1 for _ in osc.changes(path)) == count
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    assert peak_memory(50_000) < 2 * peak_memory(1_000)
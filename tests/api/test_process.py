@@ -0,0 +1,70 @@
+import logging
+import sys
+
+import pytest
+
+from thesis.api import process
+
+SCRIPT = """
+import sys
+print("first line")
+sys.stdout.write("0...10...")
+sys.stdout.flush()
+sys.stderr.write("warning\\n")
+data = bytearray(64 * 2**20)
+sys.exit(int(sys.argv[1]))
+"""
+
+
+@pytest.fixture(autouse=True)
+def clear_timings():
+    process.clear_timings()
+    yield
+    process.clear_timings()
+
+
+def test_run_streams_output_and_records_timing(caplog):
+    caplog.set_level(logging.DEBUG, logger=process.__name__)
+    timing = process.run([sys.executable, "-c", SCRIPT, "0"], "script")
+
+    assert timing.stage == "script"
+    assert timing.returncode == 0
+    assert timing.wall_time > 0
+    assert timing.max_rss is None or timing.max_rss >= 64 * 2**20
+    assert process.timings() == [timing]
+
+    logged = [(r.levelno, r.getMessage()) for r in caplog.records]
+    assert (logging.DEBUG, "script: first line") in logged
+    assert (logging.DEBUG, "script: 0...10...") in logged
+    assert (logging.ERROR, "script: warning") in logged
+
+
+def test_run_fails_on_nonzero_exit():
+    with pytest.raises(RuntimeError, match="return code 3"):
+        process.run([sys.executable, "-c", SCRIPT, "3"], "script")
+    assert process.run([sys.executable, "-c", SCRIPT, "3"], check=False) == (
+        process.timings()[-1]
+    )
+    assert [t.returncode for t in process.timings()] == [3, 3]
+
+
+def test_timed():
+    with pytest.raises(ValueError):
+        with process.timed("failing"):
+            raise ValueError
+    assert [t.stage for t in process.timings()] == ["failing"]
+
+
+def test_report():
+    report = process.report(
+        [
+            process.Timing("ogr2ogr", 10.0, 300 * 2**20),
+            process.Timing("simplify", 2.5),
+            process.Timing("ogr2ogr", 20.0, 200 * 2**20),
+        ]
+    )
+    assert report.splitlines() == [
+        "stage     runs  total [s]  max [s]  peak RSS",
+        "ogr2ogr      2       30.0     20.0   300 MiB",
+        "simplify     1        2.5      2.5         -",
+    ]
@@ -0,0 +1,107 @@
+# vim: foldlevel=0
+import random
+
+import numpy as np
+import pytest
+
+from thesis.geodiff import arraydiff, geodiff
+from thesis.geodiff.errors import EditDistanceExceededError
+from thesis.geodiff.patch import apply_patch
+
+from .test_shortest_edit_script import Scenario, idfn, scenarios
+
+
+def array_ses(a, b, trim=False):
+    return arraydiff.shortest_edit_script(
+        arraydiff.to_coordinate_array(a),
+        arraydiff.to_coordinate_array(b),
+        b,
+        trim=trim,
+    )
+
+
+@pytest.mark.parametrize("scenario", scenarios, ids=idfn)
+def test_shortest_edit_script(scenario: Scenario):
+    a, b = scenario[1]
+    want = scenario[2]
+    assert array_ses(a, b) == want
+
+
+@pytest.fixture(params=["scalar", "vector"])
+def search_mode(request, monkeypatch):
+    if request.param == "vector":
+        # Use array operations even for the smallest inputs
+        monkeypatch.setattr(arraydiff, "_MIN_VECTOR_LENGTH", 0)
+        monkeypatch.setattr(arraydiff, "_MIN_VECTOR_DIAGONALS", 1)
+    return request.param
+
+
+def test_matches_list_engine_on_random_sequences(search_mode):
+    rng = random.Random(42)
+    for _ in range(300):
+        alphabet = [(float(i), float(-i)) for i in range(rng.randint(1, 6))]
+        a = [rng.choice(alphabet) for _ in range(rng.randint(0, 40))]
+        b = [rng.choice(alphabet) for _ in range(rng.randint(0, 40))]
+        assert array_ses(a, b) == geodiff._shortest_edit_script(a, b, 0, 0)
+
+
+def test_matches_list_engine_on_long_sequences():
+    rng = random.Random(7)
+    a = [(float(rng.randint(0, 50)), 0.0) for _ in range(1500)]
+    b = list(a)
+    for _ in range(300):
+        b[rng.randrange(len(b))] = (-1.0, -1.0)
+    assert array_ses(a, b) == geodiff._shortest_edit_script(a, b, 0, 0)
+
+
+def test_long_snakes_are_followed():
+    a = [(float(i), 0.0) for i in range(1000)]
+    b = a[:300] + [(-1.0, -1.0)] + a[301:700] + a[701:]
+    assert array_ses(a, b) == geodiff._shortest_edit_script(a, b, 0, 0)
+
+
+def test_to_coordinate_array():
+    got = arraydiff.to_coordinate_array([(1.0, -2.5), (0.12345678, 0.0)])
+    assert got.dtype == np.int64
+    assert got.tolist() == [[10000000, -25000000], [1234567, 0]]
+
+
+def test_trimmed_script_is_shortest(search_mode):
+    rng = random.Random(1)
+    for _ in range(300):
+        alphabet = [(float(i), float(-i)) for i in range(rng.randint(1, 6))]
+        a = [rng.choice(alphabet) for _ in range(rng.randint(0, 40))]
+        b = [rng.choice(alphabet) for _ in range(rng.randint(0, 40))]
+        got = array_ses(a, b, trim=True)
+        assert len(got) == len(geodiff._shortest_edit_script(a, b, 0, 0))
+        assert apply_patch(got, a) == b
+
+
+def test_trim_common_prefix_and_suffix():
+    a = [(float(i), 0.0) for i in range(10)]
+    b = a[:4] + [(-1.0, -1.0)] + a[5:]
+    assert array_ses(a, b, trim=True) == [(4, "delete"), (4, "insert", (-1.0, -1.0))]
+
+
+def test_deep_split_does_not_recurse():
+    # Interleaved runs force many middle snakes with D > 1
+    a = [(float(i % 7), float(i % 5)) for i in range(4000)]
+    b = [(float(i % 5), float(i % 7)) for i in range(4000)]
+    got = array_ses(a, b, trim=True)
+    assert apply_patch(got, a) == b
+
+
+@pytest.mark.parametrize("trim", [True, False])
+def test_max_d_cutoff(search_mode, trim):
+    rng = random.Random(2)
+    for _ in range(200):
+        alphabet = [(float(i), float(-i)) for i in range(rng.randint(1, 6))]
+        a = [rng.choice(alphabet) for _ in range(rng.randint(0, 40))]
+        b = [rng.choice(alphabet) for _ in range(rng.randint(0, 40))]
+        d = len(array_ses(a, b))
+        args = (arraydiff.to_coordinate_array(a), arraydiff.to_coordinate_array(b))
+        got = arraydiff.shortest_edit_script(*args, b, trim=trim, max_d=d)
+        assert len(got) == d
+        if d > 0:
+            with pytest.raises(EditDistanceExceededError):
+                arraydiff.shortest_edit_script(*args, b, trim=trim, max_d=d - 1)
@@ -1,4 +1,7 @@
+import numpy as np
 import pytest
+import shapely
+from osgeo import ogr
 
 from thesis import geodiff
 from thesis.geodiff.geodiff import _validate_diff_input
@@ -22,7 +25,7 @@ def test_diff_point():
 def test_diff_linestring():
     a = "LINESTRING (1 1, 2 2)"
     b = "LINESTRING (1 1, 3 3)"
-    want = [(1, "change", (1, 1))]
+    want = [(1, "change", (10000000, 10000000))]
     got = geodiff.diff_linestrings(a, b)
     assert got == want
 
@@ -30,6 +33,86 @@ def test_diff_linestring():
 def test_diff_rings():
     a = "LINEARRING (0 0, 0 1, 1 1, 1 0, 0 0)"
     b = "LINEARRING (0 0, 1 1, 2 1, 0 0)"
-    want = [(1, "delete"), (3, "change", (1, 1))]
+    want = [(1, "delete"), (3, "change", (10000000, 10000000))]
     got = geodiff.diff_linestrings(a, b)
     assert got == want
+
+
+@pytest.mark.parametrize(
+    "b, empty",
+    [
+        ("LINESTRING (1.00000009 1, 2 2)", True),
+        ("LINESTRING (0.99999999 1, 2 2)", False),
+        ("LINESTRING (1 1, 2 2, 2 2)", False),
+    ],
+)
+def test_diff_linestrings_compares_quantized_vertices(b, empty):
+    a = "LINESTRING (1 1, 2 2)"
+    assert (len(geodiff.diff_linestrings(a, b)) == 0) == empty
+
+
+@pytest.mark.parametrize(
+    "a, b, max_d",
+    [
+        ("LINESTRING (1 1, 2 2)", "LINESTRING (1 1, 3 3)", 2),
+        ("LINESTRING (1 1, 2 2, 3 3)", "LINESTRING (1 1, 2 2, 3 3, 4 4)", 1),
+        ("LINESTRING (0 0, 1 1, 2 2, 3 3)", "LINESTRING (0 0, 2 2, 3 3)", 1),
+    ],
+)
+def test_diff_linestrings_within_max_d(a, b, max_d):
+    assert geodiff.diff_linestrings(a, b, max_d=max_d) == geodiff.diff_linestrings(
+        a, b
+    )
+
+
+@pytest.mark.parametrize(
+    "a, b, max_d",
+    [
+        ("LINESTRING (1 1, 2 2)", "LINESTRING (1 1, 3 3)", 1),
+        ("LINESTRING (1 1, 2 2)", "LINESTRING (1 1, 2 2, 3 3, 4 4)", 1),
+        ("LINESTRING (0 0, 1 1, 2 2)", "LINESTRING (5 5, 6 6, 7 7)", 5),
+    ],
+)
+def test_diff_linestrings_exceeding_max_d_should_raise(a, b, max_d):
+    with pytest.raises(geodiff.EditDistanceExceededError):
+        geodiff.diff_linestrings(a, b, max_d=max_d)
+
+
+INPUT_FORMS = {
+    "wkt": lambda wkt: wkt,
+    "wkb": lambda wkt: shapely.to_wkb(shapely.from_wkt(wkt)),
+    "shapely": shapely.from_wkt,
+    "ogr": ogr.CreateGeometryFromWkt,
+    "array": lambda wkt: shapely.get_coordinates(shapely.from_wkt(wkt)),
+}
+
+
+@pytest.mark.parametrize("form", INPUT_FORMS)
+def test_diff_linestrings_input_forms(form):
+    convert = INPUT_FORMS[form]
+    a = "LINEARRING (0 0, 0 1, 1 1, 1 0, 0 0)"
+    b = "LINEARRING (0 0, 1 1, 2 1, 0 0)"
+    want = [(1, "delete"), (3, "change", (10000000, 10000000))]
+    assert geodiff.diff_linestrings(convert(a), convert(b)) == want
+
+
+@pytest.mark.parametrize("form", INPUT_FORMS)
+def test_diff_points_input_forms(form):
+    convert = INPUT_FORMS[form]
+    assert geodiff.diff_points(convert("POINT (1 1)"), convert("POINT (3 3)")) == (
+        2,
+        2,
+    )
+
+
+def test_diff_linestrings_ignores_z():
+    a = ogr.CreateGeometryFromWkt("LINESTRING Z (1 1 5, 2 2 5)")
+    b = np.array([[1.0, 1.0], [3.0, 3.0]])
+    assert geodiff.diff_linestrings(a, b) == [(1, "change", (10000000, 10000000))]
+
+
+def test_diff_linestrings_mismatching_ogr_types_should_raise():
+    a = ogr.CreateGeometryFromWkt("LINESTRING (1 1, 2 2)")
+    b = ogr.CreateGeometryFromWkt("POINT (1 1)")
+    with pytest.raises(geodiff.GeometryTypeMismatchError):
+        geodiff.diff_linestrings(a, b)
@@ -1,7 +1,15 @@
+import numpy as np
 import pytest
 
 from thesis.geodiff.patch import apply_patch
-from thesis.geodiff.types import LSPatch, PointSequence
+from thesis.geodiff.types import (
+    CHANGE,
+    DELETE,
+    INSERT,
+    ArrayPatch,
+    LSPatch,
+    PointSequence,
+)
 
 Scenario = tuple[
     str, tuple[PointSequence, LSPatch, PointSequence]
@@ -48,3 +56,39 @@ def test_applyPatch(scenario, request):
     points, patch, want = scenario[1]
     got = apply_patch(patch, points)
     assert want == got
+
+
+@pytest.mark.parametrize("scenario", testdata, ids=idfn)
+def test_apply_array_patch(scenario):
+    points, patch, want = scenario[1]
+    assert apply_patch(ArrayPatch.from_commands(patch), points) == want
+
+
+@pytest.mark.parametrize("scenario", testdata, ids=idfn)
+def test_array_patch_from_commands(scenario):
+    _, patch, _ = scenario[1]
+    got = ArrayPatch.from_commands(patch)
+    assert got == patch
+    assert list(got) == list(patch)
+    assert len(got) == len(patch)
+
+
+def test_array_patch_items():
+    patch = ArrayPatch.from_commands(
+        [(0, "delete"), (1, "change", (15, -1)), (1, "insert", (4.0, 4.0))]
+    )
+    assert patch.ops.tolist() == [DELETE, CHANGE, INSERT]
+    assert patch.index.tolist() == [0, 1, 1]
+    assert patch.vectors.dtype == np.int64
+    assert patch[1] == (1, "change", (15, -1))
+    assert patch[-1] == (1, "insert", (4, 4))
+    assert patch[1:] == [(1, "change", (15, -1)), (1, "insert", (4, 4))]
+    assert patch != [(0, "delete")]
+
+
+@pytest.mark.parametrize(
+    "command", [(0, "foo"), (0,), "delete", (0, "change", (1.5, 1))]
+)
+def test_array_patch_from_invalid_commands_raises(command):
+    with pytest.raises(ValueError):
+        ArrayPatch.from_commands([command])
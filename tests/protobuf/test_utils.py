@@ -1,6 +1,7 @@
+import numpy as np
 from osgeo import ogr
 
-from thesis import gisevents
+from thesis import geo, gisevents
 from thesis.gisevents import utils
 
 
@@ -37,3 +38,16 @@ def test_toPolygonMessage():
     # Assert
     assert got.lon == want.lon
     assert got.lat == want.lat
+
+
+def test_to_linestring_message_matches_scalar_conversion():
+    rng = np.random.default_rng(0)
+    coords = rng.uniform(-90, 90, size=(1000, 2))
+    linestring = ogr.Geometry(ogr.wkbLineString)
+    for x, y in coords:
+        linestring.AddPoint_2D(x, y)
+
+    got = utils.to_linestring_message(linestring)
+
+    assert list(got.lon) == geo.delta_encode([geo.to100nano(x) for x, _ in coords])
+    assert list(got.lat) == geo.delta_encode([geo.to100nano(y) for _, y in coords])
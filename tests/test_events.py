@@ -7,6 +7,7 @@ from osgeo.ogr import Feature
 
 import thesis.events as events
 from thesis import geodiff
+from thesis.api import gpkg
 
 # Fixtures are defined in conftest.py
 
@@ -153,6 +154,39 @@ class TestCreateModEvent:
         assert got.HasField("polygon_patch")
         assert got.HasField("prop_patch")
 
+    @pytest.mark.parametrize(
+        "wkt_v1, wkt_v2, field",
+        [
+            (
+                "LINESTRING (0 0, 1 1, 2 2)",
+                "LINESTRING (5 5, 6 6, 7 7)",
+                "linestring",
+            ),
+            (
+                "POLYGON ((0 0, 0 1, 1 1, 0 0))",
+                "POLYGON ((5 5, 5 6, 6 6, 5 5))",
+                "polygon",
+            ),
+        ],
+    )
+    def test_redrawn_geometry_is_replaced(
+        self, base_featdef: ogr.FeatureDefn, wkt_v1, wkt_v2, field
+    ):
+        features = []
+        for version, wkt in enumerate([wkt_v1, wkt_v2], start=1):
+            feat = ogr.Feature(base_featdef)
+            feat.SetFID(3)
+            feat.SetField("osm_timestamp", f"2023-01-0{version}T00:00:00")
+            feat.SetField("osm_version", version)
+            feat.SetField("all_tags", json.dumps({"key1": "value1"}))
+            feat.SetGeometry(ogr.CreateGeometryFromWkt(wkt))
+            features.append(feat)
+
+        got = events.modification_event(*features)
+        assert got.WhichOneof("patch") == field
+        assert list(getattr(got, field).lon)[0] == 5 * 10**7
+        assert not got.HasField("prop_patch")
+
 
 class TestCreateDeletionEvent:
     def test_deletion_event_point(self, point_feature_1: Feature):
@@ -160,3 +194,62 @@ class TestCreateDeletionEvent:
         assert got.id == 1
         assert got.HasField("timestamp")
         assert got.version == 1
+
+
+def _record(feature: Feature) -> gpkg.FeatureRecord:
+    """The record of a feature as read from a GeoPackage."""
+    year, month, day, hour, minute, second, _ = feature.GetFieldAsDateTime(
+        "osm_timestamp"
+    )
+    timestamp = datetime(year, month, day, hour, minute, int(second))
+    header = b"GP\x00\x01" + (4326).to_bytes(4, "little")
+    return gpkg.FeatureRecord(
+        feature.GetFID(),
+        feature.GetField("osm_version"),
+        timestamp.isoformat(),
+        feature.GetField("all_tags"),
+        header + bytes(feature.GetGeometryRef().ExportToIsoWkb()),
+    )
+
+
+class TestRecordBatches:
+    @pytest.mark.parametrize(
+        "fixtures",
+        [
+            ["point_feature_1", "linestring_feature_0", "polygon_feature_1"],
+            ["linestring_feature_2_v1", "point_feature_2"],
+        ],
+    )
+    def test_creation_events_match_creation_event(self, request, fixtures):
+        features = [request.getfixturevalue(name) for name in fixtures]
+        got = events.creation_events([_record(feat) for feat in features])
+        assert got == [events.creation_event(feat) for feat in features]
+
+    @pytest.mark.parametrize(
+        "prev, curr",
+        [
+            ("point_feature_1", "point_feature_1_v2"),
+            ("linestring_feature_2_v1", "linestring_feature_2_v2"),
+            ("polygon_feature_1", "polygon_feature_1_v2"),
+            ("polygon_feature_1", "polygon_feature_1"),
+        ],
+    )
+    def test_modification_events_match_modification_event(self, request, prev, curr):
+        prev_feat = request.getfixturevalue(prev)
+        curr_feat = request.getfixturevalue(curr)
+        got = events.modification_events([(_record(prev_feat), _record(curr_feat))])
+        assert got == [events.modification_event(prev_feat, curr_feat)]
+
+    def test_deletion_events(self, point_feature_1, timestamp_1):
+        (got,) = events.deletion_events([_record(point_feature_1)], [timestamp_1])
+        assert got.id == 1
+        assert got.version == 1
+        assert got.timestamp.ToDatetime() == timestamp_1
+
+    @pytest.mark.parametrize("version", [None, 0])
+    def test_invalid_version_raises(self, point_feature_1, timestamp_1, version):
+        record = _record(point_feature_1)._replace(version=version)
+        with pytest.raises(ValueError):
+            events.modification_events([(_record(point_feature_1), record)])
+        with pytest.raises(ValueError):
+            events.deletion_events([record], [timestamp_1])
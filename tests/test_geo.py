@@ -1,3 +1,4 @@
+import numpy as np
 import pytest
 from osgeo import ogr
 
@@ -19,3 +20,36 @@ def test_delta_encode():
     got = geo.delta_encode(seq)
     # Assert
     assert got == want
+
+
+@pytest.mark.parametrize(
+    "degrees", [[0.0, 1.0, -1.0], [10.12345678, -63.98765432, 179.9999999], []]
+)
+def test_to100nano_array(degrees):
+    got = geo.to100nano_array(degrees)
+    assert got.dtype == np.int64
+    assert got.tolist() == [geo.to100nano(degree) for degree in degrees]
+
+
+@pytest.mark.parametrize("seq", [[1, 2, 4, 7, 11], [5], [-3, 3, -3]])
+def test_delta_encode_array(seq):
+    assert geo.delta_encode_array(np.array(seq)).tolist() == geo.delta_encode(seq)
+
+
+def test_delta_encode_array_per_column():
+    coords = np.array([[1, 10], [2, 8], [4, 8]])
+    assert geo.delta_encode_array(coords).tolist() == [[1, 10], [1, -2], [2, 0]]
+
+
+@pytest.mark.parametrize(
+    "wkt, want",
+    [
+        ("LINESTRING (0 1, 2 3)", [[0, 1], [2, 3]]),
+        ("LINESTRING Z (0 1 5, 2 3 5)", [[0, 1], [2, 3]]),
+        ("LINESTRING EMPTY", np.empty((0, 2))),
+    ],
+)
+def test_get_coordinates(wkt, want):
+    got = geo.get_coordinates(ogr.CreateGeometryFromWkt(wkt))
+    assert got.shape == np.shape(want)
+    assert got.tolist() == np.asarray(want).tolist()
@@ -0,0 +1,65 @@
+import threading
+import time
+
+import pytest
+
+from thesis import pipeline
+
+
+@pytest.mark.parametrize("depth", [0, 1, 3])
+def test_prefetch_keeps_order(depth):
+    assert list(pipeline.prefetch(range(10), depth)) == list(range(10))
+
+
+def test_prefetch_without_depth_runs_in_calling_thread():
+    def items():
+        yield threading.current_thread()
+
+    assert list(pipeline.prefetch(items(), 0)) == [threading.current_thread()]
+
+
+@pytest.mark.parametrize("depth", [1, 2])
+def test_prefetch_is_bounded_by_depth(depth):
+    produced = []
+
+    def items():
+        for i in range(10):
+            produced.append(i)
+            yield i
+
+    prefetched = pipeline.prefetch(items(), depth)
+    assert next(prefetched) == 0
+    # Give the producer time to run ahead. Counting the item in hand of the
+    # consumer, no more than depth + 1 items exist at a time.
+    time.sleep(0.2)
+    assert len(produced) == depth + 1
+    assert list(prefetched) == list(range(1, 10))
+
+
+def test_prefetch_raises_errors_of_producer():
+    def items():
+        yield 1
+        raise ValueError("producer failed")
+
+    prefetched = pipeline.prefetch(items(), 2)
+    assert next(prefetched) == 1
+    with pytest.raises(ValueError, match="producer failed"):
+        next(prefetched)
+
+
+def test_closing_stops_producer():
+    closed = threading.Event()
+
+    def items():
+        try:
+            i = 0
+            while True:
+                yield i
+                i += 1
+        finally:
+            closed.set()
+
+    prefetched = pipeline.prefetch(items(), 1)
+    assert next(prefetched) == 0
+    prefetched.close()
+    assert closed.is_set()
@@ -1,3 +1,7 @@
+import json
+
+import pytest
+
 from thesis import properties as props
 
 
@@ -8,3 +12,36 @@ def test_diff_props():
     assert (props.ChangeType.UPDATE, "key1", "value2") in got
     assert (props.ChangeType.DELETE, "key3") in got
     assert (props.ChangeType.INSERT, "key4", "value4") in got
+
+
+def test_apply_props_patch():
+    props_v1 = {"key1": "value", "key2": "value2", "key3": "value3"}
+    props_v2 = {"key1": "value2", "key2": "value2", "key4": "value4"}
+    assert props.apply(props_v1, props.diff(props_v1, props_v2)) == props_v2
+
+
+@pytest.mark.parametrize(
+    "all_tags",
+    [
+        '{"building": "yes", "name": "A\\tB"}',
+        '{"layer": 1, "height": 2.5}',
+        '{"name": "line\nbreak"}',
+        "{}",
+    ],
+)
+def test_parse_matches_json_loads(all_tags):
+    want = json.loads(all_tags, strict=False, object_hook=props.as_string)
+    assert props.parse(all_tags) == want
+
+
+@pytest.mark.parametrize("all_tags", [None, ""])
+def test_parse_empty(all_tags):
+    assert props.parse(all_tags) == {}
+
+
+def test_parse_interns_keys_and_values():
+    a = props.parse('{"highway": "residential", "x": "1"}')
+    b = props.parse('{"highway": "residential", "y": "2"}')
+    (key_a, val_a), (key_b, val_b) = next(iter(a.items())), next(iter(b.items()))
+    assert key_a is key_b
+    assert val_a is val_b
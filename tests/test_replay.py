@@ -0,0 +1,187 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+import shapely
+
+from thesis import events, geo, gisevents, replay, utils, properties as props
+from thesis.api import event_log, gpkg
+
+
+def at(seconds: int) -> datetime:
+    return datetime.fromtimestamp(seconds, timezone.utc)
+
+
+def create_point(fid, seconds, lon, lat, tags):
+    event = gisevents.CreationEvent(
+        id=fid, version=1, point=gisevents.Point(lon=lon, lat=lat)
+    )
+    event.timestamp.seconds = seconds
+    event.properties.key.extend(tags.keys())
+    event.properties.value.extend(tags.values())
+    return event
+
+
+def create_linestring(fid, seconds, lon, lat):
+    event = gisevents.CreationEvent(
+        id=fid, version=1, linestring=gisevents.LineString(lon=lon, lat=lat)
+    )
+    event.timestamp.seconds = seconds
+    return event
+
+
+def modify(fid, seconds, version, **fields):
+    event = gisevents.ModificationEvent(id=fid, version=version, **fields)
+    event.timestamp.seconds = seconds
+    return event
+
+
+def delete(fid, seconds):
+    event = gisevents.DeletionEvent(id=fid, version=9)
+    event.timestamp.seconds = seconds
+    return event
+
+
+@pytest.fixture
+def log_path(tmp_path):
+    events = [
+        create_point(1, 100, 10, 20, {"amenity": "bench"}),
+        # (0, 0), (10, 0), (10, 10)
+        create_linestring(2, 100, [0, 10, 0], [0, 0, 10]),
+        modify(
+            1,
+            200,
+            2,
+            point_patch=gisevents.Point(lon=1, lat=-1),
+            prop_patch=utils.to_prop_patch_msg(
+                [(props.ChangeType.UPDATE, "amenity", "table")]
+            ),
+        ),
+        modify(
+            2,
+            300,
+            2,
+            linestring_patch=utils.to_lspatch_message([(1, "delete")]),
+        ),
+        delete(1, 400),
+    ]
+    path = tmp_path / "events.pbf"
+    with open(path, "wb") as f:
+        writer = event_log.EventLogWriter(f, segment_size=1)
+        writer.write_all(events)
+        writer.close()
+    return path
+
+
+def test_replay_full_log(log_path):
+    state = replay.replay(log_path)
+    assert list(state) == [2]
+    assert state[2].coords == ((0, 0), (10, 10))
+    assert state[2].version == 2
+
+
+@pytest.mark.parametrize(
+    "seconds, want",
+    [
+        (50, {}),
+        (100, {1: ((10, 20),), 2: ((0, 0), (10, 0), (10, 10))}),
+        (250, {1: ((11, 19),), 2: ((0, 0), (10, 0), (10, 10))}),
+        (300, {1: ((11, 19),), 2: ((0, 0), (10, 10))}),
+        (400, {2: ((0, 0), (10, 10))}),
+    ],
+)
+def test_state_at(log_path, seconds, want):
+    state = replay.Replayer(log_path).state_at(at(seconds))
+    assert {fid: feature.coords for fid, feature in state.items()} == want
+
+
+def test_properties_are_patched(log_path):
+    replayer = replay.Replayer(log_path)
+    assert replayer.state_at(at(100))[1].properties == {"amenity": "bench"}
+    assert replayer.state_at(at(200))[1].properties == {"amenity": "table"}
+
+
+def test_checkpoints_are_reused(log_path):
+    replayer = replay.Replayer(log_path, checkpoint_interval=2)
+    full = replayer.state_at()
+    assert [c.segment for c in replayer.checkpoints] == [0, 2, 4, 5]
+    assert replayer.state_at(at(250)) == replay.replay(log_path, at(250))
+    assert replayer.state_at() == full
+
+
+def test_checkpoints_are_bounded(log_path):
+    replayer = replay.Replayer(log_path, checkpoint_interval=1, max_checkpoints=3)
+    full = replayer.state_at()
+    assert [c.segment for c in replayer.checkpoints] == [0, 4, 5]
+    assert replayer.state_at(at(250)) == replay.replay(log_path, at(250))
+    assert replayer.state_at() == full
+
+
+def test_replacement_geometry(tmp_path):
+    events = [
+        create_linestring(1, 100, [0, 10, 0], [0, 0, 10]),
+        modify(1, 200, 2, linestring=gisevents.LineString(lon=[5, 1], lat=[5, 1])),
+    ]
+    path = tmp_path / "events.pbf"
+    with open(path, "wb") as f:
+        writer = event_log.EventLogWriter(f)
+        writer.write_all(events)
+        writer.close()
+    assert replay.replay(path)[1].coords == ((5, 5), (6, 6))
+
+
+def record(fid, version, geometry):
+    header = b"GP\x00\x01" + (4326).to_bytes(4, "little")
+    blob = header + shapely.to_wkb(geometry)
+    return gpkg.FeatureRecord(fid, version, at(100 * version).isoformat(), None, blob)
+
+
+def random_versions(rng, n):
+    """Coordinates of 'n' versions of a feature, each edited from the last."""
+    coords = rng.uniform(-1, 1, (8, 2)) + (8.5, 47.3)
+    versions = [coords]
+    for _ in range(n - 1):
+        keep = rng.random(len(coords)) < 0.9
+        keep[:3] = True
+        coords = coords[keep]
+        moved = rng.random(coords.shape) < 0.3
+        coords = coords + moved * rng.uniform(-1e-4, 1e-4, coords.shape)
+        i = rng.integers(0, len(coords) + 1)
+        coords = np.insert(coords, i, rng.uniform(8, 9, 2), axis=0)
+        versions.append(coords)
+    return versions
+
+
+def test_replay_modification_events_of_real_geometries(tmp_path):
+    rng = np.random.default_rng(3)
+    n = 20
+    curves = {
+        1: [coords[:1] for coords in random_versions(rng, n)],
+        2: random_versions(rng, n),
+        3: [np.vstack([coords, coords[:1]]) for coords in random_versions(rng, n)],
+    }
+    geometries = {
+        1: shapely.points([coords[0] for coords in curves[1]]),
+        2: [shapely.linestrings(coords) for coords in curves[2]],
+        3: [shapely.polygons(coords) for coords in curves[3]],
+    }
+    records = [
+        [record(fid, version, geometry) for version, geometry in enumerate(geoms, 1)]
+        for fid, geoms in geometries.items()
+    ]
+    log = events.creation_events([versions[0] for versions in records])
+    for v in range(1, n):
+        log += events.modification_events(
+            [(versions[v - 1], versions[v]) for versions in records]
+        )
+    path = tmp_path / "events.pbf"
+    with open(path, "wb") as f:
+        writer = event_log.EventLogWriter(f)
+        writer.write_all(log)
+        writer.close()
+
+    replayer = replay.Replayer(path)
+    for v in range(n):
+        state = replayer.state_at(at(100 * (v + 1)))
+        for fid, versions in curves.items():
+            assert state[fid].coords == tuple(geo.coordsTo100nano(versions[v]))
@@ -0,0 +1,60 @@
+import pytest
+
+from thesis import scratch, tuning
+
+GiB = 2**30
+
+
+@pytest.fixture
+def machine(monkeypatch, tmp_path):
+    """A machine with 8 GiB of memory and a tmpfs with 2 GiB free."""
+    memory_dir = tmp_path / "shm"
+    memory_dir.mkdir()
+    monkeypatch.setattr(scratch, "_memory_dir", lambda: memory_dir)
+    monkeypatch.setattr(scratch, "_disk_dir", lambda: tmp_path)
+    monkeypatch.setattr(
+        tuning,
+        "detect",
+        lambda temp_dir=None: tuning.Resources(4, 8 * GiB, temp_dir, "tmpfs", 2 * GiB),
+    )
+    return memory_dir
+
+
+def test_estimate():
+    assert scratch.estimate(100, 3) == 200 + 3 * scratch.GPKG_PER_PBF * 100
+
+
+@pytest.mark.parametrize(
+    "required, budget, want_in_memory",
+    [
+        (GiB, None, True),
+        (3 * GiB, None, False),  # more than the free space of the tmpfs
+        (GiB, GiB // 2, False),
+        (GiB, 4 * GiB, True),
+    ],
+)
+def test_choose(machine, tmp_path, required, budget, want_in_memory):
+    got = scratch.choose(required, scratch.Mode.AUTO, budget)
+    assert got.in_memory == want_in_memory
+    assert got.directory == (machine if want_in_memory else tmp_path)
+
+
+def test_choose_memory_ignores_budget(machine):
+    assert scratch.choose(3 * GiB, scratch.Mode.MEMORY).directory == machine
+
+
+def test_choose_disk(machine, tmp_path):
+    got = scratch.choose(1, scratch.Mode.DISK)
+    assert got == scratch.Placement(tmp_path, False, 1, None)
+
+
+def test_choose_memory_without_tmpfs_raises(monkeypatch):
+    monkeypatch.setattr(scratch, "_memory_dir", lambda: None)
+    with pytest.raises(RuntimeError):
+        scratch.choose(1, scratch.Mode.MEMORY)
+
+
+def test_make_dir(tmp_path):
+    directory = scratch.make_dir(scratch.Placement(tmp_path, False, 0, None))
+    assert directory.is_dir()
+    assert directory.parent == tmp_path
@@ -0,0 +1,271 @@
+import json
+from datetime import datetime
+
+import pytest
+from osgeo import ogr
+
+from thesis import thesis
+from thesis.api import event_log, event_store, gpkg
+from thesis.osm import ChangedElements, ElementIdentifier, ElementType
+
+
+def write_gpkg(path, features):
+    driver = ogr.GetDriverByName("GPKG")
+    ds = driver.CreateDataSource(str(path))
+    layer = ds.CreateLayer("points", geom_type=ogr.wkbPoint)
+    layer.CreateField(ogr.FieldDefn("osm_timestamp", ogr.OFTDateTime))
+    layer.CreateField(ogr.FieldDefn("osm_version", ogr.OFTInteger))
+    layer.CreateField(ogr.FieldDefn("all_tags", ogr.OFTString))
+    layer.CreateField(ogr.FieldDefn("osm_id", ogr.OFTString))
+    for fid, version, x in features:
+        feat = ogr.Feature(layer.GetLayerDefn())
+        feat.SetFID(fid)
+        feat.SetField("osm_timestamp", f"2023-01-0{version}T00:00:00")
+        feat.SetField("osm_version", version)
+        feat.SetField("all_tags", json.dumps({"key": str(version)}))
+        feat.SetField("osm_id", str(10 * fid))
+        feat.SetGeometry(ogr.CreateGeometryFromWkt(f"POINT ({x} 1)"))
+        layer.CreateFeature(feat)
+    ds = None
+
+
+@pytest.fixture
+def gpkgs(tmp_path):
+    gpkg_a = tmp_path / "a.gpkg"
+    gpkg_b = tmp_path / "b.gpkg"
+    # FIDs 1-19 exist in both, 20-29 are deleted and 30-39 are created.
+    write_gpkg(gpkg_a, [(fid, 1, 0) for fid in range(1, 30)])
+    write_gpkg(
+        gpkg_b,
+        [(fid, 1 + fid % 2, fid % 2) for fid in range(1, 20)]
+        + [(fid, 1, 0) for fid in range(30, 40)],
+    )
+    return gpkg_a, gpkg_b
+
+
+@pytest.mark.parametrize(
+    "a, b, want",
+    [
+        ([], [], []),
+        ([1, 2], [], [(1, None), (2, None)]),
+        ([], [1, 2], [(None, 1), (None, 2)]),
+        ([1, 3, 4], [1, 2, 4], [(1, 1), (None, 2), (3, None), (4, 4)]),
+        ([1, 2], [3, 4], [(1, None), (2, None), (None, 3), (None, 4)]),
+        ([5], [1, 5, 9], [(None, 1), (5, 5), (None, 9)]),
+    ],
+)
+def test_merge_join(a, b, want):
+    assert list(thesis._merge_join(a, b, key=lambda x: x)) == want
+
+
+def test_shards(gpkgs):
+    assert thesis._shards(*gpkgs, shard_size=None) == [thesis.Shard(0)]
+    assert thesis._shards(*gpkgs, shard_size=8) == [
+        thesis.Shard(0, None, 9),
+        thesis.Shard(0, 9, 17),
+        thesis.Shard(0, 17, 25),
+        thesis.Shard(0, 25, None),
+    ]
+
+
+def process(gpkgs, path, workers):
+    event_store.init({"event_store_path": path})
+    try:
+        thesis.process_changes(
+            *gpkgs, datetime(2023, 1, 3), workers=workers, shard_size=4
+        )
+    finally:
+        event_store.teardown()
+    return path.read_bytes()
+
+
+def test_parallel_run_matches_sequential_run(gpkgs, tmp_path):
+    sequential = process(gpkgs, tmp_path / "sequential.pbf", workers=1)
+    parallel = process(gpkgs, tmp_path / "parallel.pbf", workers=3)
+    assert parallel == sequential
+
+    with open(tmp_path / "parallel.pbf", "rb") as f:
+        ids = [event.id for event in event_log.EventLogReader(f).events()]
+    assert set(range(1, 20, 2)) <= set(ids[:-20])
+    assert ids[-20:] == list(range(20, 40))
+
+
+def test_shard_events_in_one_pass(gpkgs):
+    with ogr.Open(str(gpkgs[0])) as ds_a, ogr.Open(str(gpkgs[1])) as ds_b:
+        got = thesis._shard_events(ds_a, ds_b, thesis.Shard(0, 19, 32), None)
+    assert [(type(e).__name__, e.id) for e in got] == [
+        ("ModificationEvent", 19),
+        *[("DeletionEvent", fid) for fid in range(20, 30)],
+        *[("CreationEvent", fid) for fid in range(30, 32)],
+    ]
+
+
+def test_fingerprints_skip_unchanged_features(gpkgs):
+    with ogr.Open(str(gpkgs[0])) as ds_a, ogr.Open(str(gpkgs[1])) as ds_b:
+        merge_joined = thesis._shard_events(ds_a, ds_b, thesis.Shard(0), None)
+    for path in gpkgs:
+        gpkg.add_fingerprints(path, ["points"])
+    with ogr.Open(str(gpkgs[0])) as ds_a, ogr.Open(str(gpkgs[1])) as ds_b:
+        assert thesis._fingerprinted(ds_a, ds_b, thesis.Shard(0))
+        got = thesis._shard_events(ds_a, ds_b, thesis.Shard(0), None)
+
+    # Only the odd FIDs of the common ones have changed
+    assert [e.id for e in got] == list(range(1, 20, 2)) + list(range(20, 40))
+    assert [e for e in merge_joined if e.id in {e.id for e in got}] == got
+
+
+@pytest.mark.parametrize("shard_size", [None, 2])
+def test_points_of_changed_nodes(gpkgs, shard_size):
+    for path in gpkgs:
+        gpkg.add_fingerprints(path, ["points"])
+        gpkg.add_osm_id_index(path, "points")
+    # Nodes of FIDs 2 (unchanged), 3 (modified), 25 (deleted), 35 (created)
+    # and a node without a point
+    changed = ChangedElements(nodes={20, 30, 250, 350, 12345})
+    shards = thesis._shards(*gpkgs, shard_size, changed)
+    assert [fid for shard in shards for fid in shard.fids] == [2, 3, 25, 35]
+
+    with ogr.Open(str(gpkgs[0])) as ds_a, ogr.Open(str(gpkgs[1])) as ds_b:
+        got = [
+            (type(e).__name__, e.id)
+            for shard in shards
+            for e in thesis._shard_events(ds_a, ds_b, shard, None)
+        ]
+    assert got == [
+        ("ModificationEvent", 3),
+        ("DeletionEvent", 25),
+        ("CreationEvent", 35),
+    ]
+
+
+def test_update_features(gpkgs):
+    gpkg_a, gpkg_b = gpkgs
+    for path in gpkgs:
+        gpkg.add_fingerprints(path, ["points"])
+        gpkg.add_osm_id_index(path, "points")
+    # Nodes of FIDs 3 (modified), 5 (modified but not listed), 25 (deleted)
+    # and 35 (created)
+    thesis.update_features(gpkg_a, gpkg_b, ChangedElements(nodes={30, 250, 350}))
+
+    with ogr.Open(str(gpkg_a)) as ds_a, ogr.Open(str(gpkg_b)) as ds_b:
+        layer_a = ds_a.GetLayer(0)
+        layer_b = ds_b.GetLayer(0)
+        fids = [feature.GetFID() for feature in layer_a]
+        assert fids == list(range(1, 25)) + list(range(26, 30)) + [35]
+        for fid in (3, 35):
+            assert layer_a.GetFeature(fid).GetField(
+                "osm_version"
+            ) == layer_b.GetFeature(fid).GetField("osm_version")
+            assert layer_a.GetFeature(fid).GetField(
+                gpkg.FINGERPRINT_COLUMN
+            ) == layer_b.GetFeature(fid).GetField(gpkg.FINGERPRINT_COLUMN)
+        assert layer_a.GetFeature(5).GetField("osm_version") == 1
+
+
+def test_element_times(tmp_path):
+    def write_osc(name, ids):
+        nodes = "".join(f'<node id="{i}" version="1" timestamp="x"/>' for i in ids)
+        path = tmp_path / name
+        path.write_text(f"<osmChange><modify>{nodes}</modify></osmChange>")
+        return path
+
+    first, second = datetime(2023, 1, 1), datetime(2023, 1, 2)
+    times = thesis._element_times(
+        [(write_osc("1.osc", [1, 2]), first), (write_osc("2.osc", [2, 3]), second)]
+    )
+    assert times == {
+        ElementIdentifier(1, ElementType.NODE): first,
+        ElementIdentifier(2, ElementType.NODE): second,
+        ElementIdentifier(3, ElementType.NODE): second,
+    }
+
+
+def test_deletion_times(gpkgs):
+    default, deleted = datetime(2023, 1, 3), datetime(2023, 1, 2)
+    times = thesis.DeletionTimes(
+        default, {ElementIdentifier(250, ElementType.NODE): deleted}
+    )
+    with ogr.Open(str(gpkgs[0])) as ds_a, ogr.Open(str(gpkgs[1])) as ds_b:
+        got = thesis._shard_events(ds_a, ds_b, thesis.Shard(0, 20, 30), times)
+    assert [e.timestamp.ToDatetime() for e in got] == (
+        [default] * 5 + [deleted] + [default] * 4
+    )
+
+
+def write_osm_gpkg(path, multipolygons, spatial_index=True):
+    ds = ogr.GetDriverByName("GPKG").CreateDataSource(str(path))
+    for name, geom_type in [
+        ("points", ogr.wkbPoint),
+        ("lines", ogr.wkbLineString),
+        ("multilinestrings", ogr.wkbMultiLineString),
+        ("multipolygons", ogr.wkbMultiPolygon),
+    ]:
+        layer = ds.CreateLayer(
+            name,
+            geom_type=geom_type,
+            options=[] if spatial_index else ["SPATIAL_INDEX=NO"],
+        )
+        layer.CreateField(ogr.FieldDefn("osm_id", ogr.OFTString))
+        layer.CreateField(ogr.FieldDefn("osm_way_id", ogr.OFTString))
+        layer.CreateField(ogr.FieldDefn("all_tags", ogr.OFTString))
+    layer = ds.GetLayerByName("multipolygons")
+    for fid, wkt in multipolygons:
+        feat = ogr.Feature(layer.GetLayerDefn())
+        feat.SetFID(fid)
+        feat.SetField("osm_way_id", str(10 * fid))
+        feat.SetField("all_tags", json.dumps({"building": "yes"}))
+        feat.SetGeometry(ogr.CreateGeometryFromWkt(wkt))
+        layer.CreateFeature(feat)
+    ds = None
+
+
+@pytest.mark.parametrize("sql", [True, False])
+@pytest.mark.parametrize("spatial_index", [True, False])
+def test_simplify_data(tmp_path, monkeypatch, sql, spatial_index):
+    path = tmp_path / "osm.gpkg"
+    square = "((0 0, 0 1, 1 1, 1 0, 0 0))"
+    hole = "((0 0, 0 4, 4 4, 4 0, 0 0), (1 1, 1 2, 2 2, 2 1, 1 1))"
+    write_osm_gpkg(
+        path,
+        [
+            (1, f"MULTIPOLYGON ({square})"),
+            (2, f"MULTIPOLYGON ({square}, ((5 5, 5 6, 6 6, 5 5)))"),
+            (3, f"MULTIPOLYGON ({hole})"),
+            (4, f"MULTIPOLYGON ({square})"),
+        ],
+        spatial_index,
+    )
+    if sql:
+        with ogr.Open(str(path)) as ds:
+            if not thesis._sql_conversion_supported(ds):
+                pytest.skip("GDAL is built without SpatiaLite")
+    else:
+        monkeypatch.setattr(thesis, "_sql_conversion_supported", lambda ds: False)
+    monkeypatch.setattr(thesis, "CONVERSION_TRANSACTION_SIZE", 1)
+    sql_calls = []
+    convert_polygons_sql = thesis._convert_polygons_sql
+
+    def record_sql_call(*args):
+        sql_calls.append(args)
+        convert_polygons_sql(*args)
+
+    monkeypatch.setattr(thesis, "_convert_polygons_sql", record_sql_call)
+
+    thesis.simplify_data(path, show_progress=False)
+
+    assert len(sql_calls) == (1 if sql else 0)
+
+    with ogr.Open(str(path)) as ds:
+        names = {ds.GetLayer(i).GetName() for i in range(ds.GetLayerCount())}
+        assert names == {"points", "lines", "polygons"}
+        layer = ds.GetLayerByName("polygons")
+        assert layer.TestCapability(ogr.OLCFastSpatialFilter) == spatial_index
+        got = {
+            feat.GetFID(): (feat.GetField("osm_way_id"), feat.GetGeometryRef().Clone())
+            for feat in layer
+        }
+    assert sorted(got) == [1, 4]
+    way_id, polygon = got[4]
+    assert way_id == "40"
+    assert polygon.GetGeometryType() == ogr.wkbPolygon
+    assert polygon.Equals(ogr.CreateGeometryFromWkt(f"POLYGON {square}"))
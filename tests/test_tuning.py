@@ -0,0 +1,85 @@
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from thesis import tuning
+
+GiB = 2**30
+
+
+@pytest.fixture(autouse=True)
+def profile(monkeypatch):
+    monkeypatch.setattr(tuning, "_profile", None)
+
+
+def resources(memory, temp_fs="ext4"):
+    return tuning.Resources(8, memory, Path("/tmp"), temp_fs, None)
+
+
+def test_derive_without_memory_uses_defaults():
+    assert tuning.derive(resources(None)) == tuning.Profile(osmium_threads=8)
+
+
+@pytest.mark.parametrize(
+    "memory, temp_fs, want_tmpfile_size, want_gt",
+    [
+        (16 * GiB, "ext4", 4096, 1_000_000),
+        (16 * GiB, "tmpfs", 2048, 1_000_000),
+        (2 * GiB, "ext4", 512, 100_000),
+        (256 * GiB, "ext4", 16000, 1_000_000),
+    ],
+)
+def test_derive(memory, temp_fs, want_tmpfile_size, want_gt):
+    got = tuning.derive(resources(memory, temp_fs))
+    assert got.osm_max_tmpfile_size == want_tmpfile_size
+    assert got.group_transaction_size == want_gt
+    assert got.osmium_threads == 8
+
+
+def test_override():
+    got = tuning.override(
+        tuning.Profile(),
+        {
+            "osmium_threads": "4",
+            "group_transaction_size": "50_000",
+            "sqlite_journal": "wal",
+        },
+    )
+    assert got == tuning.Profile(
+        osmium_threads=4, group_transaction_size=50_000, sqlite_journal="WAL"
+    )
+
+
+@pytest.mark.parametrize(
+    "settings",
+    [{"unknown": "1"}, {"osmium_threads": "many"}, {"sqlite_journal": "x; DROP"}],
+)
+def test_override_raises_on_invalid_settings(settings):
+    with pytest.raises(ValueError):
+        tuning.override(tuning.Profile(), settings)
+
+
+def test_load(tmp_path):
+    path = tmp_path / "tuning.ini"
+    path.write_text("[tuning]\nosmium_threads = 2\n\n[other]\nkey = value\n")
+    assert tuning.load(path) == {"osmium_threads": "2"}
+
+
+def test_environment_keeps_environment_of_process(monkeypatch):
+    monkeypatch.setenv("THESIS_TEST_VARIABLE", "kept")
+    tuning.configure(tuning.Profile(osmium_threads=3), log=False)
+    env = tuning.environment({"OSM_CONFIG_FILE": "osmconf.ini"})
+    assert env["THESIS_TEST_VARIABLE"] == "kept"
+    assert env["OSMIUM_POOL_THREADS"] == "3"
+    assert env["OSM_MAX_TMPFILE_SIZE"] == "4000"
+    assert env["OSM_CONFIG_FILE"] == "osmconf.ini"
+
+
+def test_apply_pragmas(tmp_path):
+    tuning.configure(tuning.Profile(sqlite_journal="OFF"), log=False)
+    con = sqlite3.connect(tmp_path / "test.db")
+    tuning.apply_pragmas(con)
+    assert con.execute("PRAGMA journal_mode").fetchone() == ("off",)
+    assert con.execute("PRAGMA synchronous").fetchone() == (0,)
+    con.close()
@@ -1,7 +1,9 @@
 from collections.abc import Iterable
+import numpy as np
 import pytest
 from thesis.osm import ElementType
-from thesis import properties, utils, geodiff, gisevents
+from thesis import properties, utils, geodiff, geo, gisevents
+from thesis.geodiff.patch import apply_patch
 
 
 def test_get_search_layers_for_node():
@@ -47,6 +49,28 @@ def test_to_linestringpatch_message():
     ]
 
 
+def test_from_linestringpatch_message():
+    msg = gisevents.LineStringPatch(
+        command=[
+            gisevents.LineStringPatch.CHANGE,
+            gisevents.LineStringPatch.DELETE,
+            gisevents.LineStringPatch.INSERT,
+        ],
+        index=[0, 2, 6],
+        vector=[
+            gisevents.Point(lon=20000000, lat=20000000),
+            gisevents.Point(lon=0, lat=0),
+            gisevents.Point(lon=-1, lat=3),
+        ],
+    )
+    got = utils.from_lspatch_message(msg)
+    assert got == [
+        (0, "change", (20000000, 20000000)),
+        (2, "delete"),
+        (6, "insert", (-1, 3)),
+    ]
+
+
 def test_to_prop_patch_message():
     patch: Iterable[properties.PatchCommand] = [
         (properties.ChangeType.UPDATE, "key1", "value2"),
@@ -60,3 +84,35 @@ def test_to_prop_patch_message():
     assert got.prop_update.value == ["value2"]
     assert got.prop_insert.key == ["key4"]
     assert got.prop_insert.value == ["value4"]
+
+
+def test_from_prop_patch_message():
+    patch: list[properties.PatchCommand] = [
+        (properties.ChangeType.DELETE, "key3"),
+        (properties.ChangeType.UPDATE, "key1", "value2"),
+        (properties.ChangeType.INSERT, "key4", "value4"),
+    ]
+    got = utils.from_prop_patch_msg(utils.to_prop_patch_msg(patch))
+    assert got == patch
+
+
+def test_lspatch_message_round_trip():
+    patch = geodiff.ArrayPatch.from_commands(
+        [(0, "change", (20000000, -20000000)), (2, "delete"), (6, "insert", (5, 3))]
+    )
+    got = utils.from_lspatch_message(utils.to_lspatch_message(patch))
+    assert got == patch
+    assert got.vectors.dtype == np.int64
+
+
+def test_linestring_diff_survives_message_round_trip():
+    rng = np.random.default_rng(1)
+    for _ in range(500):
+        a = rng.uniform(-1, 1, (rng.integers(1, 20), 2)) + (8.5, 47.3)
+        b = a[rng.random(len(a)) < 0.8]
+        b = b + rng.uniform(-1e-4, 1e-4, b.shape) * (rng.random(b.shape) < 0.3)
+        b = np.insert(b, rng.integers(0, len(b) + 1), rng.uniform(8, 9, 2), axis=0)
+        msg = utils.to_lspatch_message(geodiff.diff_linestrings(a, b))
+        patch = utils.from_lspatch_message(msg)
+        got = apply_patch(patch, geo.coordsTo100nano(a))
+        assert got == geo.coordsTo100nano(b)